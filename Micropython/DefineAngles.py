@@ -1,5 +1,7 @@
 from machine import Pin, PWM
 import time
+from calibration import ServoProfile, PROFILE_FILE, POSITION_NAMES, pulse_duty
+from logger import log
 
 # --- Configuration ---
 SERVO_PIN = 16  # The GPIO pin your servo is connected to.
@@ -19,6 +21,11 @@ except Exception as e:
             pass
     servo_pwm = DummyPWM()
 
+# Angles are converted with the saved calibration, if there is one, so they
+# match what the weather scripts will do.
+profile = ServoProfile.load(PROFILE_FILE)
+log.flush()
+
 def servo(degrees):
     """
     Moves the servo to a specific angle in degrees.
@@ -28,25 +35,72 @@ def servo(degrees):
         print("Angle must be between 0 and 180.")
         return
 
-    # Standard pulse widths for servos are ~500us (0 deg) to ~2500us (180 deg)
-    # The total cycle for 50Hz is 20,000us.
-    # duty_u16 wants a value from 0 to 65535.
-    min_pulse_us = 500
-    max_pulse_us = 2500
+    # Look up the duty cycle for the angle in the calibration table
+    # (500us at 0 deg to 2500us at 180 deg until a calibration is saved)
+    # and send the signal to the servo
+    servo_pwm.duty_u16(profile.duty(degrees))
+    print(f"Servo moved to {degrees}°")
+
+def jog(prompt, value, step, low, high, write):
+    """
+    Nudge a value until it looks right: '+'/'-' step it, '++'/'--' step it
+    ten times as far, a number sets it and Enter confirms. Returns None on 'quit'.
+    """
+    while True:
+        write(value)
+        command = input(f"{prompt} [{value}] (+, -, ++, --, number, Enter, quit): ").strip().lower()
+        if command == "":
+            return value
+        if command == "quit":
+            return None
+        if command in ("+", "-", "++", "--"):
+            value += step * (10 if len(command) == 2 else 1) * (1 if command[0] == "+" else -1)
+        else:
+            try:
+                value = int(command)
+            except ValueError:
+                print("Invalid input.")
+                continue
+        value = max(low, min(high, value))
+
+def calibrate():
+    """
+    Batch calibration: measure the pulse width at 0, 90 and 180 degrees,
+    sweep with the fitted curve, then set the dial position for each
+    weather condition and save the profile for the weather scripts.
+    """
+    global profile
+    print("Step 1: move the pointer to each angle by adjusting the pulse width (us).")
+    points = []
+    for angle in (0, 90, 180):
+        guess = (profile.duty(angle) * 20000 + 32767) // 65535
+        pulse = jog(f"Pulse for {angle}°", guess, 10, 300, 2800,
+                    lambda us: servo_pwm.duty_u16(pulse_duty(us)))
+        if pulse is None:
+            return
+        points.append((angle, pulse))
+    profile = ServoProfile(points, profile.positions)
 
-    # Calculate the pulse width in microseconds for the given angle
-    pulse_us = min_pulse_us + (max_pulse_us - min_pulse_us) * (degrees / 180)
+    print("Sweeping with the fitted curve...")
+    for angle in list(range(0, 181, 2)) + list(range(180, -1, -2)):
+        servo_pwm.duty_u16(profile.duty(angle))
+        time.sleep(0.02)
 
-    # Convert the pulse width to a 16-bit duty cycle value
-    duty = int((pulse_us / 20000) * 65535)
+    print("Step 2: move the dial to each condition and press Enter to confirm.")
+    for name in POSITION_NAMES:
+        angle = jog(name, profile.position(name, 90), 1, 0, 180,
+                    lambda a: servo_pwm.duty_u16(profile.duty(a)))
+        if angle is None:
+            return
+        profile.positions[name] = angle
 
-    # Send the signal to the servo
-    servo_pwm.duty_u16(duty)
-    print(f"Servo moved to {degrees}°")
+    profile.save(PROFILE_FILE)
+    print(f"Calibration saved to {PROFILE_FILE}.")
 
 # --- Main Loop ---
 print("--- Servo Calibration Tool ---")
 print("Enter an angle between 0 and 180 to move the servo.")
+print("Type 'calibrate' to calibrate every weather position and save them.")
 print("Type 'exit' to quit.")
 print("-" * 30)
 
@@ -66,6 +120,10 @@ while True:
             print("Exiting calibration tool.")
             break
 
+        if command == 'calibrate':
+            calibrate()
+            continue
+
         # Convert the input string to an integer
         angle = int(command)
 
@@ -2,38 +2,73 @@
 # This version ensures the light animation runs continuously and uses a
 # simplified day/night brightness control for the main LEDs.
 
-import time
 import network
-import urequests
 from machine import Pin, PWM
 from neopixel import Neopixel
 import random
-from time import sleep, ticks_ms, ticks_diff
-import ujson
 import math
+from jsonstream import Projection
+from httpclient import AsyncHttpClient, aproject, afill
+import wxrecord
+from obscache import ObservationCache
+from frames import FrameEngine, Effect, Fade, ONE, SHIFT, GAMMA, level, scale
+from array import array
+from particles import ParticlePool
+from motion import ServoMotion
+from calibration import ServoProfile, PROFILE_FILE
+from telemetry import Telemetry, CONNECT, FETCH
+from logger import log
+from power import PowerSaver, load_wake, load_display, save_display
+from quota import Quota
+from supervisor import Link, Backoff, CircuitBreaker, JoinCache
+from providers import ProviderPool, OpenMeteo, OpenWeatherMap
+from dualcore import RenderCore
+from conditions import (WMO, precipitation, Action, ConditionTable, WMO_CLEAR, WMO_PARTLY_CLOUDY, WMO_OVERCAST, WMO_FOG,
+                        WMO_SLIGHT_RAIN, WMO_RAIN_SHOWERS, WMO_MODERATE_RAIN, WMO_HEAVY_RAIN,
+                        WMO_THUNDERSTORM, WMO_SNOW)
+try:
+    import asyncio
+except ImportError:
+    import uasyncio as asyncio
 
 # --- Network Configuration ---
 ssid = '' #Your Wifi ID
 password = '' #Password
 lat = "52.629238" #Your Latitude
 lon = "0.492520" #Your Longitude 
+api_url = "https://api.open-meteo.com/v1/forecast"
+# With several houses on one network, run proxy/weatherproxy.py and use
+# api_url = "http://<proxy address>:8080/v1/forecast"
+# Set proxy_records too to have the proxy send packed binary records instead of JSON.
+proxy_records = False
+
+# --- Second Provider ---
+# With an OpenWeatherMap key, weather checks use OpenWeatherMap as well:
+# each goes to whichever has been answering faster, and the other is asked
+# too if no answer has come within hedge_after ms, or straight away if the
+# first fails (see providers.py). hedge_after = None only switches on failure.
+owm_api_key = ""
+owm_api_url = "https://api.openweathermap.org/data/3.0/onecall"
+hedge_after = 2500
 
 # --- Calibrated Servo Positions ---
+# Positions saved by DefineAngles.py's calibrate mode win over these defaults.
 servospeed = 0.02
 servo_offset = 0
-CLEAR_DAY_POS = 22
-CLEAR_NIGHT_POS = 2
-PARTLY_CLOUDY_POS = 45
-PARTLY_CLOUDY_NIGHT_POS = 165
-OVERCAST_POS = 60
-FOG_POS = 113
-SLIGHT_RAIN_POS = 90
-RAIN_SHOWERS_POS = 75
-MODERATE_RAIN_POS = 95
-HEAVY_RAIN_POS = 95
-RAIN_NIGHT_POS = 150
-THUNDERSTORM_POS = 50
-SNOW_POS = 135
+servo_profile = ServoProfile.load(PROFILE_FILE, ((0, 500), (180, 2500)))
+CLEAR_DAY_POS = servo_profile.position("clear_day", 22)
+CLEAR_NIGHT_POS = servo_profile.position("clear_night", 2)
+PARTLY_CLOUDY_POS = servo_profile.position("partly_cloudy_day", 45)
+PARTLY_CLOUDY_NIGHT_POS = servo_profile.position("partly_cloudy_night", 165)
+OVERCAST_POS = servo_profile.position("overcast", 60)
+FOG_POS = servo_profile.position("fog", 113)
+SLIGHT_RAIN_POS = servo_profile.position("slight_rain", 90)
+RAIN_SHOWERS_POS = servo_profile.position("rain_showers", 75)
+MODERATE_RAIN_POS = servo_profile.position("moderate_rain", 95)
+HEAVY_RAIN_POS = servo_profile.position("heavy_rain", 95)
+RAIN_NIGHT_POS = servo_profile.position("rain_night", 150)
+THUNDERSTORM_POS = servo_profile.position("thunderstorm", 50)
+SNOW_POS = servo_profile.position("snow", 135)
 
 # --- Neopixel LED Configuration ---
 numpix = 10
@@ -43,16 +78,71 @@ toplight = Neopixel(1, 1, 17, "RGBW")
 NIGHT_LIGHT_COLOR = (50, 50, 50, 50)
 day_brightness = 0.2 # Set from 0.0 (off) to 1.0 (full brightness)
 night_brightness = 0.2 # Set from 0.0 (off) to 1.0 (full brightness)
-current_led_color = (0, 0, 0)
+frame_rate = 50 # LED frames per second
+telemetry_enabled = True # Time each stage; call telemetry.dump() to see the figures
 
 # --- Weather Update Configuration ---
 weather_check_interval = 5 * 60 * 1000
-last_weather_check = 0
+cache_file = "weather_cache.bin"
+
+# --- API Quota ---
+# The most API calls in any 24 hours, retries included and kept across
+# reboots (Open-Meteo's free tier allows 10,000). Checks come every
+# min_check_interval while the weather is changing or wet, and back off
+# towards max_check_interval through long settled spells.
+daily_call_budget = 10000
+min_check_interval = 2 * 60 * 1000
+max_check_interval = 30 * 60 * 1000
+quota_file = "quota.bin"
+
+# --- Connection Supervision ---
+# Wi-Fi is rejoined in the background, retrying after about 2 s, 4 s, 8 s...
+# up to wifi_retry_max. After api_failure_threshold failed calls in a row
+# the API is left alone for api_pause, doubling while it stays down.
+wifi_retry_max = 5 * 60 * 1000
+api_failure_threshold = 3
+api_pause = 60 * 1000
+# The access point and address of the last good join are kept in wifi_file
+# and tried first, skipping the scan and DHCP. Set static_ip to
+# ("ip", "netmask", "gateway", "dns") to never wait on DHCP.
+static_ip = None
+wifi_file = "wifi.bin"
+
+# --- Power Saving ---
+# None keeps the board awake. With "light" or "deep", while the display is
+# static (clear, cloudy, fog) Wi-Fi is switched off between fetches and the
+# board sleeps (see power.py). "deep" saves the most; on waking the display
+# is put back as it was, without the servo sweep.
+power_mode = None
+
+# --- Forecast Mode ---
+# Fetch the hourly forecast every few hours and step through it locally,
+# instead of calling current_weather every weather_check_interval.
+forecast_mode = False
+forecast_refresh_interval = 3 * 60 * 60 # Seconds between forecast fetches
+forecast_file = "forecast.bin"
+
+# --- Start-up ---
+# The last condition, dial position and lights are put back from flash at
+# power-up. Set calibration_sweep to sweep the servo through its positions
+# first instead, e.g. after moving the dial by hand.
+calibration_sweep = False
+
+# --- Dual Core ---
+# Run the LEDs and servo on the Pico's second core, so nothing the network
+# or the parser does can hold up a frame (see dualcore.py). The board
+# can't sleep with core 1 running, so power_mode is ignored then.
+dual_core = False
+
+clock_synced = False
+restored = False # Display put back from flash or after a deep sleep
 conditions = 0
 night = False
 last_condition = None
 first_weather_check = True
 last_night_status = None
+shown_weather = None
+weather_changed = asyncio.Event() # Set when the condition or day/night changes
 
 # --- WMO Weather Code Mapping ---
 WMO_CODES = {
@@ -62,245 +152,505 @@ WMO_CODES = {
     71: "Slight snow", 73: "Snow", 75: "Heavy snow", 85: "Slight snow showers", 86: "Heavy snow showers"
 }
 
-clear_sky = [0, 1]
-partly_cloudy = [2]
-overcast = [3]
-fog = [45, 48]
-slight_rain = [51, 61]
-rain_showers = [80, 81, 82]
-moderate_rain = [53, 63]
-heavy_rain = [55, 65]
-thunderstorm = [95, 96, 99]
-snow = [71, 73, 75, 85, 86]
-all_rain_types = slight_rain + rain_showers + moderate_rain + heavy_rain
+# --- Log Messages ---
+# Logged by number and printed in batches by log.flush() when the loops are idle.
+M_CLOCK_FAILED = log.message("Failed to set clock: %s")
+M_FORECAST_FETCH = log.message("Getting Forecast from Open-Meteo...")
+M_FORECAST_UPDATED = log.message("Forecast updated: %s hours ahead.")
+M_FORECAST_FAILED = log.message("Failed to fetch forecast: %s")
+M_FORECAST_HOUR = log.message("Forecast for this hour: %s (%s), Night: %s")
+M_FETCH = log.message("Getting Data from Open-Meteo...")
+M_UNCHANGED = log.message("Weather unchanged since last fetch.")
+M_UPDATED = log.message("Weather updated: %s (%s), Night: %s")
+M_FETCH_FAILED = log.message("Failed to fetch weather data: %s")
+M_SHOWING_CACHED = log.message("Showing cached weather.")
+M_QUOTA = log.message("API budget used up; next call in %s s.")
+M_PAUSED = log.message("Weather API paused; next call in %s s.")
+M_OFFLINE = log.message("Wi-Fi still down; rejoining in the background.")
+M_CHANGED = log.message("New change detected. Updating display.")
+M_SAME = log.message("Condition unchanged. Continuing animation.")
+M_NOT_HANDLED = log.message("Condition '%s' (%s) not handled.")
+M_SWEEP = log.message("Performing initial servo sweep...")
+M_RESTORED = log.message("Restored cached weather from flash.")
+M_RESTORED_FORECAST = log.message("Restored forecast from flash.")
+M_STOPPED = log.message("Program stopped by user.")
+M_WOKE = log.message("Woke from deep sleep; display restored.")
+M_RESTORED_DISPLAY = log.message("Restored display from flash.")
+M_DUAL_CORE = log.message("LEDs and servo running on core 1.")
 
 # --- Hardware Initialization ---
 servoPin = PWM(Pin(16))
 servoPin.freq(50)
 wlan = network.WLAN(network.STA_IF)
 wlan.active(True)
-current_servo_position = 90
+http = AsyncHttpClient()
+parse_buf = bytearray(256)
+weather_providers = [OpenMeteo(lat, lon, api_url, http=http, records=proxy_records)]
+if owm_api_key:
+    weather_providers.append(OpenWeatherMap(lat, lon, owm_api_key, owm_api_url))
+providers = ProviderPool(weather_providers, WMO, hedge_after)
+cache = ObservationCache(cache_file, weather_check_interval)
+if forecast_mode:
+    from forecast import Forecast
+    forecast = Forecast(forecast_file, forecast_refresh_interval)
+else:
+    forecast = None # Not loaded unless it is used
+quota = Quota(quota_file, daily_call_budget, weather_check_interval, min_check_interval, max_check_interval)
+link = Link(wlan, ssid, password, backoff=Backoff(max_ms=wifi_retry_max), join_cache=JoinCache(wifi_file, static_ip))
+breaker = CircuitBreaker(api_failure_threshold, api_pause)
+telemetry = Telemetry(enabled=telemetry_enabled)
+engine = FrameEngine(pixels, frame_rate, telemetry)
 
 # --- Helper Functions ---
-def connect():
-    if not wlan.isconnected():
-        print("Attempting to connect to Wi-Fi...")
-        wlan.connect(ssid, password)
-        for _ in range(15):
-            if wlan.isconnected():
-                print("Connected to Wi-Fi.")
-                return True
-            sleep(1)
-        print("Failed to connect to Wi-Fi.")
+def call_allowed():
+    # Every call counts against the budget; none while the API is failing.
+    if not breaker.allow():
+        log.info(M_PAUSED, breaker.retry_in() // 1000)
+        return False
+    if not quota.take():
+        log.warning(M_QUOTA, quota.wait_ms() // 1000)
+        return False
+    return True
+
+def call_failed():
+    # A call lost along with the Wi-Fi says nothing about the API.
+    if wlan.isconnected():
+        breaker.failure()
+    else:
+        link.lost()
+
+def show_conditions(obs):
+    global conditions, night, shown_weather
+    conditions = obs["code"]
+    night = obs["night"]
+    if night:
+        toplight.set_pixel(0, NIGHT_LIGHT_COLOR)
+    else:
+        toplight.set_pixel(0, (0, 0, 0, 0))
+    toplight.show()
+    if shown_weather != (conditions, night):
+        shown_weather = (conditions, night)
+        weather_changed.set()
+
+def sync_clock():
+    # Forecast playback needs the real time of day.
+    global clock_synced
+    if not clock_synced:
+        try:
+            import ntptime
+            ntptime.settime()
+            clock_synced = True
+        except Exception as e:
+            log.warning(M_CLOCK_FAILED, e)
+    return clock_synced
+
+async def fetch_forecast():
+    from forecast import OPEN_METEO_FIELDS, from_open_meteo
+    if not call_allowed():
+        return
+    log.info(M_FORECAST_FETCH)
+    try:
+        url = f"{api_url}?latitude={lat}&longitude={lon}&hourly=weathercode,is_day&forecast_days=2&timeformat=unixtime"
+        if proxy_records:
+            url += "&format=record"
+        response = await http.get(url)
+        if response.status != 200:
+            await response.aclose()
+            raise OSError(f"HTTP {response.status}")
+        if proxy_records:
+            # Straight into the forecast's own buffer: no parsing at all.
+            n = await afill(response, forecast.records)
+            await response.aclose()
+            forecast.set_records(wxrecord.count(n))
+        else:
+            values = await aproject(response, Projection(OPEN_METEO_FIELDS), parse_buf)
+            await response.aclose()
+            forecast.set(*from_open_meteo(values))
+        breaker.success()
+        log.info(M_FORECAST_UPDATED, forecast.hours_left())
+    except Exception as e:
+        call_failed()
+        log.warning(M_FORECAST_FAILED, e)
+
+def play_forecast():
+    entry = forecast.lookup()
+    if entry is None:
         return False
+    code, is_night = entry
+    # Shown, but kept out of the cache: that holds the last observation,
+    # which a 304 for its validators puts back on the display.
+    show_conditions({"code": code, "night": is_night})
     return True
 
-def get_conditions():
-    global conditions, night, last_weather_check
-    current_time_ms = ticks_ms()
-    if last_weather_check == 0 or ticks_diff(current_time_ms, last_weather_check) >= weather_check_interval:
-        print("Getting Data from Open-Meteo...")
+async def get_conditions():
+    if forecast_mode:
+        if sync_clock() and forecast.due():
+            await fetch_forecast()
+        if play_forecast():
+            log.info(M_FORECAST_HOUR, WMO_CODES.get(conditions, "Unknown"), conditions, night)
+            return True
+    if not cache.fresh():
+        if not call_allowed():
+            return
+        log.info(M_FETCH)
         try:
-            url = f"https://api.open-meteo.com/v1/forecast?latitude={lat}&longitude={lon}&current_weather=true"
-            response = urequests.get(url)
-            data = response.json()
-            response.close()
-            current_weather_data = data["current_weather"]
-            conditions = int(current_weather_data["weathercode"])
-            night = current_weather_data["is_day"] == 0
-            
-            if night:
-                toplight.set_pixel(0, NIGHT_LIGHT_COLOR)
-            else:
-                toplight.set_pixel(0, (0, 0, 0, 0))
-            toplight.show()
-            
-            condition_text = WMO_CODES.get(conditions, "Unknown")
-            print(f"Weather updated: {condition_text} ({conditions}), Night: {night}")
-            last_weather_check = ticks_ms()
+            # From whichever provider answers first, as a WMO code.
+            result = await providers.current(cache.validators(), cache.source)
+            breaker.success()
+            if result is None:
+                cache.revalidated()
+                show_conditions(cache.obs)
+                log.info(M_UNCHANGED)
+                return
+            weathercode, is_night, etag, last_modified = result
+            cache.update({"code": weathercode, "night": is_night}, etag, last_modified, providers.last.name)
+            show_conditions(cache.obs)
+            log.info(M_UPDATED, WMO_CODES.get(conditions, "Unknown"), conditions, night)
         except Exception as e:
-            print(f"Failed to fetch weather data: {e}")
+            call_failed()
+            log.warning(M_FETCH_FAILED, e)
+            if cache.obs is not None:
+                log.info(M_SHOWING_CACHED)
+
+async def fetch_loop():
+    # Runs alongside the display: a slow fetch never holds up the LEDs.
+    # Wi-Fi is joined by link's own task; offline, the forecast keeps playing.
+    while True:
+        mark = telemetry.start()
+        try:
+            await asyncio.wait_for(link.wait(), 60)
+        except asyncio.TimeoutError:
+            log.warning(M_OFFLINE)
+            if forecast_mode:
+                play_forecast()
+            log.flush()
+            continue
+        telemetry.stop(CONNECT, mark)
+        shown = shown_weather
+        mark = telemetry.start()
+        played = await get_conditions()
+        telemetry.stop(FETCH, mark)
+        telemetry.sample_heap()
+        # Sooner while the weather is changing or wet, later while it holds.
+        cache.ttl_ms = quota.next_interval(shown_weather != shown or precipitation(conditions))
+        log.flush()
+        # A forecast hour leaves the cache alone, so it sets the pace itself.
+        wait = cache.ttl_ms if played else cache.expires_in()
+        await power.wait(wait or breaker.retry_in() or quota.wait_ms() or weather_check_interval)
 
 # --- Fade & Lighting Effects ---
-def fade_to_color(target_color, duration_ms=500):
-    global current_led_color
-    steps = 50
-    delay = duration_ms / steps
-    start_color = current_led_color
-    for i in range(steps + 1):
-        r = int(start_color[0] + (target_color[0] - start_color[0]) * (i / steps))
-        g = int(start_color[1] + (target_color[1] - start_color[1]) * (i / steps))
-        b = int(start_color[2] + (target_color[2] - start_color[2]) * (i / steps))
-        intermediate_color = (r, g, b)
-        pixels.fill(intermediate_color)
-        pixels.show()
-        sleep(delay / 1000)
-    current_led_color = target_color
-
-def clear_day_effect(duration_ms, start_time, **kwargs):
-    b = day_brightness
-    target_color = (int(249 * b), int(215 * b), int(28 * b))
-    fade_to_color(target_color)
-    while ticks_diff(ticks_ms(), start_time) < duration_ms:
-        sleep(1)
-
-def clear_night_effect(duration_ms, start_time, **kwargs):
-    b = night_brightness
-    target_color = (int(150 * b), int(150 * b), int(255 * b))
-    fade_to_color(target_color)
-    while ticks_diff(ticks_ms(), start_time) < duration_ms:
-        sleep(1.0)
-
-def clouds_effect(duration_ms, start_time, **kwargs):
-    b = night_brightness if night else day_brightness
-    target_color = (int(30 * b), int(30 * b), int(30 * b))
-    fade_to_color(target_color)
-    while ticks_diff(ticks_ms(), start_time) < duration_ms:
-        sleep(0.5)
-
-def rain_effect(duration_ms, start_time, speed=0.1, **kwargs):
-    global current_led_color
-    splashes = []
-    led_brightness = [0.0] * numpix
-    start = ticks_ms()
-    while ticks_diff(ticks_ms(), start) < duration_ms:
-        for i in range(numpix): led_brightness[i] *= 0.95
-        if random.random() < speed:
-            splashes.append({"position": random.uniform(0, numpix - 1), "brightness": 1.0})
-        for i in range(len(splashes) - 1, -1, -1):
-            if splashes[i]["brightness"] < 0.01: splashes.pop(i)
-            else: splashes[i]["brightness"] *= 0.9
-        new_brightness = [0.0] * numpix
-        for splash in splashes:
-            for i in range(numpix):
-                dist = abs(splash["position"] - i)
-                b_splash = math.exp(-(dist * dist) / (2 * 1.5 * 1.5)) * splash["brightness"]
-                new_brightness[i] += b_splash
-        for i in range(numpix):
-            b = max(led_brightness[i], new_brightness[i])
-            led_brightness[i] = b
-            final_b = b * (night_brightness if night else day_brightness)
-            if final_b > 0.05: pixels.set_pixel(i, (int(10*final_b), int(50*final_b), int(255*final_b)))
-            else: pixels.set_pixel(i, (0, 0, 0))
-        pixels.show()
-        sleep(0.02)
-    current_led_color = (0, 0, 0)
-
-def thunderstorm_effect(duration_ms, start_time, **kwargs):
-    start = ticks_ms()
-    while ticks_diff(ticks_ms(), start) < duration_ms:
-        rain_effect(1000, ticks_ms(), speed=0.5)
-        if random.randint(0, 10) > 8:
-            # Lightning flash is always full brightness for impact
-            pixels.fill((200, 200, 255)); pixels.show(); sleep(0.05)
-            pixels.fill((0,0,0)); pixels.show(); sleep(0.05)
-
-def fog_effect(duration_ms, start_time, **kwargs):
+# Each effect function returns an effect object for the frame engine, which
+# steps it at frame_rate until run_display_cycle() plays the next one.
+# Brightness maths is fixed point (see frames.py): no floats per frame.
+SUN_COLOR = (249, 215, 28)
+MOON_COLOR = (150, 150, 255)
+CLOUD_COLOR = (30, 30, 30)
+FOG_COLOR = (80, 80, 80)
+RAIN_COLOR = (10, 50, 255)
+SNOW_COLOR = (255, 255, 255)
+LIGHTNING_COLOR = (200, 200, 255)
+OFF = (0, 0, 0)
+SPLASH_CAPACITY = 32 # Most splashes alive at once; more are dropped
+SNOWFLAKES = 4
+FINE = 2 * SHIFT  # Bits below an LED in snowflake positions
+
+# Splash falloff exp(-d^2 / (2 * 1.5^2)) by distance in 1/16 LED, in fixed
+# point, up to where it drops below one step.
+SPLASH_SUBPIXEL = 4 # Position bits below the LED index
+SPLASH_KERNEL = array("H")
+for d in range(16 * numpix):
+    k = int(math.exp(-((d / 16) ** 2) / (2 * 1.5 * 1.5)) * ONE + 0.5)
+    if not k:
+        break
+    SPLASH_KERNEL.append(k)
+
+def current_level():
+    return level(night_brightness if night else day_brightness)
+
+def clear_day_effect(**kwargs):
+    return Fade(scale(SUN_COLOR, level(day_brightness)))
+
+def clear_night_effect(**kwargs):
+    return Fade(scale(MOON_COLOR, level(night_brightness)))
+
+def clouds_effect(**kwargs):
+    return Fade(scale(CLOUD_COLOR, current_level()))
+
+def fog_effect(**kwargs):
     b = (night_brightness if night else 0.3) * (day_brightness) # Fog is dimmer in day
-    target_color = (int(80 * b), int(80 * b), int(80 * b))
-    fade_to_color(target_color)
-    while ticks_diff(ticks_ms(), start_time) < duration_ms:
-        sleep(1.0)
-
-def snow_effect(duration_ms, start_time, **kwargs):
-    b = night_brightness if night else day_brightness
-    snow_color = (int(255*b), int(255*b), int(255*b))
-    snowflakes = [{'p': random.uniform(0,numpix-1),'s':random.uniform(0.02,0.05)} for _ in range(4)]
-    start = ticks_ms()
-    while ticks_diff(ticks_ms(), start) < duration_ms:
-        pixels.fill((0, 0, 0))
-        for flake in snowflakes:
-            flake['p'] += flake['s']
-            if flake['p'] > numpix: flake['p'] = 0
-            pixels.set_pixel(int(flake['p']), snow_color)
-        pixels.show()
-        sleep(0.05)
+    return Fade(scale(FOG_COLOR, level(b)))
+
+def rain_effect(speed=0.1, **kwargs):
+    return Rain(speed)
+
+def thunderstorm_effect(**kwargs):
+    return Thunderstorm()
+
+def snow_effect(**kwargs):
+    return Snow()
+
+class Rain(Effect):
+    # Splashes land at random and spread out over neighbouring LEDs.
+    def __init__(self, speed=0.1):
+        self.speed = speed
+        lvl = current_level()
+        # One colour per brightness, gamma corrected, so frames build no tuples.
+        color = scale(RAIN_COLOR, lvl)
+        self.palette = [scale(color, GAMMA[b]) for b in range(ONE + 1)]
+        # LEDs under 5% of full brightness (after the level) are switched off.
+        self.cutoff = ONE * ONE // 20 // max(lvl, 1)
+        self.splashes = ParticlePool(SPLASH_CAPACITY) # pos in 1/16 LED
+        self.led_brightness = array("H", bytes(2 * numpix))
+        self.sums = array("H", bytes(2 * numpix))
+
+    def start(self, engine):
+        self.engine = engine
+        engine.color = OFF
+        # Decay rates and splash chance are per 20 ms; scale them to the frame step.
+        k = engine.period / 20
+        self.decay = level(0.95 ** k)
+        self.fade = level(0.9 ** k)
+        self.chance = level(self.speed * k)
+
+    def update(self, dt):
+        led_brightness = self.led_brightness
+        sums = self.sums
+        pool = self.splashes
+        pos, lvl, alive = pool.pos, pool.level, pool.alive
+        kernel = SPLASH_KERNEL
+        reach = len(kernel)
+        decay = self.decay
+        fade = self.fade
+        for i in range(numpix):
+            led_brightness[i] = (led_brightness[i] * decay) >> SHIFT
+            sums[i] = 0
+        if random.getrandbits(SHIFT) < self.chance:
+            pool.spawn(random.randint(0, (numpix - 1) << SPLASH_SUBPIXEL), 0, ONE)
+        for j in range(pool.capacity):
+            if not alive[j]:
+                continue
+            if lvl[j] < 3:
+                pool.kill(j)
+                continue
+            brightness = (lvl[j] * fade) >> SHIFT
+            lvl[j] = brightness
+            # Only the LEDs within the kernel's reach are lit by this splash.
+            p = pos[j]
+            lo = max(0, (p - reach) >> SPLASH_SUBPIXEL)
+            hi = min(numpix - 1, (p + reach) >> SPLASH_SUBPIXEL)
+            for i in range(lo, hi + 1):
+                d = p - (i << SPLASH_SUBPIXEL)
+                if d < 0: d = -d
+                if d < reach:
+                    b = sums[i] + ((kernel[d] * brightness) >> SHIFT)
+                    sums[i] = b if b < 0xFFFF else 0xFFFF
+        for i in range(numpix):
+            if sums[i] > led_brightness[i]: led_brightness[i] = sums[i]
+
+    def render(self, px):
+        palette = self.palette
+        for i in range(numpix):
+            b = self.led_brightness[i]
+            if b > self.cutoff: px.set_pixel(i, palette[b if b < ONE else ONE])
+            else: px.set_pixel(i, OFF)
+
+class Thunderstorm(Effect):
+    # Heavy rain, with a chance of lightning after every second of it.
+    def __init__(self):
+        self.rain = Rain(0.5)
+        self.elapsed = 0
+        self.flash = 0 # ms of lightning left: white, then dark
+
+    def start(self, engine):
+        self.engine = engine
+        self.rain.start(engine)
+
+    def update(self, dt):
+        if self.flash > 0:
+            self.flash -= dt
+            return
+        self.rain.update(dt)
+        self.elapsed += dt
+        if self.elapsed >= 1000:
+            self.elapsed = 0
+            if random.randint(0, 10) > 8:
+                self.flash = 100
+
+    def render(self, px):
+        # Lightning flash is always full brightness for impact
+        if self.flash > 50: px.fill(LIGHTNING_COLOR)
+        elif self.flash > 0: px.fill(OFF)
+        else: self.rain.render(px)
+
+class Snow(Effect):
+    def __init__(self):
+        self.color = scale(SNOW_COLOR, current_level())
+        # Speeds are 5-13/256 LED per 50 ms, kept per ms in 1/65536 LED (as
+        # are the positions) so short frames don't round them down.
+        self.flakes = ParticlePool(SNOWFLAKES)
+        for _ in range(SNOWFLAKES):
+            self.flakes.spawn(random.randint(0, (numpix - 1) << FINE), (random.randint(5, 13) << SHIFT) // 50)
+
+    def start(self, engine):
+        self.engine = engine
+        engine.color = OFF
+
+    def update(self, dt):
+        end = numpix << FINE
+        flakes = self.flakes
+        pos, vel = flakes.pos, flakes.vel
+        for j in range(flakes.capacity):
+            p = pos[j] + vel[j] * dt
+            pos[j] = p if p < end else 0
+
+    def render(self, px):
+        px.fill(OFF)
+        pos = self.flakes.pos
+        for j in range(self.flakes.capacity):
+            px.set_pixel(pos[j] >> FINE, self.color)
+
+# --- Weather Actions ---
+# Compiled once: each WMO code, day or night, maps to exactly one action.
+RAIN_NIGHT = Action("rain_night", RAIN_NIGHT_POS, rain_effect, {'speed': 0.2})
+WEATHER_ACTIONS = ConditionTable([
+    (WMO_CLEAR, Action("clear_day", CLEAR_DAY_POS, clear_day_effect),
+                Action("clear_night", CLEAR_NIGHT_POS, clear_night_effect)),
+    (WMO_PARTLY_CLOUDY, Action("partly_cloudy_day", PARTLY_CLOUDY_POS, clouds_effect),
+                        Action("partly_cloudy_night", PARTLY_CLOUDY_NIGHT_POS, clouds_effect)),
+    (WMO_OVERCAST, Action("overcast", OVERCAST_POS, clouds_effect)),
+    (WMO_FOG, Action("fog", FOG_POS, fog_effect)),
+    (WMO_SLIGHT_RAIN, Action("slight_rain", SLIGHT_RAIN_POS, rain_effect, {'speed': 0.1}), RAIN_NIGHT),
+    (WMO_RAIN_SHOWERS, Action("rain_showers", RAIN_SHOWERS_POS, rain_effect, {'speed': 0.2}), RAIN_NIGHT),
+    (WMO_MODERATE_RAIN, Action("moderate_rain", MODERATE_RAIN_POS, rain_effect, {'speed': 0.35}), RAIN_NIGHT),
+    (WMO_HEAVY_RAIN, Action("heavy_rain", HEAVY_RAIN_POS, rain_effect, {'speed': 0.5}), RAIN_NIGHT),
+    (WMO_THUNDERSTORM, Action("thunderstorm", THUNDERSTORM_POS, thunderstorm_effect)),
+    (WMO_SNOW, Action("snow", SNOW_POS, snow_effect)),
+])
 
 # --- REFACTORED Core Logic ---
-def run_display_cycle():
+async def run_display_cycle():
     global last_condition, first_weather_check, last_night_status
-    action_key = None
-    if night:
-        if conditions in clear_sky: action_key = "clear_night"
-        elif conditions in partly_cloudy: action_key = "partly_cloudy_night"
-        elif conditions in all_rain_types: action_key = "rain_night"
-    if action_key is None:
-        if conditions in clear_sky: action_key = "clear_day"
-        elif conditions in partly_cloudy: action_key = "partly_cloudy_day"
-        elif conditions in overcast: action_key = "overcast"
-        elif conditions in fog: action_key = "fog"
-        elif conditions in slight_rain: action_key = "slight_rain"
-        elif conditions in rain_showers: action_key = "rain_showers"
-        elif conditions in moderate_rain: action_key = "moderate_rain"
-        elif conditions in heavy_rain: action_key = "heavy_rain"
-        elif conditions in thunderstorm: action_key = "thunderstorm"
-        elif conditions in snow: action_key = "snow"
-    
+    weather_changed.clear()
+    action = WEATHER_ACTIONS.lookup(conditions, night)
+
     state_changed = first_weather_check or last_condition != conditions or last_night_status != night
-    if state_changed: print(f"New change detected. Updating display.")
-    else: print("Condition unchanged. Continuing animation.")
-
-    if action_key:
-        WEATHER_ACTIONS = {
-            "clear_night": {"pos": CLEAR_NIGHT_POS, "effect": clear_night_effect},
-            "partly_cloudy_night": {"pos": PARTLY_CLOUDY_NIGHT_POS, "effect": clouds_effect},
-            "rain_night": {"pos": RAIN_NIGHT_POS, "effect": rain_effect, "params": {'speed': 0.2}},
-            "clear_day": {"pos": CLEAR_DAY_POS, "effect": clear_day_effect},
-            "partly_cloudy_day": {"pos": PARTLY_CLOUDY_POS, "effect": clouds_effect},
-            "overcast": {"pos": OVERCAST_POS, "effect": clouds_effect},
-            "fog": {"pos": FOG_POS, "effect": fog_effect},
-            "slight_rain": {"pos": SLIGHT_RAIN_POS, "effect": rain_effect, "params": {'speed': 0.1}},
-            "rain_showers": {"pos": RAIN_SHOWERS_POS, "effect": rain_effect, "params": {'speed': 0.2}},
-            "moderate_rain": {"pos": MODERATE_RAIN_POS, "effect": rain_effect, "params": {'speed': 0.35}},
-            "heavy_rain": {"pos": HEAVY_RAIN_POS, "effect": rain_effect, "params": {'speed': 0.5}},
-            "thunderstorm": {"pos": THUNDERSTORM_POS, "effect": thunderstorm_effect},
-            "snow": {"pos": SNOW_POS, "effect": snow_effect}
-        }
-        action = WEATHER_ACTIONS[action_key]
-        if state_changed: move_servo_slowly(action["pos"])
-        action["effect"](weather_check_interval, ticks_ms(), **action.get("params", {}))
-    else:
-        condition_text = WMO_CODES.get(conditions, "Unknown")
-        print(f"Condition '{condition_text}' ({conditions}) not handled.")
-        sleep(5)
-            
+    log.info(M_CHANGED if state_changed else M_SAME)
     last_condition = conditions
     last_night_status = night
     first_weather_check = False
 
-def move_servo_slowly(target_position):
-    global current_servo_position
-    step = 1 if target_position > current_servo_position else -1
-    for pos in range(current_servo_position, target_position + step, step):
-        servo(pos)
-        sleep(servospeed)
-    current_servo_position = target_position
+    if action:
+        display(action.pos if state_changed else None, action.effect(**action.params))
+    else:
+        log.warning(M_NOT_HANDLED, WMO_CODES.get(conditions, "Unknown"), conditions)
+    log.flush()
+    await weather_changed.wait()
 
 def servo(degrees):
-    degrees = max(0, min(180, degrees + servo_offset))
-    min_pulse_us = 500
-    max_pulse_us = 2500
-    duty = int((min_pulse_us + (max_pulse_us - min_pulse_us) * (degrees / 180)) / 20000 * 65535)
-    servoPin.duty_u16(duty)
-
-def initial_servo_sweep():
-    print("Performing initial servo sweep...")
-    move_servo_slowly(22); sleep(2)
-    move_servo_slowly(95); sleep(2)
-    move_servo_slowly(2)
+    servoPin.duty_u16(servo_profile.duty(degrees + servo_offset))
 
-# --- Main Program Loop ---
-initial_servo_sweep()
-try:
-    while True:
-        if connect():
-            get_conditions()
-            run_display_cycle()
+def release_servo():
+    # No pulses: the servo stops holding (and jittering) once it has settled.
+    servoPin.duty_u16(0)
+    if shown_weather is not None:
+        if render.running:
+            render.settled.post(display_state()) # Core 1: flash is written from core 0
         else:
-            print("Wi-Fi disconnected. Will try again in 1 minute.")
-            sleep(60)
-except KeyboardInterrupt:
-    print("Program stopped by user.")
-    pixels.fill((0, 0, 0)); pixels.show()
-    toplight.set_pixel(0, (0,0,0,0)); toplight.show()
+            save_display(*display_state()) # Where to start from at the next boot
+
+# Moves run in the motion task so the effect keeps rendering; a newer target
+# replaces a move that is still under way.
+motion = ServoMotion(servo, release_servo, 90, ms_per_degree=int(servospeed * 1000), telemetry=telemetry)
+render = RenderCore(engine, motion)
+
+def display(position, effect):
+    # With dual_core, handed to core 1, which alone drives the LEDs and servo.
+    if render.running:
+        render.show(position, effect)
+        return
+    if position is not None: motion.move_to(position)
+    if effect is not None: engine.play(effect)
+
+async def save_settled():
+    # Dual core: the display state core 1 settled on, saved from this core.
+    while True:
+        save_display(*await render.settled.get())
+
+def display_idle():
+    return engine.idle and not render.busy
+
+def display_state():
+    return motion.position, engine.color, conditions, night
+
+power = PowerSaver(wlan, power_mode, display_idle, display_state)
+
+async def move_servo_slowly(target_position):
+    display(target_position, None)
+    while render.busy:
+        await asyncio.sleep_ms(motion.tick_ms)
+
+async def initial_servo_sweep():
+    log.info(M_SWEEP)
+    await move_servo_slowly(22); await asyncio.sleep(2)
+    await move_servo_slowly(95); await asyncio.sleep(2)
+    await move_servo_slowly(2)
+
+async def main():
+    # Fetching starts straight away and overlaps with the sweep and the effects.
+    link.survey()  # Any blocking scan before the display starts moving
+    asyncio.create_task(link.run())
+    asyncio.create_task(fetch_loop())
+    if dual_core:
+        power.mode = None
+        render.start()
+        log.info(M_DUAL_CORE)
+        asyncio.create_task(save_settled())
+    else:
+        asyncio.create_task(engine.run())
+        asyncio.create_task(motion.run())
+    if calibration_sweep or not restored:
+        await initial_servo_sweep()
+    if shown_weather is None:
+        await weather_changed.wait()
+    while True:
+        await run_display_cycle()
+
+# --- Main Program Loop ---
+def restore():
+    # The display first, straight from flash; the network comes later.
+    global restored
+    if cache.load() is not None:
+        log.info(M_RESTORED)
+        show_conditions(cache.obs)
+    state = load_wake()
+    if state is not None:
+        log.info(M_WOKE)
+    else:
+        state = load_display()
+        if state is not None:
+            log.info(M_RESTORED_DISPLAY)
+    if state is not None:
+        angle, color, code, is_night = state
+        motion.position = motion.target = angle
+        engine.color = color
+        pixels.fill(color); pixels.show()
+        show_conditions({"code": code, "night": is_night})
+        restored = True
+    if forecast_mode and forecast.load():
+        log.info(M_RESTORED_FORECAST)
+
+def run():
+    restore()
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        render.stop()
+        log.info(M_STOPPED)
+        log.flush()
+        telemetry.dump()
+        pixels.fill((0, 0, 0)); pixels.show()
+        toplight.set_pixel(0, (0,0,0,0)); toplight.show()
 
+# Importing the script (e.g. from host/run.py) sets it up without starting it.
+if __name__ == "__main__":
+    run()
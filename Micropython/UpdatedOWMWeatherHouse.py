@@ -1,10 +1,29 @@
-import time
 import network
-import urequests
 from machine import Pin, PWM
 from neopixel import Neopixel
 import random
-from time import sleep, ticks_ms, ticks_diff
+from time import sleep
+from jsonstream import Projection
+from httpclient import AsyncHttpClient, aproject, afill
+import wxrecord
+from obscache import ObservationCache
+from frames import FrameEngine, Effect, Solid
+from particles import ParticlePool
+from motion import ServoMotion
+from calibration import ServoProfile, PROFILE_FILE
+from telemetry import Telemetry, CONNECT, FETCH
+from logger import log
+from power import PowerSaver, load_wake, load_display, save_display
+from quota import Quota
+from supervisor import Link, Backoff, CircuitBreaker, JoinCache
+from providers import ProviderPool, OpenWeatherMap, OpenMeteo
+from dualcore import RenderCore
+from conditions import (OWM, precipitation, Action, ConditionTable, OWM_CLEAR, OWM_SCATTERED_CLOUDS, OWM_CLOUDY, OWM_SHOWERS,
+                        OWM_LIGHT_RAIN, OWM_THUNDERSTORM, OWM_FOG, OWM_HAZE, OWM_SNOW)
+try:
+    import asyncio
+except ImportError:
+    import uasyncio as asyncio
 
 # --- Configuration ---
 
@@ -16,13 +35,34 @@ password = 'your_wifi_password'  # Your Wi-Fi password
 api_key = "your_openweathermap_api_key"  # Your OpenWeatherMap API key
 lat = "your_latitude"                    # Your latitude
 lon = "your_longitude"                   # Your longitude
+api_url = "https://api.openweathermap.org/data/3.0/onecall"
+# With several houses on one network, run proxy/weatherproxy.py and use
+# api_url = "http://<proxy address>:8080/data/3.0/onecall"
+# Set proxy_records too to have the proxy send packed binary records instead of JSON.
+proxy_records = False
+
+# Second Provider: weather checks use Open-Meteo (no key needed) as well.
+# Each goes to whichever has been answering faster, and the other is asked
+# too if no answer has come within hedge_after ms, or straight away if the
+# first fails (see providers.py). Set open_meteo_url = None to use
+# OpenWeatherMap alone, or hedge_after = None to only switch on failure.
+open_meteo_url = "https://api.open-meteo.com/v1/forecast"
+hedge_after = 2500
 
 # Servo Configuration
+# Duty curve and positions come from DefineAngles.py's calibrate mode when
+# it has been run; otherwise these defaults apply
 servospeed = 0.02
-sun_position = 150
-moon_position = 15
-current_servo_position = 0
 servo_offset = 0
+servo_profile = ServoProfile.load(PROFILE_FILE, ((0, 2747), (180, 305)))  # Reversed: 9000 to 1000 duty
+sun_position = servo_profile.position("clear_day", 150)
+moon_position = servo_profile.position("clear_night", 15)
+clouds_position = servo_profile.position("partly_cloudy_day", 130)
+cloudy_position = servo_profile.position("overcast", 115)
+rain_position = servo_profile.position("slight_rain", 105)
+thunderstorm_position = servo_profile.position("thunderstorm", 105)
+fog_position = servo_profile.position("fog", 72)
+snow_position = servo_profile.position("snow", 70)
 
 # Neopixel Configuration
 numpix = 10  # Number of LEDs in the strip
@@ -36,28 +76,92 @@ toplight = Neopixel(1, 0, toplight_pin, "GRB")  # Initialize top light separatel
 # Brightness Settings
 day_brightness = 0.5
 night_brightness = 0.2
+frame_rate = 20  # LED frames per second
+telemetry_enabled = True  # Time each stage; call telemetry.dump() to see the figures
 
 # Weather Update Interval
 weather_check_interval = 15 * 60 * 1000  # 15 minutes
-last_weather_check = 0
+cache_file = "weather_cache.bin"  # Last observation, kept on flash
+
+# API Quota: the most calls in any 24 hours, retries included and kept
+# across reboots (the free One Call plan allows 1000). Checks come every
+# min_check_interval while the weather is changing or wet, and back off
+# towards max_check_interval through long settled spells.
+daily_call_budget = 1000
+min_check_interval = 5 * 60 * 1000  # 5 minutes
+max_check_interval = 60 * 60 * 1000  # 1 hour
+quota_file = "quota.bin"
+
+# Connection Supervision: Wi-Fi is rejoined in the background, retrying
+# after about 2 s, 4 s, 8 s... up to wifi_retry_max. After
+# api_failure_threshold failed calls in a row the API is left alone for
+# api_pause, doubling while it stays down.
+wifi_retry_max = 5 * 60 * 1000  # 5 minutes
+api_failure_threshold = 3
+api_pause = 60 * 1000  # 1 minute
+# The access point and address of the last good join are kept in wifi_file
+# and tried first, skipping the scan and DHCP. Set static_ip to
+# ("ip", "netmask", "gateway", "dns") to never wait on DHCP.
+static_ip = None
+wifi_file = "wifi.bin"
+
+# Power Saving: None keeps the board awake. With "light" or "deep", while
+# the display is static (sunny, cloudy, fog) Wi-Fi is switched off between
+# fetches and the board sleeps (see power.py). "deep" saves the most; on
+# waking the display is put back as it was, without the servo sweep.
+power_mode = None
+
+# Forecast Mode: fetch the hourly forecast every few hours and step through
+# it locally instead of calling the API every weather_check_interval
+forecast_mode = False
+forecast_refresh_interval = 3 * 60 * 60  # Seconds between forecast fetches
+forecast_file = "forecast.bin"
+
+# Start-up: the last condition, dial position and lights are put back from
+# flash at power-up. Set calibration_sweep to sweep the servo through its
+# positions first instead, e.g. after moving the dial by hand
+calibration_sweep = False
+
+# Dual Core: run the lights and servo on the Pico's second core, so nothing
+# the network or the parser does can hold up a frame (see dualcore.py).
+# The board can't sleep with core 1 running, so power_mode is ignored then
+dual_core = False
+
+clock_synced = False
+restored = False  # Display put back from flash or after a deep sleep
 conditions = 800
 night = False
 last_condition = None
+last_night_status = None
 first_weather_check = True  # Flag to ensure the servo moves on the first check
-
-# Weather Conditions
-sunny_codes = [800]
-fewclouds = [801]
-scatteredclouds = [802, 803]
-cloudy = [804]
-showers = [520, 521, 522, 531]
-lightrain = [300, 301, 302, 310, 311, 312, 313, 314, 321, 500]
-moderaterain = [501]
-heavyrain = [502, 503, 504]
-thunderstorm_codes = [200, 201, 202, 210, 211, 212, 221, 230, 231, 232]
-snow_codes = [600, 601, 602, 611, 612, 613, 615, 616, 620, 622]
-fog = [741]
-haze = [701, 721]
+shown_weather = None
+weather_changed = asyncio.Event()  # Set when the condition or day/night changes
+
+# Log Messages: logged by number, printed in batches by log.flush() when idle
+M_TOPLIGHT = log.message("Top light toggled on.")
+M_CLOCK_FAILED = log.message("Failed to set clock: %s")
+M_FORECAST_FETCH = log.message("Getting Forecast from OpenWeatherMap...")
+M_FORECAST_UPDATED = log.message("Forecast updated: %s hours ahead.")
+M_FORECAST_FAILED = log.message("Failed to fetch forecast: %s")
+M_FORECAST_HOUR = log.message("Forecast for this hour: %s, Night: %s")
+M_FETCH = log.message("Getting Data from OpenWeatherMap...")
+M_UNCHANGED = log.message("Weather unchanged since last fetch.")
+M_UPDATED = log.message("Weather conditions updated: %s, Night: %s")
+M_FETCH_FAILED = log.message("Failed to fetch weather data: %s")
+M_SHOWING_CACHED = log.message("Showing cached weather.")
+M_QUOTA = log.message("API budget used up; next call in %s s.")
+M_PAUSED = log.message("Weather API paused; next call in %s s.")
+M_OFFLINE = log.message("Wi-Fi still down; rejoining in the background.")
+M_NEXT_UPDATE = log.message("Next update in %s minutes...")
+M_NO_MATCH = log.message("No matching condition, turning off lights.")
+M_SAME = log.message("Condition unchanged, skipping movement.")
+M_SWEEP = log.message("Performing initial servo sweep...")
+M_RESTORED = log.message("Restored cached weather from flash.")
+M_RESTORED_FORECAST = log.message("Restored forecast from flash.")
+M_STOPPED = log.message("Program stopped.")
+M_WOKE = log.message("Woke from deep sleep; display restored.")
+M_RESTORED_DISPLAY = log.message("Restored display from flash.")
+M_DUAL_CORE = log.message("Lights and servo running on core 1.")
 
 # Colors
 OFF = (0, 0, 0)
@@ -74,22 +178,43 @@ servoPin.freq(50)
 wlan = network.WLAN(network.STA_IF)
 wlan.active(True)
 
+# HTTP client: keeps the connection and receive buffer between fetches
+http = AsyncHttpClient()
+parse_buf = bytearray(256)
+weather_providers = [OpenWeatherMap(lat, lon, api_key, api_url, http=http, records=proxy_records)]
+if open_meteo_url:
+    weather_providers.append(OpenMeteo(lat, lon, open_meteo_url))
+providers = ProviderPool(weather_providers, OWM, hedge_after)
+cache = ObservationCache(cache_file, weather_check_interval)
+if forecast_mode:
+    from forecast import Forecast
+    forecast = Forecast(forecast_file, forecast_refresh_interval)
+else:
+    forecast = None  # Not loaded unless it is used
+quota = Quota(quota_file, daily_call_budget, weather_check_interval, min_check_interval, max_check_interval)
+link = Link(wlan, ssid, password, backoff=Backoff(max_ms=wifi_retry_max), join_cache=JoinCache(wifi_file, static_ip))
+breaker = CircuitBreaker(api_failure_threshold, api_pause)
+telemetry = Telemetry(enabled=telemetry_enabled)
+engine = FrameEngine(pixels, frame_rate, telemetry)
+
 # Helper Functions
-def connect():
-    """Connect to Wi-Fi."""
-    if not wlan.isconnected():
-        print("Attempting to connect to Wi-Fi...")
-        wlan.connect(ssid, password)
-        for _ in range(15):
-            if wlan.isconnected():
-                print("Connected to Wi-Fi.")
-                return True
-            print("Waiting for Wi-Fi connection...")
-            sleep(1)
-        print("Failed to connect to Wi-Fi.")
+def call_allowed():
+    """Whether an API call may be made now: within the budget, and the API not failing."""
+    if not breaker.allow():
+        log.info(M_PAUSED, breaker.retry_in() // 1000)
+        return False
+    if not quota.take():  # Every call counts against the daily budget, retries too
+        log.warning(M_QUOTA, quota.wait_ms() // 1000)
         return False
     return True
 
+def call_failed():
+    """Count a failed call against the API, unless the Wi-Fi went with it."""
+    if wlan.isconnected():
+        breaker.failure()
+    else:
+        link.lost()
+
 def iconlight():
     """Toggle the top light as an indicator."""
     toplight.set_pixel(0, OFF)  # Turn off the top light
@@ -97,190 +222,368 @@ def iconlight():
     sleep(3)  # Wait for 3 seconds
     toplight.set_pixel(0, (100, 100, 100))  # Turn on the top light
     toplight.show()
-    print("Top light toggled on.")
-
-def get_conditions():
-    """Fetch weather conditions from OpenWeatherMap."""
-    global conditions, night, last_weather_check
-
-    current_time = ticks_ms()
+    log.info(M_TOPLIGHT)
+
+def show_conditions(obs):
+    """Apply a cached or freshly fetched observation."""
+    global conditions, night, shown_weather
+    conditions = obs["code"]
+    night = obs["night"]
+    if shown_weather != (conditions, night):
+        shown_weather = (conditions, night)
+        weather_changed.set()
+
+def sync_clock():
+    """Set the clock from NTP; forecast playback needs the real time of day."""
+    global clock_synced
+    if not clock_synced:
+        try:
+            import ntptime
+            ntptime.settime()
+            clock_synced = True
+        except Exception as e:
+            log.warning(M_CLOCK_FAILED, e)
+    return clock_synced
+
+async def fetch_forecast():
+    """Fetch the hourly forecast from OpenWeatherMap and store it."""
+    from forecast import OWM_FIELDS, from_owm
+    if not call_allowed():
+        return
+    log.info(M_FORECAST_FETCH)
+    try:
+        url = f"{api_url}?lat={lat}&lon={lon}&appid={api_key}&units=metric&exclude=current,minutely,daily,alerts"
+        if proxy_records:
+            url += "&format=record"
+        response = await http.get(url)
+        if response.status != 200:
+            await response.aclose()
+            raise OSError(f"HTTP {response.status}")
+        if proxy_records:
+            # Straight into the forecast's own buffer: no parsing at all.
+            n = await afill(response, forecast.records)
+            await response.aclose()
+            forecast.set_records(wxrecord.count(n))
+        else:
+            values = await aproject(response, Projection(OWM_FIELDS), parse_buf)
+            await response.aclose()
+            forecast.set(*from_owm(values))
+        breaker.success()
+        log.info(M_FORECAST_UPDATED, forecast.hours_left())
+    except Exception as e:
+        call_failed()
+        log.warning(M_FORECAST_FAILED, e)
+
+def play_forecast():
+    """Show the forecast entry for the current hour; False if there is none."""
+    entry = forecast.lookup()
+    if entry is None:
+        return False
+    code, is_night = entry
+    # Shown but not cached: the cache keeps the last observation, which a
+    # 304 for its validators puts back on the display
+    show_conditions({"code": code, "night": is_night})
+    return True
 
-    # If this is the first check or 15 minutes have passed, fetch weather
-    if last_weather_check == 0 or ticks_diff(current_time, last_weather_check) >= weather_check_interval:
-        print("Getting Data from OpenWeatherMap...")
+async def get_conditions():
+    """
+    Fetch weather conditions from OpenWeatherMap; True if a forecast hour
+    was shown instead.
+    """
+    if forecast_mode:
+        if sync_clock() and forecast.due():
+            await fetch_forecast()
+        if play_forecast():
+            log.info(M_FORECAST_HOUR, conditions, night)
+            return True
+    # If this is the first check or the cached value has expired, fetch weather
+    if not cache.fresh():
+        if not call_allowed():
+            return
+        log.info(M_FETCH)
         try:
-            # Fetch weather data from the API
-            url = f"https://api.openweathermap.org/data/3.0/onecall?lat={lat}&lon={lon}&appid={api_key}&units=metric"
-            response = urequests.get(url)
-            data = response.json()
-            response.close()
-
-            # Update weather conditions and night status
-            conditions = int(data["current"]["weather"][0]["id"])
-            current_time = data["current"]["dt"]
-            sunrise = data["current"]["sunrise"]
-            sunset = data["current"]["sunset"]
-            night = current_time >= sunset or current_time <= sunrise
-
-            # Update the last weather check timestamp
-            last_weather_check = ticks_ms()
-
-            print(f"Weather conditions updated: {conditions}, Night: {night}")
+            # Fetch from whichever provider answers first, conditional on the
+            # cached copy; conditions come back as OpenWeatherMap ids
+            result = await providers.current(cache.validators(), cache.source)
+            breaker.success()
+            if result is None:
+                cache.revalidated()
+                show_conditions(cache.obs)
+                log.info(M_UNCHANGED)
+                return
+            weather_id, is_night, etag, last_modified = result
+
+            # Update weather conditions and night status, and save them to flash
+            cache.update({"code": weather_id, "night": is_night}, etag, last_modified, providers.last.name)
+            show_conditions(cache.obs)
+
+            log.info(M_UPDATED, conditions, night)
         except Exception as e:
-            print(f"Failed to fetch weather data: {e}")
-    else:
+            call_failed()
+            log.warning(M_FETCH_FAILED, e)
+            if cache.obs is not None:
+                log.info(M_SHOWING_CACHED)
+
+async def fetch_loop():
+    """Fetch in the background so the lights keep animating during network waits."""
+    while True:
+        mark = telemetry.start()
+        try:
+            await asyncio.wait_for(link.wait(), 60)  # link's own task does the joining
+        except asyncio.TimeoutError:
+            log.warning(M_OFFLINE)
+            if forecast_mode:
+                play_forecast()  # Keep stepping through the forecast while offline
+            log.flush()
+            continue
+        telemetry.stop(CONNECT, mark)
+        shown = shown_weather
+        mark = telemetry.start()
+        played = await get_conditions()  # Fetch weather conditions
+        telemetry.stop(FETCH, mark)
+        telemetry.sample_heap()
+        # Check sooner while the weather is changing or wet, later while it holds
+        cache.ttl_ms = quota.next_interval(shown_weather != shown or precipitation(conditions))
         # Calculate the time remaining until the next update
-        time_remaining = weather_check_interval - ticks_diff(current_time, last_weather_check)
-        time_remaining_minutes = time_remaining // 60000  # Convert to minutes for display
-        print(f"Pausing for {time_remaining_minutes} minutes...")
-        sleep(time_remaining / 1000)
+        # (a forecast hour leaves the cache alone, so it sets the pace itself)
+        wait = cache.ttl_ms if played else cache.expires_in()
+        time_remaining = wait or breaker.retry_in() or quota.wait_ms() or weather_check_interval
+        log.info(M_NEXT_UPDATE, time_remaining // 60000)  # In minutes for display
+        log.flush()  # Idle until the next fetch: print what has been logged
+        await power.wait(time_remaining)
 
 # Ambient Lighting for Weather Conditions
-def sunny(duration_ms, start_time):
+# Each effect returns an effect object; the frame engine steps it at
+# frame_rate until move() plays the next one.
+def sunny():
     brightness = night_brightness if night else day_brightness
-    while ticks_diff(ticks_ms(), start_time) < duration_ms:
-        pixels.fill((int(YELLOW[0] * brightness), int(YELLOW[1] * brightness), int(YELLOW[2] * brightness)))
-        pixels.show()
-        sleep(1)
+    return Solid((int(YELLOW[0] * brightness), int(YELLOW[1] * brightness), int(YELLOW[2] * brightness)))
 
-def moonlight(duration_ms, start_time):
+def moonlight():
     brightness = night_brightness
-    moon_color = (int(150 * brightness), int(150 * brightness), int(255 * brightness))
-    while ticks_diff(ticks_ms(), start_time) < duration_ms:
-        pixels.fill(moon_color)
-        pixels.show()
-        sleep(1.0)
+    return Solid((int(150 * brightness), int(150 * brightness), int(255 * brightness)))
 
-def scattered_clouds(duration_ms, start_time):
+def scattered_clouds():
     brightness = night_brightness if night else day_brightness
-    cloud_color = (int(SOFT_GRAY[0] * brightness), int(SOFT_GRAY[1] * brightness), int(SOFT_GRAY[2] * brightness))
-    while ticks_diff(ticks_ms(), start_time) < duration_ms:
-        pixels.fill(cloud_color)
-        pixels.show()
-        sleep(0.5)
+    return Solid((int(SOFT_GRAY[0] * brightness), int(SOFT_GRAY[1] * brightness), int(SOFT_GRAY[2] * brightness)))
 
-def rain(duration_ms, start_time):
+def rain():
     brightness = night_brightness if night else day_brightness
-    num_drops = 2
-    raindrops = [{'position': random.randint(0, numpix - 1)} for _ in range(num_drops)]
-    while ticks_diff(ticks_ms(), start_time) < duration_ms:
-        pixels.fill(OFF)
-        for drop in raindrops:
-            drop['position'] = (drop['position'] + 1) % numpix
-            pixels.set_pixel(drop['position'], (0, 0, int(128 * brightness)))
-        pixels.show()
-        sleep(0.7)
+    return Drops((0, 0, int(128 * brightness)), 2, 700)
 
-def thunderstorm(duration_ms, start_time):
-    rain(duration_ms, start_time)
-    if random.randint(0, 10) > 8:
-        pixels.fill(WHITE)
-        pixels.show()
-        sleep(0.1)
-        pixels.fill(OFF)
-        pixels.show()
-
-def fog_light(duration_ms, start_time):
-    brightness = night_brightness
-    fog_color = (int(50 * brightness), int(50 * brightness), int(50 * brightness))
-    while ticks_diff(ticks_ms(), start_time) < duration_ms:
-        pixels.fill(fog_color)
-        pixels.show()
-        sleep(1.0)
+def thunderstorm():
+    return Thunderstorm()
 
-def snow(duration_ms, start_time):
+def fog_light():
     brightness = night_brightness
-    snowflakes = [{'position': random.randint(0, numpix - 1)} for _ in range(2)]
-    while ticks_diff(ticks_ms(), start_time) < duration_ms:
-        pixels.fill(OFF)
-        for flake in snowflakes:
-            flake['position'] = (flake['position'] + 1) % numpix
-            pixels.set_pixel(flake['position'], WHITE)
-        pixels.show()
-        sleep(0.8)
+    return Solid((int(50 * brightness), int(50 * brightness), int(50 * brightness)))
+
+def snow():
+    return Drops(WHITE, 2, 800)
+
+def lights_off():
+    return Solid(OFF)
+
+class Drops(Effect):
+    """Drops (or flakes) that step one LED along the strip every step_ms."""
+
+    def __init__(self, color, count, step_ms):
+        self.color = color
+        self.step_ms = step_ms
+        self.drops = ParticlePool(count)
+        for _ in range(count):
+            self.drops.spawn(random.randint(0, numpix - 1))
+        self.elapsed = step_ms  # Take the first step straight away
+
+    def update(self, dt):
+        self.elapsed += dt
+        pos = self.drops.pos
+        while self.elapsed >= self.step_ms:
+            self.elapsed -= self.step_ms
+            for i in range(self.drops.capacity):
+                pos[i] = (pos[i] + 1) % numpix
+
+    def render(self, px):
+        px.fill(OFF)
+        pos = self.drops.pos
+        for i in range(self.drops.capacity):
+            px.set_pixel(pos[i], self.color)
+
+class Thunderstorm(Effect):
+    """Rain, with a chance of a lightning flash every seven seconds."""
+
+    def __init__(self):
+        self.rain = rain()
+        self.elapsed = 0
+        self.flash = 0  # ms of lightning left
+
+    def update(self, dt):
+        if self.flash > 0:
+            self.flash -= dt
+            return
+        self.rain.update(dt)
+        self.elapsed += dt
+        if self.elapsed >= 7000:
+            self.elapsed = 0
+            if random.randint(0, 10) > 8:
+                self.flash = 100
+
+    def render(self, px):
+        if self.flash > 0:
+            px.fill(WHITE)
+        else:
+            self.rain.render(px)
+
+# Weather Actions
+# Compiled once: each condition id, day or night, maps to exactly one
+# action; anything not listed turns the lights off.
+RAIN = Action("rain", rain_position, rain)
+FOG = Action("fog", fog_position, fog_light)
+WEATHER_ACTIONS = ConditionTable([
+    (OWM_CLEAR, Action("sunny", sun_position, sunny), Action("moonlight", moon_position, moonlight)),
+    (OWM_SCATTERED_CLOUDS, Action("scattered clouds", clouds_position, scattered_clouds)),
+    (OWM_CLOUDY, Action("cloudy", cloudy_position, scattered_clouds)),
+    (OWM_SHOWERS, RAIN),
+    (OWM_LIGHT_RAIN, RAIN),
+    (OWM_THUNDERSTORM, Action("thunderstorm", thunderstorm_position, thunderstorm)),
+    (OWM_FOG, FOG),
+    (OWM_HAZE, FOG),
+    (OWM_SNOW, Action("snow", snow_position, snow)),
+], default=Action("off", None, lights_off))
 
 # Movement and Lighting
 
-def move():
-    global last_condition, first_weather_check
-    animation_duration_ms = 900000  # 15 minutes
-    start_time = ticks_ms()
-
-    if first_weather_check or last_condition != conditions:
-        if conditions in sunny_codes:
-            if night:
-                move_servo_slowly(moon_position)
-                moonlight(animation_duration_ms, start_time)
-            else:
-                move_servo_slowly(sun_position)
-                sunny(animation_duration_ms, start_time)
-        elif conditions in scatteredclouds:
-            move_servo_slowly(130)
-            scattered_clouds(animation_duration_ms, start_time)
-        elif conditions in cloudy:  # Add handling for cloudy (804)
-            move_servo_slowly(115)
-            scattered_clouds(animation_duration_ms, start_time)
-        elif conditions in showers or conditions in lightrain:
-            move_servo_slowly(105)
-            rain(animation_duration_ms, start_time)
-        elif conditions in thunderstorm_codes:
-            move_servo_slowly(105)
-            thunderstorm(animation_duration_ms, start_time)
-        elif conditions in fog or conditions in haze:
-            move_servo_slowly(72)
-            fog_light(animation_duration_ms, start_time)
-        elif conditions in snow_codes:
-            move_servo_slowly(70)
-            snow(animation_duration_ms, start_time)
-        else:
-            print("No matching condition, turning off lights.")
-            pixels.fill(OFF)
-            pixels.show()
+async def move():
+    global last_condition, last_night_status, first_weather_check
+    weather_changed.clear()
+
+    if first_weather_check or last_condition != conditions or last_night_status != night:
+        action = WEATHER_ACTIONS.lookup(conditions, night)
+        if action.pos is None:
+            log.info(M_NO_MATCH)
         last_condition = conditions
+        last_night_status = night
         first_weather_check = False
+        # The servo moves in its own task while the effect starts rendering
+        display(action.pos, action.effect(**action.params))
     else:
-        print("Condition unchanged, skipping movement.")
-# Servo Movement
-def move_servo_slowly(target_position):
-    global current_servo_position
-    step = 1
-    delay = servospeed
-    target_position = max(0, min(180, target_position))
-    if current_servo_position < target_position:
-        for pos in range(current_servo_position, target_position + 1, step):
-            servo(pos)
-            sleep(delay)
-            current_servo_position = pos
-    elif current_servo_position > target_position:
-        for pos in range(current_servo_position, target_position - 1, -step):
-            servo(pos)
-            sleep(delay)
-            current_servo_position = pos
+        log.info(M_SAME)
+    log.flush()
+    await weather_changed.wait()
 
 def servo(degrees):
     """Move the servo to a specific angle."""
-    degrees = max(0, min(180, degrees + servo_offset))
-    maxDuty = 1000
-    minDuty = 9000
-    newDuty = int(minDuty + (maxDuty - minDuty) * (degrees / 180))
-    servoPin.duty_u16(newDuty)
+    servoPin.duty_u16(servo_profile.duty(degrees + servo_offset))
+
+def release_servo():
+    """Stop the pulses once the servo has settled, so it doesn't jitter."""
+    servoPin.duty_u16(0)
+    if shown_weather is not None:
+        if render.running:
+            render.settled.post(display_state())  # On core 1: flash is written from core 0
+        else:
+            save_display(*display_state())  # Where to start from at the next boot
+
+# Servo Movement: eased moves run in the motion task while the lights
+# keep rendering; a newer target replaces a move still under way
+motion = ServoMotion(servo, release_servo, 0, ms_per_degree=int(servospeed * 1000), telemetry=telemetry)
+render = RenderCore(engine, motion)
+
+def display(position, effect):
+    """Move the servo and play an effect; with dual_core, core 1 does it."""
+    if render.running:
+        render.show(position, effect)
+        return
+    if position is not None:
+        motion.move_to(position)
+    if effect is not None:
+        engine.play(effect)
+
+async def save_settled():
+    """Dual core: save the display state core 1 settled on, from this core."""
+    while True:
+        save_display(*await render.settled.get())
+
+def display_idle():
+    """True when nothing on the display is moving."""
+    return engine.idle and not render.busy
+
+def display_state():
+    """What to put back after a deep sleep."""
+    return motion.position, engine.color, conditions, night
+
+power = PowerSaver(wlan, power_mode, display_idle, display_state)
+
+async def move_servo_slowly(target_position):
+    display(target_position, None)
+    while render.busy:
+        await asyncio.sleep_ms(motion.tick_ms)
 
 # Initial Servo Sweep
-def initial_servo_sweep():
+async def initial_servo_sweep():
     """Perform an initial sweep of the servo to set starting positions."""
-    print("Performing initial servo sweep...")
-    move_servo_slowly(sun_position)
-    sleep(5)
-    move_servo_slowly(moon_position)
-    sleep(5)
+    log.info(M_SWEEP)
+    await move_servo_slowly(sun_position)
+    await asyncio.sleep(5)
+    await move_servo_slowly(moon_position)
+    await asyncio.sleep(5)
+
+async def main():
+    """Run fetching and display side by side."""
+    link.survey()  # Any blocking scan before the display starts moving
+    asyncio.create_task(link.run())
+    asyncio.create_task(fetch_loop())
+    if dual_core:
+        power.mode = None
+        render.start()
+        log.info(M_DUAL_CORE)
+        asyncio.create_task(save_settled())
+    else:
+        asyncio.create_task(engine.run())
+        asyncio.create_task(motion.run())
+    if calibration_sweep or not restored:
+        await initial_servo_sweep()
+    if shown_weather is None:
+        await weather_changed.wait()
+    while True:
+        await move()  # Update servo position and lights based on conditions
 
 # Main Program
-initial_servo_sweep()
-
-try:
-    while True:
-        if connect():
-            get_conditions()  # Fetch weather conditions
-            move()            # Update servo position and lights based on conditions
-except KeyboardInterrupt:
-    print("Program stopped.")
+def restore():
+    """Show the last known weather straight away, before the network is up."""
+    global restored
+    if cache.load() is not None:
+        log.info(M_RESTORED)
+        show_conditions(cache.obs)
+    state = load_wake()
+    if state is not None:
+        log.info(M_WOKE)
+    else:
+        state = load_display()
+        if state is not None:
+            log.info(M_RESTORED_DISPLAY)
+    if state is not None:
+        # The servo is where it was left
+        angle, color, code, is_night = state
+        motion.position = motion.target = angle
+        engine.color = color
+        pixels.fill(color)
+        pixels.show()
+        show_conditions({"code": code, "night": is_night})
+        restored = True
+    if forecast_mode and forecast.load():
+        log.info(M_RESTORED_FORECAST)
+
+def run():
+    restore()
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        render.stop()
+        log.info(M_STOPPED)
+        log.flush()
+        telemetry.dump()
+
+# Importing the script (e.g. from host/run.py) sets it up without starting it
+if __name__ == "__main__":
+    run()
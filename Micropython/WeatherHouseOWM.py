@@ -1,13 +1,22 @@
 import time
-import network, usocket, utime, ntptime
-import machine
-from machine import Pin, PWM
-import urequests
+import network
+from machine import Pin, PWM, Timer
 from time import sleep
 from time import gmtime
 from neopixel import Neopixel
 import random
-from random import randint
+from jsonstream import project
+from httpclient import HttpClient
+from motion import ServoMotion
+from telemetry import Telemetry, CONNECT, FETCH
+from calibration import ServoProfile, PROFILE_FILE
+from logger import log
+from power import PowerSaver, load_wake, load_display, save_display
+from quota import Quota
+from supervisor import Backoff, CircuitBreaker, JoinCache, FAST_TIMEOUT_MS
+from conditions import (precipitation, Action, ConditionTable, OWM_CLEAR, OWM_SCATTERED_CLOUDS, OWM_CLOUDY, OWM_SHOWERS,
+                        OWM_LIGHT_RAIN, OWM_MODERATE_RAIN, OWM_HEAVY_RAIN, OWM_SNOW, OWM_HAZE, OWM_FOG,
+                        OWM_THUNDERSTORM)
 
 #Set Up Wifi Connection
 
@@ -16,40 +25,116 @@ password = 'YOURWIFIPASSWORD'
 
 #Set Open Weather Map API
 
+api_url = "https://api.openweathermap.org/data/2.5/onecall"
+# With several houses on one network, run proxy/weatherproxy.py and use
+# api_url = "http://<proxy address>:8080/data/2.5/onecall"
+http = HttpClient()
+telemetry = Telemetry()  # Connect and fetch times; telemetry.dump() prints them
+
+#Power Saving - None keeps the board awake. With "light" or "deep" the waits with a steady
+#display (sunny, and the 15 minutes between requests) are slept with Wi-Fi off, see power.py
+power_mode = None
+
+#Start-up - the servo starts from where it was left, kept in flash. Set calibration_sweep = True
+#to sweep the full servorange first instead, e.g. after moving the dial by hand
+calibration_sweep = False
+
+#API Quota - the most calls in any 24 hours (the free plan allows 1000), kept across reboots.
+#Checks come every 5 minutes while the weather is changing or wet, backing off to an hour when settled
+quota = Quota("quota.bin", 1000, 15 * 60 * 1000, 5 * 60 * 1000, 60 * 60 * 1000)
+
+#Retries - a failed Wi-Fi join is retried after about 2, 4, 8... seconds, up to 5 minutes.
+#After 3 failed API calls in a row the API is left alone for a minute, doubling while it stays down
+wifi_backoff = Backoff(max_ms=5 * 60 * 1000)
+breaker = CircuitBreaker(3, 60 * 1000)
+
+#Fast Rejoin - the access point and address of the last good connection are kept in wifi.bin and
+#tried first, skipping the scan and DHCP. For a static address use JoinCache("wifi.bin", ("ip", "netmask", "gateway", "dns"))
+join_cache = JoinCache("wifi.bin")
+
+#Log Messages - logged by number and printed by log.flush() before each 15 minute wait
+
+M_FETCH = log.message("Getting Data from Open Weather Map")
+M_CONDITIONS = log.message("Current Conditions = %s")
+M_TIME = log.message("Time = %s")
+M_HOUR = log.message("Hour = %s")
+M_NIGHT = log.message("Night = %s")
+M_CONNECT_WAIT = log.message("waiting for connection...")
+M_CONNECTED = log.message("connected")
+M_IP = log.message("ip = %s")
+M_TOPLIGHT_OFF = log.message("Top Light Off")
+M_TOPLIGHT_ON = log.message("Top Light On")
+M_TOPLIGHT_RAIN = log.message("Top Light Dimmed - Rain")
+M_STEP = log.message("%s step %s")
+M_NO_CONDITIONS = log.message("No conditions found")
+M_MOVING = log.message("Moving Servo to %s")
+M_WAITING = log.message("Waiting %s s for next data request")
+M_QUOTA = log.message("API budget used up - skipping this request")
+M_CONNECT_FAILED = log.message("connection failed (status %s)")
+M_RETRY = log.message("retrying connection in %s ms")
+M_FETCH_FAILED = log.message("Failed to get data: %s")
+M_PAUSED = log.message("Weather API paused - next call in %s s")
+M_CLOCK_FAILED = log.message("Failed to set clock: %s")
+
 def get_conditions():
     
     global hour
     global conditions
 
    
-    print ("Getting Data from Open Weather Map")
+    log.info(M_FETCH)
 
     api_key = "YOURAPIKEY"
     lat = "YOURLAT"
     lon = "YOURLONG"
-    url = "https://api.openweathermap.org/data/2.5/onecall?lat=%s&lon=%s&appid=%s&units=metric" % (lat, lon, api_key)
-    response = urequests.get(url)
-    data = response.json()
-    print(data)
-    conditions = int(data ["current"]["weather"][0]["id"])
-    print("Current Conditions = ", conditions)
+    url = "%s?lat=%s&lon=%s&appid=%s&units=metric&exclude=minutely,hourly,daily,alerts" % (api_url, lat, lon, api_key)
+    response = http.get(url)
+    if response.status != 200:
+        # e.g. 401 with the placeholder key: a failed call, counted by the breaker
+        response.close()
+        raise OSError("HTTP %d" % response.status)
+    weather_id, = project(response, (("current", "weather", 0, "id"),))
+    response.close()
+    if weather_id is None:
+        raise ValueError("no weather id in the response")
+    conditions = int(weather_id)
+    log.info(M_CONDITIONS, conditions)
     
 #Get time to determine if its night or day
 
-detailed_time = gmtime()
+hour = 0
+night = 0
+conditions = 0
+clock_synced = False
+
+def sync_clock():
+    # Night comes from the clock, so set it once from NTP (imported only here)
+    global clock_synced
+    if not clock_synced:
+        try:
+            import ntptime
+            ntptime.settime()
+            clock_synced = True
+        except Exception as e:
+            log.warning(M_CLOCK_FAILED, e)
+
+def get_night():
+
+    global hour
+    global night
 
-print (detailed_time)
+    sync_clock()
+    detailed_time = gmtime()
 
-global night
+    log.debug(M_TIME, detailed_time)
 
-hour = (detailed_time[3])
-print("Hour = ", hour)
-if hour >= 20 or hour <= 6:
-    night = 1
-    print ("Night = ", night)
-else:
-    night = 0
-    print ("Night = ", night)
+    hour = (detailed_time[3])
+    log.info(M_HOUR, hour)
+    if hour >= 20 or hour <= 6:
+        night = 1
+    else:
+        night = 0
+    log.info(M_NIGHT, night)
 
 # Set up Servo Speed and Range
 
@@ -62,32 +147,46 @@ servoPin.freq(50)
 
 servorange = 155
 
+# Duty curve and dial positions, from DefineAngles.py's calibrate mode if it has been run
+# Default is reversed (9000 duty at 0 degrees, 1000 at 180) to suit the servo setup
+servo_profile = ServoProfile.load(PROFILE_FILE, ((0, 2747), (180, 305)))
+
 wlan = network.WLAN(network.STA_IF)
 wlan.active(True)
 
 # Connect to Wifi
 
 def connect():
-    wlan.connect(ssid, password)
-    # Wait for connect or fail
-    max_wait = 10
-    while max_wait > 0:
-        if wlan.status() < 0 or wlan.status() >= 3:
-            break
-        max_wait -= 1
-        print('waiting for connection...')
-        time.sleep(1)
-
-# Handle connection error
-    if wlan.status() != 3:
-        raise RuntimeError('network connection failed')
-        sleep(5)
-        connect()
-    
-    else:
-        print('connected')
-        status = wlan.ifconfig()
-        print( 'ip = ' + status[0] )
+    if wlan.isconnected():
+        return True
+    wlan.active(True)  # Off after a power saving sleep
+    log.info(M_CONNECT_WAIT)
+    # Straight to the last access point first, then a full scan
+    for direct in (True, False):
+        if not join_cache.begin(wlan, ssid, password, direct):
+            continue
+        # Wait for connect or fail
+        max_wait = (FAST_TIMEOUT_MS if direct else 10000) // 100
+        while max_wait > 0:
+            if wlan.status() < 0 or wlan.status() >= 3:
+                break
+            max_wait -= 1
+            time.sleep_ms(100)
+
+        if wlan.status() == 3:
+            join_cache.joined(wlan, ssid, direct)
+            wifi_backoff.reset()
+            log.info(M_CONNECTED)
+            status = wlan.ifconfig()
+            log.info(M_IP, status[0])
+            return True
+        
+# Handle connection error - the caller waits wifi_backoff.next() and tries again
+        log.warning(M_CONNECT_FAILED, wlan.status())
+        wlan.disconnect()
+        if direct:
+            join_cache.missed()
+    return False
     
 #Set Up Neopixels
         
@@ -105,28 +204,40 @@ WHITE = (20, 20, 20,) #255 is full brightness - not recommended due to power dra
 GREEN = (0, 255, 0)
 BLUE = (0, 0, 255)
 YELLOW = (249, 215, 28)
+lit = OFF  #Steady colour on the strip, saved for the next boot - OFF while an effect animates
+
+def fill(color):
+    global lit
+    pixels.fill(color)
+    pixels.show()
+    lit = color
+
+#Palettes for the Precipitation Effects, built once rather than every frame
+RAIN_COLOURS = [(0, 0, 255), (0, 0, 200), (0, 0, 50),(0, 20, 100)]
+STORM_RAIN_COLOURS = [(0, 0, 255), (0, 0, 20), (0, 0, 50),(0, 20, 100)]
+SNOW_COLOURS = [(255, 255, 255), (50, 50, 50), (2, 20, 20),(125, 125, 125)]
+THUNDER_COLOURS = [(255, 255, 255), (255, 255, 200), (255, 255, 50),(255, 255, 0)]
 
 #Set up Single Neopixels for Top Light
 
 def iconlight():
     toplight.set_pixel(0, (0, 0, 0, 0))
     toplight.show()
-    print("Top Light Off")
+    log.info(M_TOPLIGHT_OFF)
     sleep(3)
     toplight.set_pixel(0, (0, 0, 0, 10))
     toplight.show()
-    print("Top Light On")
+    log.info(M_TOPLIGHT_ON)
     toplight.show()
 
 #Set Up Lights for Conditions
     
 def partly_cloudy():
     
-    pixels.fill((WHITE))
-    pixels.show()
+    fill(WHITE)
 
 
-def moving_clouds():
+def moving_clouds(color=(255, 255, 255), duration=30):
     for i in range(256):
         r = int(color[0] * i / 255)
         g = int(color[1] * i / 255)
@@ -139,7 +250,7 @@ def moving_clouds():
         pixels.show()
         sleep(duration / 256)
 
-def sun():
+def sun(color=(255, 255, 100), duration=30):
     for i in range(256):
         r = int(color[0] * i / 255)
         g = int(color[1] * i / 255)
@@ -168,7 +279,7 @@ def rain():
     toplight.set_pixel(0, (20, 20, 20, 0))
     toplight.show()
 
-    print("Top Light Dimmed - Rain")
+    log.info(M_TOPLIGHT_RAIN)
     toplight.show()
     pixels.set_pixel(6, (OFF))
     pixels.show()
@@ -179,8 +290,7 @@ def rain():
         pixelnum = random.randint(0, 8)
         bright = random.randint(10, 100)
         pixels.brightness(bright)
-        Rain = [(0, 0, 255), (0, 0, 200), (0, 0, 50),(0, 20, 100)]
-        pixels.set_pixel(pixelnum, (random.choice(Rain)))
+        pixels.set_pixel(pixelnum, (random.choice(RAIN_COLOURS)))
         pixels.set_pixel((pixelnum-1), (OFF))
         pixels.show()  
         sleep(random.uniform(.8, .2))
@@ -192,12 +302,11 @@ def snow():
         pixelnum = random.randint(0, 8)
         bright = random.randint(10, 100)
         pixels.brightness(bright)
-        Snow = [(255, 255, 255), (50, 50, 50), (2, 20, 20),(125, 125, 125)]
-        pixels.set_pixel(pixelnum, (random.choice(Snow)))
+        pixels.set_pixel(pixelnum, (random.choice(SNOW_COLOURS)))
         pixels.set_pixel((pixelnum-1), (OFF))
         pixels.show()  
         sleep(random.uniform(.8, .2))
-        print(n)
+        if __debug__: log.debug(M_STEP, "snow", n)  # Compiled out with mpy-cross -O1
         n = n+1
         
 def thunderstorm():
@@ -206,8 +315,7 @@ def thunderstorm():
   
     for i in range (random.randint(10, 100)):
         pixelnum = random.randint(0, 8)
-        Rain = [(0, 0, 255), (0, 0, 200), (0, 0, 50),(0, 20, 100)]
-        pixels.set_pixel(pixelnum, (random.choice(Rain)))
+        pixels.set_pixel(pixelnum, (random.choice(RAIN_COLOURS)))
         pixels.brightness(i)
         pixels.show()
         sleep(random.uniform(.05, .1))
@@ -215,16 +323,14 @@ def thunderstorm():
         pixels.show()
     for i in range (random.randint(10, 100) -1):
         pixelnum = random.randint(0, 8)
-        Rain = [(0, 0, 255), (0, 0, 20), (0, 0, 50),(0, 20, 100)]
-        pixels.set_pixel(pixelnum, (random.choice(Rain)))
+        pixels.set_pixel(pixelnum, (random.choice(STORM_RAIN_COLOURS)))
         pixels.brightness(i)
         sleep(random.uniform(.05, .1))
         pixels.set_pixel(pixelnum, (OFF))
         pixels.show()
     for i in range (random.randint(10, 100)):
         pixelnum = random.randint(0, 8)
-        Thunder = [(255, 255, 255), (255, 255, 200), (255, 255, 50),(255, 255, 0)]
-        pixels.set_pixel(pixelnum, (random.choice(Thunder)))
+        pixels.set_pixel(pixelnum, (random.choice(THUNDER_COLOURS)))
         pixels.brightness(i)
         pixels.show()
         sleep(random.uniform(.05, .1))
@@ -232,8 +338,7 @@ def thunderstorm():
         pixels.show()
     for i in range (random.randint(10, 100) -1):
         pixelnum = random.randint(0, 8)
-        Thunder = [(255, 255, 255), (255, 255, 200), (255, 255, 50),(255, 255, 0)]
-        pixels.set_pixel(pixelnum, (random.choice(Thunder)))
+        pixels.set_pixel(pixelnum, (random.choice(THUNDER_COLOURS)))
         pixels.brightness(i)
         sleep(random.uniform(.05, .1))
         pixels.set_pixel(pixelnum, (OFF))
@@ -243,153 +348,144 @@ def thunderstorm():
   
 def sunny():
     n = 0
-    pixels.fill((OFF))
-    pixels.show()
+    fill(OFF)
     sleep(2)
+    if power_mode:
+        # The same steady yellow, without waking every second to redraw it
+        fill(YELLOW)
+        rest(300)
+        return
     while n < 300:
-        pixels.fill((YELLOW))
-        pixels.show()
+        fill(YELLOW)
         sleep(1)
-        print(n)
+        if __debug__: log.debug(M_STEP, "sunny", n)  # Compiled out with mpy-cross -O1
         n = n+1
     
 
 
 def servo(degrees):
-    # limit degrees beteen 0 and 180
-    if degrees > 180: degrees=180
-    if degrees < 0: degrees=0
-    # set max and min duty
-    #Reverse order below to change direction according to servo setup
-    maxDuty=1000
-    minDuty=9000
-    
-    # new duty is between min and max duty in proportion to its value
-    newDuty=minDuty+(maxDuty-minDuty)*(degrees/180)
-    # servo PWM value is set
-    servoPin.duty_u16(int(newDuty))
+    # Angle to duty from the calibration table, limited to 0-180 degrees
+    servoPin.duty_u16(servo_profile.duty(degrees))
+
+
+def release_servo():
+    # Stop the pulses once the servo has settled so it doesn't jitter
+    servoPin.duty_u16(0)
+
+# Servo moves follow an eased path driven by a hardware timer, so they carry
+# on in the background while the lighting effects run
+motion = ServoMotion(servo, release_servo, 0, ms_per_degree=int(servospeed * 1000))
+motion.attach(Timer())
 
+def wait_for_servo():
+    while motion.busy:
+        sleep(0.05)
+
+# With power_mode set, waits sleep the board; a deep sleep keeps the servo position
+power = PowerSaver(wlan, power_mode, state=lambda: (motion.position, lit, conditions, night))
+
+def rest(seconds):
+    if power_mode:
+        wait_for_servo()  # The servo timer stops while the board sleeps
+        power.sleep(seconds * 1000)
+    else:
+        time.sleep(seconds)
 
 # First Sweep - Degree Range to be Edited According to Servo for Setup
 
-n= 0
-while n < servorange :
-    
-    servo(n)
-    sleep(servospeed)
-    n = n+1
-    
-sleep(5)    
-n = servorange
-while n >= 1 :
-  
-    servo(n)
-    sleep(servospeed)
-    n = n-1
-sleep(5)
+def first_sweep():
+    motion.move_to(servorange)
+    wait_for_servo()
+    sleep(5)
+    motion.move_to(1)
+    wait_for_servo()
+    sleep(5)
         
 # Set up Servo Position and Lighting for Conditions
+# Each condition id maps to exactly one action for day and one for night;
+# anything else turns the lights off
+
+pos = servo_profile.position
+WEATHER_ACTIONS = ConditionTable([
+    (OWM_CLEAR, Action("Sunny", pos("clear_day", 150), sunny), Action("Night Clear", pos("clear_night", 15), None)),
+    (OWM_SCATTERED_CLOUDS, Action("Scattered Clouds", pos("partly_cloudy_day", 130), moving_clouds),
+                           Action("Night Clouds", pos("partly_cloudy_night", 115), None)),
+    (OWM_CLOUDY, Action("Cloudy", pos("overcast", 115), partly_cloudy),
+                 Action("Night Clouds", pos("partly_cloudy_night", 115), None)),
+    (OWM_SHOWERS, Action("Showers", pos("rain_showers", 125), rain), Action("Showers", pos("rain_night", 30), None)),
+    (OWM_LIGHT_RAIN, Action("Light Rain", pos("slight_rain", 105), rain), None),
+    (OWM_MODERATE_RAIN, Action("Moderate Rain", pos("moderate_rain", 105), rain), None),
+    (OWM_HEAVY_RAIN, Action("Heavy Rain", pos("heavy_rain", 105), rain), None),
+    (OWM_SNOW, Action("Snow", pos("snow", 70), snow)),
+    (OWM_HAZE, Action("Haze", pos("fog", 68), None)),
+    (OWM_FOG, Action("Fog", pos("fog", 68), None)),
+    (OWM_THUNDERSTORM, Action("Thunderstorm", pos("thunderstorm", 105), thunderstorm)),
+])
 
 def move():
 
-# Code Ranges
-    
-    sunny = [800]
-    fewclouds = [801]    
-    scatteredclouds = [802,803]
-    cloudy =[804]
-    showers = [520,521,522,531]
-    lightrain = [300,301,302,310,311,312,313,314,321, 500]
-    moderaterain = [501]
-    heavyrain = [501,502,503,504]
-    thunderstorm = [200, 201, 202, 210, 211, 212, 221, 230, 231, 232]
-    snow = [600,601,602,611,612,613,615,616,620,622]
-    fog = [741]
-    haze = [701,721]
-
-    if conditions in sunny and night == 0:
-        servo(150)
-        sunny()
-        print("Moving Servo to Sunny")
-
-    if conditions in sunny and night == 1:
-        servo(15)
-        print("Moving Servo to Night Clear")
-
-    if conditions in scatteredclouds and night == 0:
-        servo(130)
-        moving_clouds()
-        print("Moving Servo to Scattered Clouds")
-
-    if conditions in cloudy and night == 1:
-        servo(115)
-        print("Moving Servo to Night Clouds")
-
-    if conditions in scatteredclouds and night == 1:
-        servo(115)
-        print("Moving Servo to Night Clouds")
-
-    if conditions in showers:
-        servo(30)
-        print("Moving Servo to Showers")
-
-    if conditions in cloudy and night == 0:
-        servo(115)
-        print("Moving Servo to Cloudy")
-        partly_cloudy()
-
-    if conditions in showers and night == 0:
-        servo(125)
-        rain()
-        print("Moving Servo to Showers")
-
-    if conditions in lightrain and night == 0:
-        servo(105)
-        rain()
-        print("Moving Servo to Light Rain")
-        
-    if conditions in moderaterain and night == 0:
-        servo(105)
-        rain()
-        print("Moving Servo to Light Rain")
-        
-    if conditions in heavyrain and night == 0:
-        servo(105)
-        rain()
-        print("Moving Servo to Light Rain")
-        
-    if conditions in snow:
-        servo(70)
-        snow()
-        print("Moving Servo to Snow")
-             
-    if conditions in haze:
-        servo(68)
-        print("Moving Servo to Haze")
-               
-    if conditions in fog:
-        servo(68)
-        print("Moving Servo to Fog")
-        
-        
-    if conditions in thunderstorm:
-        servo(105)
-        thunderstorm()
-        print("Moving Servo to Thunderstorm")
-
-    else:
-        pixels.fill(OFF)
-        pixels.show()
-        print("No conditions found")
+    global lit
+    action = WEATHER_ACTIONS.lookup(conditions, night)
+    if action is None:
+        fill(OFF)
+        log.info(M_NO_CONDITIONS)
+        return
+    motion.move_to(action.pos)
+    log.info(M_MOVING, action.name)
+    if action.effect is not None:
+        if action.effect not in (sunny, partly_cloudy):
+            lit = OFF  # Animated: nothing steady to put back
+        action.effect()
      
-while True:
-    connect()
-    iconlight()
-    get_conditions()
-    move()
-    
-    print("Waiting for next data request - Set for every 15 mins")
-    time.sleep(900) #time to wait, in seconds, before getting data again
-    
-else:
-    connect()
+def main():
+    global conditions, night, lit
+    state = load_wake() or load_display()
+    if state is None or calibration_sweep:
+        first_sweep()
+    else:
+        # The servo is where it was left, showing the last conditions and lights
+        motion.position = motion.target = state[0]
+        conditions, night = state[2], int(state[3])
+        fill(state[1])
+    while True:
+        mark = telemetry.start()
+        if not connect():
+            delay = wifi_backoff.next()
+            log.info(M_RETRY, delay)
+            log.flush()
+            time.sleep_ms(delay)
+            continue
+        telemetry.stop(CONNECT, mark)
+        iconlight()
+        get_night()
+        shown = (conditions, night)
+        mark = telemetry.start()
+        if not breaker.allow():
+            log.info(M_PAUSED, breaker.retry_in() // 1000)
+        elif not quota.take():
+            log.warning(M_QUOTA)
+        else:
+            try:
+                get_conditions()
+                breaker.success()
+            except (OSError, ValueError) as e:
+                if wlan.isconnected():
+                    breaker.failure()  # A call lost along with the Wi-Fi says nothing about the API
+                log.warning(M_FETCH_FAILED, e)
+        telemetry.stop(FETCH, mark)
+        telemetry.sample_heap()
+        move()
+
+        #Time to wait before getting data again: shorter while the weather is changing or wet
+        wait = quota.next_interval(shown != (conditions, night) or precipitation(conditions)) // 1000
+        log.info(M_WAITING, wait)
+        log.flush()
+        # Where to start from at the next boot, once the servo has got there: a
+        # move with no effect to play (night, fog) is still under way here
+        wait_for_servo()
+        save_display(motion.position, lit, conditions, night)
+        rest(wait)
+
+# Importing the script (e.g. from host/run.py) sets it up without starting it
+if __name__ == "__main__":
+    main()
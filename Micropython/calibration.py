@@ -0,0 +1,116 @@
+# Servo calibration profile, shared by all the scripts.
+# DefineAngles.py measures the pulse width at a few angles and the dial
+# position for each condition, and saves them to flash. At boot a script
+# loads the profile and turns the measured points into a 181-entry table of
+# duty_u16 values, so servo() is a table lookup rather than float maths.
+# Without a profile each script falls back to its own default curve.
+#
+# File layout (little endian):
+#   header    "<4sBBB"  magic, version, point count, position count
+#   points    "<BH"     angle, pulse width in microseconds (per point)
+#   positions "<B" name length, name, "<B" angle (per position)
+
+import struct
+from array import array
+
+from logger import log
+
+PROFILE_FILE = "servo_profile.bin"
+PERIOD_US = 20000  # 50 Hz servo frame
+
+# Dial positions that can be calibrated, shared by every script.
+POSITION_NAMES = (
+    "clear_day", "clear_night", "partly_cloudy_day", "partly_cloudy_night",
+    "overcast", "fog", "slight_rain", "rain_showers", "moderate_rain",
+    "heavy_rain", "rain_night", "thunderstorm", "snow",
+)
+
+_MAGIC = b"WHSV"
+_VERSION = 1
+_HEADER = "<4sBBB"
+_POINT = "<BH"
+_IGNORED = log.message("Ignoring servo profile: %s")
+
+
+def pulse_duty(pulse_us):
+    """A pulse width as a duty_u16 value."""
+    return (pulse_us * 65535 + PERIOD_US // 2) // PERIOD_US
+
+
+def fit(points):
+    """
+    Duty for every whole degree from measured ``(angle, pulse_us)`` points:
+    straight lines between neighbouring points, extended past the ends.
+    """
+    if len(points) < 2:
+        raise ValueError("need at least two points")
+    table = array("H", bytes(2 * 181))
+    seg = 0
+    for angle in range(181):
+        while seg < len(points) - 2 and angle > points[seg + 1][0]:
+            seg += 1
+        a0, p0 = points[seg]
+        a1, p1 = points[seg + 1]
+        # Pulse width times (a1 - a0), kept whole until the final rounding.
+        pulse = p0 * (a1 - a0) + (p1 - p0) * (angle - a0)
+        span = PERIOD_US * (a1 - a0)
+        table[angle] = max(0, min(65535, (pulse * 65535 + span // 2) // span))
+    return table
+
+
+class ServoProfile:
+    """Measured angle-to-pulse points, their duty table and dial positions."""
+
+    def __init__(self, points, positions=None, loaded=False):
+        self.points = sorted(points)
+        self.table = fit(self.points)
+        self.positions = positions if positions is not None else {}
+        self.loaded = loaded
+
+    def duty(self, degrees):
+        return self.table[max(0, min(180, degrees))]
+
+    def position(self, name, default):
+        """The calibrated angle for ``name``, or ``default`` if it has none."""
+        return self.positions.get(name, default)
+
+    def save(self, path=PROFILE_FILE):
+        names = [n for n in self.positions]
+        with open(path, "wb") as f:
+            f.write(struct.pack(_HEADER, _MAGIC, _VERSION, len(self.points), len(names)))
+            for angle, pulse_us in self.points:
+                f.write(struct.pack(_POINT, angle, pulse_us))
+            for name in names:
+                raw = name.encode()
+                f.write(bytes((len(raw),)) + raw + bytes((self.positions[name],)))
+
+    @classmethod
+    def load(cls, path=PROFILE_FILE, default_points=((0, 500), (180, 2500))):
+        """The profile saved at ``path``, or one built from ``default_points``."""
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            size = struct.calcsize(_HEADER)
+            if len(data) < size:
+                raise ValueError("short profile")
+            magic, version, n_points, n_positions = struct.unpack(_HEADER, data[:size])
+            if magic != _MAGIC or version != _VERSION:
+                raise ValueError("not a servo profile")
+            points = []
+            step = struct.calcsize(_POINT)
+            if len(data) < size + n_points * step:
+                raise ValueError("short profile")
+            i = size
+            for _ in range(n_points):
+                points.append(struct.unpack(_POINT, data[i:i + step]))
+                i += step
+            positions = {}
+            for _ in range(n_positions):
+                n = data[i]
+                positions[str(data[i + 1:i + 1 + n], "utf-8")] = data[i + 1 + n]
+                i += n + 2
+            return cls(points, positions, loaded=True)
+        except (OSError, ValueError, IndexError) as e:
+            if not isinstance(e, OSError):
+                log.warning(_IGNORED, e)
+            return cls(default_points)
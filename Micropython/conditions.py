@@ -0,0 +1,141 @@
+# Weather condition dispatch shared by the scripts.
+# The code groups for each provider's code space live here. Each script
+# pairs them with its own servo positions and effects in a list of rules,
+# and ConditionTable compiles the rules once, at import, into a flat index:
+# finding the action for (code, night) is then a single lookup, and every
+# code maps to exactly one action.
+#
+# convert() carries a code from one code space to the other, so a script
+# can take its conditions from either provider and keep one table.
+
+# --- WMO weather codes (Open-Meteo) ---
+WMO_CLEAR = (0, 1)
+WMO_PARTLY_CLOUDY = (2,)
+WMO_OVERCAST = (3,)
+WMO_FOG = (45, 48)
+WMO_SLIGHT_RAIN = (51, 61)
+WMO_RAIN_SHOWERS = (80, 81, 82)
+WMO_MODERATE_RAIN = (53, 63)
+WMO_HEAVY_RAIN = (55, 65)
+WMO_THUNDERSTORM = (95, 96, 99)
+WMO_SNOW = (71, 73, 75, 85, 86)
+
+# --- OpenWeatherMap condition ids ---
+OWM_CLEAR = (800,)
+OWM_FEW_CLOUDS = (801,)
+OWM_SCATTERED_CLOUDS = (802, 803)
+OWM_CLOUDY = (804,)
+OWM_SHOWERS = (520, 521, 522, 531)
+OWM_LIGHT_RAIN = (300, 301, 302, 310, 311, 312, 313, 314, 321, 500)
+OWM_MODERATE_RAIN = (501,)
+OWM_HEAVY_RAIN = (502, 503, 504)
+OWM_THUNDERSTORM = (200, 201, 202, 210, 211, 212, 221, 230, 231, 232)
+OWM_SNOW = (600, 601, 602, 611, 612, 613, 615, 616, 620, 622)
+OWM_FOG = (741,)
+OWM_HAZE = (701, 721)
+
+# --- Code spaces ---
+WMO = "wmo"
+OWM = "owm"
+
+# Nearest OpenWeatherMap id for each WMO code.
+_WMO_TO_OWM = {
+    0: 800, 1: 801, 2: 802, 3: 804, 45: 741, 48: 741,
+    51: 300, 53: 301, 55: 302, 56: 511, 57: 511,
+    61: 500, 63: 501, 65: 502, 66: 511, 67: 511,
+    71: 600, 73: 601, 75: 602, 77: 600,
+    80: 520, 81: 521, 82: 522, 85: 620, 86: 622,
+    95: 211, 96: 201, 99: 202,
+}
+
+# Nearest WMO code for each OpenWeatherMap id; ids not listed fall back to
+# their group in _OWM_GROUP_TO_WMO.
+_OWM_TO_WMO = {
+    300: 51, 310: 51, 301: 53, 311: 53, 313: 53, 321: 53, 302: 55, 312: 55, 314: 55,
+    500: 61, 501: 63, 502: 65, 503: 65, 504: 65, 511: 66,
+    520: 80, 521: 81, 522: 82, 531: 82,
+    600: 71, 601: 73, 602: 75, 611: 71, 612: 71, 613: 71, 615: 71, 616: 71, 620: 85, 621: 85, 622: 86,
+    701: 45, 721: 45, 741: 45,
+    800: 0, 801: 1, 802: 2, 803: 3, 804: 3,
+}
+_OWM_GROUP_TO_WMO = {2: 95, 3: 53, 5: 63, 6: 73, 7: 3, 8: 3}
+
+_NO_PARAMS = {}
+
+
+def precipitation(code):
+    """True for drizzle, rain, snow and thunderstorms, in either code space."""
+    return 51 <= code <= 99 or 200 <= code < 700
+
+
+def convert(code, source, target):
+    """``code`` from code space ``source`` (WMO or OWM) in ``target``; unknown codes pass through."""
+    if source == target:
+        return code
+    if target == OWM:
+        return _WMO_TO_OWM.get(code, code)
+    wmo = _OWM_TO_WMO.get(code)
+    if wmo is None:
+        return _OWM_GROUP_TO_WMO.get(code // 100, code)
+    return wmo
+
+
+class Action:
+    """What to show for a condition: a servo position and an effect."""
+
+    def __init__(self, name, pos, effect, params=None):
+        self.name = name
+        self.pos = pos
+        self.effect = effect
+        self.params = _NO_PARAMS if params is None else params
+
+
+class ConditionTable:
+    """
+    Compiled (code, night) -> Action lookup.
+
+    ``rules`` is a list of ``(codes, day_action)`` or
+    ``(codes, day_action, night_action)`` tuples; either action may be None,
+    which falls through to ``default``. A code listed in more than one rule
+    raises ValueError, so overlapping groups are caught at import.
+    """
+
+    def __init__(self, rules, default=None):
+        size = 0
+        for rule in rules:
+            for code in rule[0]:
+                if code >= size:
+                    size = code + 1
+        self.actions = [default]
+        # Slot 2 * code + night holds an index into actions; 0 is the default.
+        self.index = bytearray(2 * size)
+        seen = set()
+        for rule in rules:
+            day = rule[1]
+            night = rule[2] if len(rule) > 2 else day
+            day_slot = self._slot(day)
+            night_slot = self._slot(night)
+            for code in rule[0]:
+                if code in seen:
+                    raise ValueError(f"condition {code} is in more than one rule")
+                seen.add(code)
+                self.index[2 * code] = day_slot
+                self.index[2 * code + 1] = night_slot
+
+    def _slot(self, action):
+        if action is None:
+            return 0
+        for i, a in enumerate(self.actions):
+            if a is action:
+                return i
+        if len(self.actions) == 256:
+            raise ValueError("too many actions")
+        self.actions.append(action)
+        return len(self.actions) - 1
+
+    def lookup(self, code, night):
+        """The Action for ``code``, or the default if it isn't handled."""
+        i = 2 * code + (1 if night else 0)
+        if 0 <= i < len(self.index):
+            return self.actions[self.index[i]]
+        return self.actions[0]
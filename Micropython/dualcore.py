@@ -0,0 +1,142 @@
+# Two-core mode for the RP2040.
+# Normally one asyncio loop does everything, so while a fetch is resolving,
+# handshaking or parsing the LEDs and servo only get the CPU between its
+# awaits, and a long stretch without one shows as a dropped frame. Here
+# core 0 keeps the asyncio loop (Wi-Fi, fetches, parsing, flash) and
+# RenderCore runs the frame engine and the servo on core 1 in a plain
+# loop of its own: asyncio only runs on one core.
+#
+# What to show crosses over through a Mailbox: a single slot behind a
+# lock that is held only to swap a reference, so neither core ever waits
+# on the other for long. A message is the whole display state (servo
+# target and effect), not a change, so a newer one may simply replace one
+# core 1 hasn't picked up yet. Core 1 never touches the file system or the
+# network; anything for flash comes back to core 0 through a second
+# mailbox (``settled``).
+#
+# _thread is the same under CPython, so this runs on a PC with the
+# stand-ins in host/ as well (host/run.py --dual-core).
+
+import _thread
+from time import ticks_ms, ticks_diff, ticks_add, sleep_ms
+
+try:
+    import asyncio
+except ImportError:
+    import uasyncio as asyncio
+
+# Longest core 1 sleeps while nothing is animating, i.e. the most a new
+# message waits before it is picked up.
+_IDLE_MS = 20
+_POLL_MS = 250
+
+
+class Mailbox:
+    """One slot for the latest value; posting replaces one not yet taken."""
+
+    def __init__(self):
+        self._lock = _thread.allocate_lock()
+        self._value = None
+        self._full = False
+        self.posted = 0
+        self.replaced = 0  # Posted over before being taken
+
+    def post(self, value):
+        with self._lock:
+            if self._full:
+                self.replaced += 1
+            self._value = value
+            self._full = True
+            self.posted += 1
+
+    def take(self):
+        """The value posted since the last take(), or None."""
+        if not self._full:
+            return None  # Only take() empties the slot, so no lock needed to look
+        with self._lock:
+            value = self._value
+            self._value = None
+            self._full = False
+        return value
+
+    async def get(self, poll_ms=_POLL_MS):
+        """take() from asyncio on the other core: wait until there is a value."""
+        while True:
+            value = self.take()
+            if value is not None:
+                return value
+            await asyncio.sleep_ms(poll_ms)
+
+
+class RenderCore:
+    """
+    Runs ``engine`` (a FrameEngine) and ``motion`` (a ServoMotion) on the
+    second core once started. Only core 1 may touch them then: core 0
+    sends the display state with show().
+    """
+
+    def __init__(self, engine, motion):
+        self.engine = engine
+        self.motion = motion
+        self.mailbox = Mailbox()
+        self.settled = Mailbox()
+        self.running = False
+        self.loops = 0
+        self._finished = True
+        self._sent = 0
+        self._applied = 0
+
+    def show(self, position=None, effect=None):
+        """Move the servo to ``position`` and play ``effect``; None leaves either as it is."""
+        self._sent += 1
+        self.mailbox.post((self._sent, position, effect))
+
+    @property
+    def busy(self):
+        """True until core 1 has picked up the last show() and the servo has settled."""
+        return self._applied != self._sent or self.motion.busy
+
+    def start(self):
+        self.running = True
+        self._finished = False
+        _thread.start_new_thread(self._loop, ())
+
+    def stop(self, timeout_ms=1000):
+        """Ask core 1 to finish its loop, and wait up to ``timeout_ms`` for it to."""
+        self.running = False
+        deadline = ticks_add(ticks_ms(), timeout_ms)
+        while not self._finished and ticks_diff(deadline, ticks_ms()) > 0:
+            sleep_ms(1)
+
+    def _apply(self, message):
+        seq, position, effect = message
+        if position is not None and position != self.motion.target:
+            self.motion.move_to(position)
+        if effect is not None:
+            self.engine.play(effect)
+        self._applied = seq
+
+    def _loop(self):
+        engine = self.engine
+        motion = self.motion
+        mailbox = self.mailbox
+        servo_due = ticks_ms()
+        while self.running:
+            self.loops += 1
+            message = mailbox.take()
+            if message is not None:
+                self._apply(message)
+            wait = _IDLE_MS
+            if motion.busy:
+                if ticks_diff(servo_due, ticks_ms()) <= 0:
+                    motion.step()
+                    servo_due = ticks_add(servo_due, motion.tick_ms)
+                wait = min(wait, ticks_diff(servo_due, ticks_ms()))
+            else:
+                servo_due = ticks_ms()  # A new move's first step is taken at once
+            frame_wait = engine.frame()
+            if frame_wait is not None and frame_wait < wait:
+                wait = frame_wait
+            if wait > 0:
+                sleep_ms(wait)
+        self._finished = True
@@ -0,0 +1,133 @@
+# Hourly forecast, fetched every few hours and played back locally.
+# One call to Open-Meteo or OpenWeatherMap returns the weather code and
+# day/night flag for the next two days; those are kept as packed hourly
+# records (wxrecord), in memory and on flash, so the display can step
+# through the hours without going back to the network, and keeps going
+# while offline.
+
+import os
+import struct
+
+from jsonstream import project
+from logger import log
+from wxrecord import SIZE, unix_now, pack_into, time_of, code_of, is_day
+
+HOUR = 3600
+
+# magic, fetched (unix time), hours; the records follow.
+_MAGIC = b"WXF1"
+_HEADER = "<4sIH"
+_HEADER_SIZE = struct.calcsize(_HEADER)
+
+_WRITE_FAILED = log.message("Failed to write forecast: %s")
+
+OPEN_METEO_FIELDS = (("hourly", "time", 0), ("hourly", "weathercode"), ("hourly", "is_day"))
+OWM_FIELDS = (("hourly", 0, "dt"), ("hourly", "*", "weather", 0, "id"), ("hourly", "*", "weather", 0, "icon"))
+
+
+def from_open_meteo(values):
+    """Forecast arrays from the values projected with OPEN_METEO_FIELDS."""
+    start, codes, is_day = values
+    if start is None or not codes:
+        raise ValueError("no hourly forecast in response")
+    return start, codes, is_day
+
+
+def from_owm(values):
+    """Forecast arrays from the values projected with OWM_FIELDS."""
+    start, codes, icons = values
+    if start is None or not codes:
+        raise ValueError("no hourly forecast in response")
+    # OWM has no is_day; the icon name ends in 'd' or 'n' (day if it is missing).
+    return start, codes, [0 if icon and icon.endswith("n") else 1 for icon in icons]
+
+
+def parse_open_meteo(stream, buf=None):
+    """Read an Open-Meteo ``hourly=weathercode,is_day&timeformat=unixtime`` response."""
+    return from_open_meteo(project(stream, OPEN_METEO_FIELDS, buf))
+
+
+def parse_owm(stream, buf=None):
+    """Read an OpenWeatherMap One Call response with the ``hourly`` block."""
+    return from_owm(project(stream, OWM_FIELDS, buf))
+
+
+class Forecast:
+    """Hourly forecast records starting at ``start`` (unix time)."""
+
+    def __init__(self, path, refresh_s, hours=48):
+        self.path = path
+        self.refresh_s = refresh_s
+        self.start = 0
+        self.fetched = 0
+        self.hours = 0
+        # Sized for two days; set() grows it if a provider sends more.
+        self.records = bytearray(hours * SIZE)
+
+    def _reserve(self, hours):
+        if hours * SIZE > len(self.records):
+            self.records = bytearray(hours * SIZE)
+
+    def set(self, start, codes, is_day):
+        hours = min(len(codes), len(is_day))
+        self._reserve(hours)
+        start = int(start)
+        for i in range(hours):
+            pack_into(self.records, i, start + i * HOUR, codes[i], is_day[i])
+        self.set_records(hours)
+
+    def set_records(self, hours):
+        """Use the first ``hours`` records of ``records``, e.g. read there straight from a proxy."""
+        self.hours = hours
+        self.start = time_of(self.records) if hours else 0
+        self.fetched = unix_now()
+        self.save()
+
+    def due(self):
+        """True when the forecast should be fetched again."""
+        now = unix_now()
+        return (not self.hours or now - self.fetched >= self.refresh_s
+                or now < self.fetched)
+
+    def lookup(self, now=None):
+        """Return ``(code, night)`` for the current hour, or None if it is not covered."""
+        if now is None:
+            now = unix_now()
+        i = (now - self.start) // HOUR
+        if i < 0 or i >= self.hours:
+            return None
+        return code_of(self.records, i), not is_day(self.records, i)
+
+    def hours_left(self, now=None):
+        if now is None:
+            now = unix_now()
+        return max(0, self.hours - (now - self.start) // HOUR)
+
+    def save(self):
+        tmp = self.path + ".tmp"
+        try:
+            with open(tmp, "wb") as f:
+                f.write(struct.pack(_HEADER, _MAGIC, self.fetched, self.hours))
+                f.write(memoryview(self.records)[:self.hours * SIZE])
+            os.rename(tmp, self.path)
+        except OSError as e:
+            log.warning(_WRITE_FAILED, e)
+
+    def load(self):
+        """Read the stored forecast from flash; returns True if one was found."""
+        try:
+            with open(self.path, "rb") as f:
+                header = f.read(_HEADER_SIZE)
+                if len(header) != _HEADER_SIZE:
+                    return False
+                magic, fetched, hours = struct.unpack(_HEADER, header)
+                if magic != _MAGIC:
+                    return False
+                self._reserve(hours)
+                if f.readinto(memoryview(self.records)[:hours * SIZE]) != hours * SIZE:
+                    return False
+        except (OSError, ValueError):
+            return False
+        self.fetched, self.hours = fetched, hours
+        self.start = time_of(self.records) if hours else 0
+        return True
@@ -0,0 +1,189 @@
+# Fixed-timestep frame engine for the LED effects.
+# Effects are objects with update(dt_ms) and render(px). The engine runs
+# update() in fixed steps and render() once per frame against ticks_ms()
+# deadlines, so animation speed no longer drifts with CPU load. A frame
+# that overruns is not rendered late: the missed steps are caught up
+# (at most MAX_CATCH_UP) and the schedule moves on. Between frames, and
+# while an effect is static, the task sleeps. frame() renders one frame
+# without asyncio, for a loop of its own on the second core (dualcore.py).
+#
+# Colour maths is integer fixed point (the RP2040 has no FPU): brightness
+# levels run from 0 to ONE, and scale() multiplies a colour by one.
+
+from time import ticks_ms, ticks_us, ticks_diff, ticks_add
+from array import array
+from telemetry import FADE, FRAME
+
+try:
+    import asyncio
+except ImportError:
+    import uasyncio as asyncio
+
+# Most update() steps run to catch up after an overrun.
+MAX_CATCH_UP = 5
+
+# Full brightness in fixed point.
+ONE = 256
+SHIFT = 8
+
+# Perceptual intensity (0..ONE) to LED intensity (0..ONE), for effects whose
+# brightness ramps up and down; built once at import.
+GAMMA_EXPONENT = 2.2
+GAMMA = array("H", (int((i / ONE) ** GAMMA_EXPONENT * ONE + 0.5) for i in range(ONE + 1)))
+
+
+def level(fraction):
+    """A 0.0-1.0 brightness setting as a fixed-point level."""
+    return int(fraction * ONE + 0.5)
+
+
+def scale(color, lvl):
+    """``color`` scaled by the fixed-point level ``lvl``."""
+    return ((color[0] * lvl) >> SHIFT, (color[1] * lvl) >> SHIFT, (color[2] * lvl) >> SHIFT)
+
+
+class Effect:
+    """
+    Base effect. ``start`` is called when the engine picks the effect up;
+    ``static`` becomes True once rendering would no longer change anything.
+    """
+
+    static = False
+
+    def start(self, engine):
+        self.engine = engine
+
+    def update(self, dt):
+        pass
+
+    def render(self, px):
+        pass
+
+
+class Solid(Effect):
+    """A steady colour."""
+
+    static = True
+
+    def __init__(self, color):
+        self.color = color
+
+    def render(self, px):
+        px.fill(self.color)
+        self.engine.color = self.color
+
+
+class Fade(Effect):
+    """Fade from whatever colour the strip shows now to ``color``, then hold it."""
+
+    def __init__(self, color, duration_ms=500):
+        self.color = color
+        self.duration_ms = duration_ms
+
+    def start(self, engine):
+        self.engine = engine
+        self.start_color = engine.color
+        self.elapsed = 0
+        self.static = not self.duration_ms
+
+    def update(self, dt):
+        self.elapsed += dt
+        if self.elapsed >= self.duration_ms:
+            self.elapsed = self.duration_ms
+            self.static = True
+
+    def render(self, px):
+        s = self.start_color
+        t = self.color
+        if self.static:
+            color = t
+        else:
+            f = (self.elapsed << SHIFT) // self.duration_ms
+            color = (s[0] + (((t[0] - s[0]) * f) >> SHIFT),
+                     s[1] + (((t[1] - s[1]) * f) >> SHIFT),
+                     s[2] + (((t[2] - s[2]) * f) >> SHIFT))
+        px.fill(color)
+        self.engine.color = color
+
+
+class FrameEngine:
+    """
+    Drives the current effect at ``fps`` frames per second. With
+    ``telemetry``, each frame's time goes to its FADE or FRAME stage.
+    """
+
+    def __init__(self, px, fps, telemetry=None):
+        self.px = px
+        self.telemetry = telemetry
+        self.period = 1000 // fps
+        self.effect = None
+        self.color = (0, 0, 0)   # Last solid colour shown, where fades start from
+        self.frames = 0
+        self.overruns = 0
+        self.skipped = 0
+        self._held = None
+        self._deadline = None
+        self._wake = asyncio.Event()
+
+    @property
+    def idle(self):
+        """True once the effect playing is static and its last frame is shown."""
+        return self.effect is not None and self.effect is self._held
+
+    def play(self, effect):
+        """Switch to ``effect``; it is rendered from the next frame on."""
+        effect.start(self)
+        self.effect = effect
+        self._wake.set()
+
+    def frame(self):
+        """
+        Render a frame if one is due. Returns the ms until the next one is
+        due, or None while there is nothing to animate.
+        """
+        effect = self.effect
+        if effect is None or effect is self._held:
+            self._deadline = None
+            return None
+        if self._deadline is None:
+            self._deadline = ticks_ms()  # Starting again after a rest
+        wait = ticks_diff(self._deadline, ticks_ms())
+        if wait > 0:
+            return wait
+        telemetry = self.telemetry
+        stage = FADE if isinstance(effect, Fade) else FRAME
+        started = ticks_us()
+        steps = 1
+        late = -wait
+        if late >= self.period:
+            missed = late // self.period
+            self.overruns += 1
+            self.skipped += missed
+            steps += min(missed, MAX_CATCH_UP)
+            self._deadline = ticks_add(self._deadline, missed * self.period)
+            if telemetry is not None:
+                telemetry.overrun(stage, missed)
+        for _ in range(steps):
+            effect.update(self.period)
+        effect.render(self.px)
+        self.px.show()
+        self.frames += 1
+        if telemetry is not None:
+            telemetry.stop(stage, started)
+            if not self.frames & 63:
+                telemetry.sample_heap()
+        if effect.static:
+            self._held = effect
+        self._deadline = ticks_add(self._deadline, self.period)
+        wait = ticks_diff(self._deadline, ticks_ms())
+        return wait if wait > 0 else 0
+
+    async def run(self):
+        while True:
+            wait = self.frame()
+            if wait is None:
+                # Nothing moving: sleep until play() is called.
+                self._wake.clear()
+                await self._wake.wait()
+            else:
+                await asyncio.sleep_ms(wait)
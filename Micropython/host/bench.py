@@ -0,0 +1,454 @@
+"""
+Benchmarks for the hot paths: LED effects, condition dispatch, servo duty
+and response parsing. Runs under CPython with the stand-ins in this folder,
+and under MicroPython's unix port:
+
+    python3 Micropython/host/bench.py --out bench.json
+    micropython Micropython/host/bench.py --out bench-mpy.json
+    python3 Micropython/host/bench.py --baseline bench.json
+
+Results are written as JSON. With --baseline, each metric is compared with
+the same metric in an earlier result file, and the run exits with status 1
+if any got worse by more than its tolerance in bench_thresholds.json (which
+also holds absolute limits).
+
+Times are in microseconds. Each case is run enough times in a row to take
+at least MIN_RUN_US, right after a run of a fixed reference loop, and the
+median of --repeat such pairs is kept as a multiple of the reference, so
+a machine that speeds up or slows down part way through doesn't skew it.
+The figures are given at the run's median reference speed, and baseline
+times are scaled by how fast the reference ran then and now. Memory is
+"alloc_bytes" (bytes allocated with gc off; per frame for effects) on
+MicroPython and "peak_bytes" (tracemalloc peak over the run) on
+CPython, so compare like with like.
+"""
+
+import gc
+import io
+import json
+import sys
+
+# No os.path on the unix port.
+_file = __file__.replace("\\", "/")
+HOST = _file.rsplit("/", 1)[0] if "/" in _file else "."
+sys.path[:0] = [HOST, HOST + "/.."]
+
+MICROPYTHON = sys.implementation.name == "micropython"
+
+if MICROPYTHON:
+    tracemalloc = None
+else:
+    import tracemalloc
+
+    import hostenv  # noqa: F401  (ticks_us and friends)
+
+from time import ticks_us, ticks_diff  # noqa: E402
+
+THRESHOLDS_FILE = HOST + "/bench_thresholds.json"
+FRAMES = 500
+# Shortest timed run: cases quicker than this are repeated back to back.
+MIN_RUN_US = 20000
+
+
+class _Namespace:
+    def __init__(self, names):
+        for k in names:
+            setattr(self, k, names[k])
+
+
+def _standin(name, attr):
+    # The unix port has its own machine module without PWM; put ours in its place.
+    try:
+        if hasattr(__import__(name), attr):
+            return
+    except ImportError:
+        pass
+    names = {"__name__": name}
+    with open(HOST + "/" + name + ".py") as f:
+        exec(f.read(), names)
+    sys.modules[name] = _Namespace(names)
+
+
+def _timed_run(fn, loops):
+    gc.collect()
+    t = ticks_us()
+    for _ in range(loops):
+        fn()
+    return ticks_diff(ticks_us(), t)
+
+
+def _loops(fn):
+    # Calls of ``fn`` it takes to fill MIN_RUN_US.
+    loops = 1
+    while _timed_run(fn, loops) < MIN_RUN_US:
+        loops *= 2
+    return loops
+
+
+def _median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+# Reference loop calls per run and median us per call; set by bench_reference().
+_reference = None
+
+
+def measure(fn, repeat):
+    """
+    (median time in us, memory in bytes) for one ``fn()``; see the module
+    doc for how each is taken.
+    """
+    loops = _loops(fn)
+    if _reference is None:
+        median = _median(_timed_run(fn, loops) / loops for _ in range(repeat))
+    else:
+        ref_loops, ref_us = _reference
+        ratios = []
+        for _ in range(repeat):
+            ref = _timed_run(_reference_loop, ref_loops) / ref_loops
+            ratios.append(_timed_run(fn, loops) / loops / ref)
+        median = _median(ratios) * ref_us
+    gc.collect()
+    if MICROPYTHON:
+        gc.disable()
+        before = gc.mem_alloc()
+        fn()
+        used = gc.mem_alloc() - before
+        gc.enable()
+    else:
+        tracemalloc.start()
+        base = tracemalloc.get_traced_memory()[0]
+        fn()
+        used = tracemalloc.get_traced_memory()[1] - base
+        tracemalloc.stop()
+    return median, used
+
+
+def _memory_key():
+    return "alloc_bytes" if MICROPYTHON else "peak_bytes"
+
+
+def _reference_loop(n=20000):
+    # Plain integer work, the same on every build: a yardstick for this machine's speed.
+    x = 0
+    for i in range(n):
+        x = (x + i * 7) & 0xFFFF
+    return x
+
+
+def bench_reference(repeat):
+    global _reference
+    _reference = None
+    us, mem = measure(_reference_loop, repeat)
+    _reference = (_loops(_reference_loop), us)
+    return {"reference.us": us}
+
+
+# --- Effects ---
+
+def bench_effects(om, repeat):
+    from frames import Fade
+
+    engine = om.engine
+    px = om.pixels
+    period = engine.period
+    out = {}
+
+    def frames(make):
+        # Built once, outside the measurement: only the frames are counted.
+        effect = make()
+        effect.start(engine)
+        update, render = effect.update, effect.render
+
+        def run():
+            for _ in range(FRAMES):
+                update(period)
+                render(px)
+        return run
+
+    def fade():
+        # A fade lasts duration_ms; start a new one each time it settles.
+        effect = None
+        for _ in range(FRAMES):
+            if effect is None or effect.static:
+                engine.color = (0, 0, 0)
+                effect = Fade(om.SUN_COLOR)
+                effect.start(engine)
+            effect.update(period)
+            effect.render(px)
+
+    om.random.seed(1)
+    cases = (
+        ("rain", frames(lambda: om.rain_effect(speed=0.5))),
+        ("snow", frames(om.snow_effect)),
+        ("thunderstorm", frames(om.thunderstorm_effect)),
+        ("fade", fade),
+    )
+    for name, fn in cases:
+        om.random.seed(1)
+        us, mem = measure(fn, repeat)
+        out["effect.%s.us_per_frame" % name] = us / FRAMES
+        out["effect.%s.fps" % name] = FRAMES * 1000000 / max(us, 1)
+        if MICROPYTHON:
+            out["effect.%s.alloc_bytes_per_frame" % name] = mem / FRAMES
+        else:
+            out["effect.%s.peak_bytes" % name] = mem
+    return out
+
+
+# --- Dispatch and servo ---
+
+def bench_dispatch(tables, repeat, rounds=50):
+    out = {}
+    for name, table, codes in tables:
+        lookup = table.lookup
+
+        def run():
+            for _ in range(rounds):
+                for code in codes:
+                    lookup(code, False)
+                    lookup(code, True)
+
+        us, mem = measure(run, repeat)
+        out["dispatch.%s.us" % name] = us / (rounds * 2 * len(codes))
+    return out
+
+
+def bench_servo(module, repeat, rounds=20):
+    servo = module.servo
+    history = getattr(module.servoPin, "history", None)
+
+    def run():
+        for _ in range(rounds):
+            for d in range(181):
+                servo(d)
+        if history is not None:
+            # The stand-in PWM records every write; keep it from growing.
+            del history[:]
+
+    us, mem = measure(run, repeat)
+    return {"servo.duty.us": us / (rounds * 181)}
+
+
+# --- Parsing ---
+
+def _dumps(doc):
+    return json.dumps(doc).encode()
+
+
+def _with(doc, **fields):
+    doc = dict(doc)
+    doc.update(fields)
+    return doc
+
+
+def payloads(start=1758844800):
+    """Response bodies the size of real ones, as bytes, with the paths each script reads."""
+    from forecast import OPEN_METEO_FIELDS, OWM_FIELDS
+
+    weather = {"id": 500, "main": "Rain", "description": "light rain", "icon": "10d"}
+    conditions = {"temp": 14.2, "feels_like": 13.8, "pressure": 1012, "humidity": 82, "dew_point": 11.2,
+                  "uvi": 0.8, "clouds": 75, "visibility": 10000, "wind_speed": 4.6, "wind_deg": 240,
+                  "wind_gust": 8.1, "weather": [weather]}
+    current = _with(conditions, dt=start, sunrise=start - 21600, sunset=start + 21600)
+    hourly = [_with(conditions, dt=start + h * 3600, pop=0.4) for h in range(48)]
+    daily = [{"dt": start + d * 86400, "sunrise": start + d * 86400 - 21600,
+              "sunset": start + d * 86400 + 21600, "moonrise": start, "moonset": start, "moon_phase": 0.5,
+              "summary": "Expect a day of partly cloudy with rain",
+              "temp": {"day": 15.1, "min": 9.2, "max": 16.0, "night": 10.1, "eve": 13.4, "morn": 9.8},
+              "feels_like": {"day": 14.6, "night": 9.5, "eve": 12.9, "morn": 8.9},
+              "pressure": 1012, "humidity": 80, "dew_point": 11.0, "wind_speed": 5.1, "wind_deg": 230,
+              "wind_gust": 9.8, "weather": [weather], "clouds": 75, "pop": 0.6, "rain": 2.1, "uvi": 1.9}
+             for d in range(8)]
+    minutely = [{"dt": start + m * 60, "precipitation": 0.2} for m in range(61)]
+    owm_head = {"lat": 52.6292, "lon": 0.4925, "timezone": "Europe/London", "timezone_offset": 3600}
+    om_head = {"latitude": 52.62, "longitude": 0.5, "generationtime_ms": 0.05, "utc_offset_seconds": 0,
+               "timezone": "GMT", "timezone_abbreviation": "GMT", "elevation": 4.0}
+    return (
+        ("open_meteo_current",
+         _dumps(_with(om_head,
+                      current_weather_units={"time": "iso8601", "interval": "seconds", "temperature": "°C",
+                                             "windspeed": "km/h", "winddirection": "°", "is_day": "",
+                                             "weathercode": "wmo code"},
+                      current_weather={"time": "2025-09-26T12:00", "interval": 900, "temperature": 14.2,
+                                       "windspeed": 11.0, "winddirection": 240, "is_day": 1,
+                                       "weathercode": 61})),
+         (("current_weather", "weathercode"), ("current_weather", "is_day"))),
+        ("open_meteo_hourly",
+         _dumps(_with(om_head,
+                      hourly_units={"time": "unixtime", "weathercode": "wmo code", "is_day": ""},
+                      hourly={"time": [start + h * 3600 for h in range(48)],
+                              "weathercode": [(0, 2, 3, 61, 63, 95)[h % 6] for h in range(48)],
+                              "is_day": [1 if 7 <= h % 24 < 19 else 0 for h in range(48)]})),
+         OPEN_METEO_FIELDS),
+        ("owm_current",
+         _dumps(_with(owm_head, current=current)),
+         (("current", "weather", 0, "id"), ("current", "dt"), ("current", "sunrise"), ("current", "sunset"))),
+        ("owm_onecall",
+         _dumps(_with(owm_head, current=current, minutely=minutely, hourly=hourly, daily=daily)),
+         OWM_FIELDS),
+    )
+
+
+def bench_parse(repeat):
+    from jsonstream import project
+
+    buf = bytearray(256)  # The scripts' parse_buf
+    out = {}
+    for name, body, paths in payloads():
+        def run():
+            project(io.BytesIO(body), paths, buf)
+
+        us, mem = measure(run, repeat)
+        out["parse.%s.us" % name] = us
+        out["parse.%s.%s" % (name, _memory_key())] = mem
+        out["parse.%s.size_bytes" % name] = len(body)
+
+    # The same answers as the proxy's packed records, read field by field.
+    import wxrecord
+
+    for name, hours in (("record_current", 1), ("record_hourly", 48)):
+        records = bytearray(hours * wxrecord.SIZE)
+        for h in range(hours):
+            wxrecord.pack_into(records, h, 1758844800 + h * 3600, 61, h % 24 < 19, 0, 0, 14.2, 0.4)
+
+        def run():
+            for h in range(hours):
+                wxrecord.code_of(records, h)
+                wxrecord.is_day(records, h)
+
+        us, mem = measure(run, repeat)
+        out["parse.%s.us" % name] = us
+        out["parse.%s.%s" % (name, _memory_key())] = mem
+        out["parse.%s.size_bytes" % name] = len(records)
+    return out
+
+
+# --- Thresholds ---
+
+def _tolerance(name, config, base=None):
+    best, tol = -1, config.get("tolerance", 0.25)
+    for pattern, value in config.get("tolerances", {}).items():
+        prefix = pattern[:-1] if pattern.endswith("*") else pattern
+        if (name == pattern or (pattern.endswith("*") and name.startswith(prefix))) and len(prefix) > best:
+            best, tol = len(prefix), value
+    # Times of a few microseconds jitter by more than a real regression
+    # would add, so they get at least the wider "small_tolerance".
+    if base is not None and _timed(name) and not name.endswith(".fps") and base < config.get("small_us", 0):
+        tol = max(tol, config.get("small_tolerance", tol))
+    return tol
+
+
+def _timed(name):
+    return name.endswith(".us") or name.endswith(".us_per_frame") or name.endswith(".fps")
+
+
+def _worse(name, value, limit):
+    # Frame rates are better high; everything else is better low.
+    return value < limit if name.endswith(".fps") else value > limit
+
+
+def check(metrics, baseline, config):
+    """Names and descriptions of metrics that regressed or broke a limit."""
+    failures = []
+    # Times are compared relative to the reference loop, so a machine that
+    # is busier or clocked lower than when the baseline was taken still passes.
+    speed = 1.0
+    if baseline is not None and baseline.get("reference.us") and metrics.get("reference.us"):
+        speed = metrics["reference.us"] / baseline["reference.us"]
+    for name, value in sorted(metrics.items()):
+        if name.endswith(".size_bytes") or name == "reference.us":
+            continue
+        if baseline is not None and name in baseline:
+            base = baseline[name]
+            tol = _tolerance(name, config, base)
+            if _timed(name):
+                base = base / speed if name.endswith(".fps") else base * speed
+            limit = base * (1 - tol) if name.endswith(".fps") else base * (1 + tol)
+            if _worse(name, value, limit):
+                failures.append("%s: %.3f vs baseline %.3f at this speed (tolerance %d%%)"
+                            % (name, value, base, tol * 100))
+        limit = config.get("limits", {}).get(name)
+        if limit is not None and _worse(name, value, limit):
+            failures.append("%s: %.3f breaks the limit of %.3f" % (name, value, limit))
+    return failures
+
+
+def _load_json(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def _implementation():
+    impl = sys.implementation
+    return "%s %s" % (impl.name, ".".join(str(v) for v in impl.version[:3]))
+
+
+def run_all(repeat=9):
+    _standin("machine", "PWM")
+    import OpenMetroVr as om
+    import UpdatedOWMWeatherHouse as owm
+    import WeatherHouseOWM as owm_blocking
+    from conditions import (WMO_CLEAR, WMO_PARTLY_CLOUDY, WMO_OVERCAST, WMO_FOG, WMO_SLIGHT_RAIN,
+                            WMO_RAIN_SHOWERS, WMO_MODERATE_RAIN, WMO_HEAVY_RAIN, WMO_THUNDERSTORM,
+                            WMO_SNOW)
+
+    wmo = []
+    for group in (WMO_CLEAR, WMO_PARTLY_CLOUDY, WMO_OVERCAST, WMO_FOG, WMO_SLIGHT_RAIN, WMO_RAIN_SHOWERS,
+                  WMO_MODERATE_RAIN, WMO_HEAVY_RAIN, WMO_THUNDERSTORM, WMO_SNOW):
+        wmo.extend(group)
+    owm_codes = [200, 211, 300, 500, 501, 502, 520, 600, 701, 741, 800, 801, 802, 803, 804, 999]
+    metrics = bench_reference(repeat)
+    metrics.update(bench_effects(om, repeat))
+    metrics.update(bench_dispatch((
+        ("open_meteo", om.WEATHER_ACTIONS, wmo + [7, 99]),
+        ("owm", owm.WEATHER_ACTIONS, owm_codes),
+        ("owm_blocking", owm_blocking.WEATHER_ACTIONS, owm_codes),
+    ), repeat))
+    metrics.update(bench_servo(om, repeat))
+    metrics.update(bench_parse(repeat))
+    return metrics
+
+
+def _arg(argv, flag, default=None):
+    if flag in argv:
+        return argv[argv.index(flag) + 1]
+    return default
+
+
+def main(argv=None):
+    # Hand-rolled options: the unix port has no argparse.
+    argv = sys.argv[1:] if argv is None else argv
+    if "-h" in argv or "--help" in argv:
+        print(__doc__)
+        print("options: --out FILE  --baseline FILE  --thresholds FILE  --repeat N")
+        return 0
+    repeat = int(_arg(argv, "--repeat", 9))
+    out = _arg(argv, "--out")
+    baseline_file = _arg(argv, "--baseline")
+    config = _load_json(_arg(argv, "--thresholds", THRESHOLDS_FILE))
+
+    result = {"implementation": _implementation(), "frames": FRAMES, "repeat": repeat,
+              "metrics": run_all(repeat)}
+    for name in sorted(result["metrics"]):
+        print("%-48s %12.3f" % (name, result["metrics"][name]))
+    if out:
+        with open(out, "w") as f:
+            json.dump(result, f)
+
+    baseline = None
+    if baseline_file:
+        base = _load_json(baseline_file)
+        if base.get("implementation", "").split()[0] != result["implementation"].split()[0]:
+            print("Baseline is from %s; only checking limits." % base.get("implementation"))
+        else:
+            baseline = base["metrics"]
+    failures = check(result["metrics"], baseline, config)
+    for line in failures:
+        print("REGRESSION " + line)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,57 @@
+"""
+Compile the shared modules listed in ../manifest.py to .mpy files with
+mpy-cross, for a Pico running stock firmware:
+
+    python3 Micropython/host/build_mpy.py --out build
+    mpremote cp build/*.mpy :
+
+A .mpy is imported without being parsed or compiled, so boot is quicker
+and the compiler's RAM is never needed. Use the mpy-cross from the same
+MicroPython release as the firmware (pip install mpy-cross==<version>),
+and delete the .py copies from the board: a .py next to a .mpy wins.
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SOURCE = os.path.dirname(HERE)
+
+
+def modules(manifest=os.path.join(SOURCE, "manifest.py")):
+    """The module file names frozen by ``manifest``."""
+    names = []
+    scope = {"include": lambda *args, **kwargs: None,
+             "module": lambda name, *args, **kwargs: names.append(name)}
+    with open(manifest) as f:
+        exec(f.read(), scope)
+    return names
+
+
+def build(out, mpy_cross="mpy-cross", opt=1):
+    os.makedirs(out, exist_ok=True)
+    built = []
+    for name in modules():
+        target = os.path.join(out, name[:-3] + ".mpy")
+        subprocess.run([mpy_cross, f"-O{opt}", "-o", target, os.path.join(SOURCE, name)], check=True)
+        built.append(target)
+    return built
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--out", default="build", help="folder for the .mpy files")
+    parser.add_argument("--mpy-cross", default="mpy-cross", help="mpy-cross executable")
+    parser.add_argument("-O", dest="opt", type=int, default=1, help="optimisation level (1 drops __debug__ code)")
+    args = parser.parse_args(argv)
+    if shutil.which(args.mpy_cross) is None:
+        sys.exit(f"{args.mpy_cross} not found: pip install mpy-cross, matching the firmware's version")
+    for target in build(args.out, args.mpy_cross, args.opt):
+        print(target, os.path.getsize(target))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+# Local HTTP fixture server standing in for the weather APIs.
+# Each route is a path prefix mapped to a JSON-able payload (or a callable
+# taking the query dict and returning one). Responses carry an ETag and
+# answer If-None-Match with 304, and can be sent chunked, so the client's
+# keep-alive, conditional and chunked paths are all exercised.
+
+import json
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+
+def _number(query, key):
+    # Scripts ship with placeholder coordinates; echo 0 for those.
+    try:
+        return float(query.get(key, 0))
+    except ValueError:
+        return 0.0
+
+
+def open_meteo_current(query):
+    return {
+        "latitude": _number(query, "latitude"),
+        "longitude": _number(query, "longitude"),
+        "current_weather": {"temperature": 14.2, "windspeed": 11.0, "winddirection": 240,
+                            "weathercode": 61, "is_day": 1, "time": "2025-09-26T12:00"},
+    }
+
+
+def open_meteo_hourly(query):
+    start = int(time.time()) // 3600 * 3600
+    return {
+        "hourly": {
+            "time": [start + h * 3600 for h in range(48)],
+            "weathercode": [(0, 2, 3, 61, 63, 95)[h % 6] for h in range(48)],
+            "is_day": [1 if 7 <= (h % 24) < 19 else 0 for h in range(48)],
+        }
+    }
+
+
+def open_meteo(query):
+    return open_meteo_hourly(query) if "hourly" in query else open_meteo_current(query)
+
+
+def owm_onecall(query):
+    now = int(time.time())
+    excluded = query.get("exclude", "").split(",")
+    doc = {"lat": _number(query, "lat"), "lon": _number(query, "lon")}
+    if "current" not in excluded:
+        doc["current"] = {"dt": now, "sunrise": now - 6 * 3600, "sunset": now + 6 * 3600,
+                          "temp": 14.2, "weather": [{"id": 500, "main": "Rain", "icon": "10d"}]}
+    if "hourly" not in excluded:
+        start = now // 3600 * 3600
+        doc["hourly"] = [{"dt": start + h * 3600, "temp": 14.0,
+                          "weather": [{"id": (800, 802, 804, 500, 501, 211)[h % 6],
+                                       "icon": "01d" if 7 <= (h % 24) < 19 else "01n"}]}
+                         for h in range(48)]
+    if "daily" not in excluded:
+        doc["daily"] = [{"dt": now + d * 86400, "temp": {"day": 15.0}} for d in range(8)]
+    return doc
+
+
+DEFAULT_ROUTES = {
+    "/v1/forecast": open_meteo,
+    "/data/2.5/onecall": owm_onecall,
+    "/data/3.0/onecall": owm_onecall,
+}
+
+
+class FixtureServer:
+    """
+    Serve ``routes`` on 127.0.0.1 from a background thread. ``requests``
+    counts requests per route and ``connections`` counts TCP connections.
+    """
+
+    def __init__(self, routes=None, port=0, chunked=False, delay_ms=0):
+        self.routes = dict(DEFAULT_ROUTES if routes is None else routes)
+        self.chunked = chunked
+        self.delay_ms = delay_ms
+        self.requests = {}
+        self.connections = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                server.connections += 1
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                url = urlsplit(self.path)
+                route = next((r for r in server.routes if url.path.startswith(r)), None)
+                if route is None:
+                    self._send(404, b'{"error": "no fixture"}')
+                    return
+                server.requests[route] = server.requests.get(route, 0) + 1
+                payload = server.routes[route]
+                if callable(payload):
+                    payload = payload(dict(parse_qsl(url.query)))
+                body = json.dumps(payload).encode()
+                etag = '"%08x"' % zlib.crc32(body)
+                if server.delay_ms:
+                    time.sleep(server.delay_ms / 1000)
+                if self.headers.get("If-None-Match") == etag:
+                    self._send(304, b"", etag)
+                else:
+                    self._send(200, body, etag)
+
+            def _send(self, status, body, etag=None):
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                if etag:
+                    self.send_header("ETag", etag)
+                if status == 304:
+                    self.end_headers()
+                    return
+                if server.chunked:
+                    self.send_header("Transfer-Encoding", "chunked")
+                    self.end_headers()
+                    for i in range(0, len(body), 512):
+                        part = body[i:i + 512]
+                        self.wfile.write(b"%x\r\n%s\r\n" % (len(part), part))
+                    self.wfile.write(b"0\r\n\r\n")
+                else:
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,73 @@
+# Host (CPython) environment for running the weather house off-device.
+# Adds the MicroPython-only parts of time and asyncio that the scripts use.
+# The tick counters wrap like the RP2040's, so wrap-around bugs show up here
+# too. Imported by sitecustomize.py and run.py; safe to import twice.
+#
+# Ticks and the MicroPython sleeps read ``clock``, which is the host's
+# monotonic clock unless set_clock() swaps in another (see simclock.py).
+
+import asyncio
+import time
+
+TICKS_PERIOD = 1 << 30
+_MASK = TICKS_PERIOD - 1
+_HALF = TICKS_PERIOD >> 1
+
+
+class HostClock:
+    """The real clock: seconds from time.monotonic(), real sleeps."""
+
+    monotonic = staticmethod(time.monotonic)
+    sleep = staticmethod(time.sleep)
+
+
+clock = HostClock()
+
+
+def set_clock(new_clock=None):
+    """Drive ticks and sleeps from ``new_clock``; None restores the host clock."""
+    global clock
+    clock = new_clock if new_clock is not None else HostClock()
+
+
+def ticks_ms():
+    return int(clock.monotonic() * 1000) & _MASK
+
+
+def ticks_us():
+    return int(clock.monotonic() * 1000000) & _MASK
+
+
+def ticks_diff(a, b):
+    return ((a - b + _HALF) & _MASK) - _HALF
+
+
+def ticks_add(a, b):
+    return (a + b) & _MASK
+
+
+def sleep_ms(ms):
+    clock.sleep(ms / 1000)
+
+
+def sleep_us(us):
+    clock.sleep(us / 1000000)
+
+
+async def async_sleep_ms(ms):
+    await asyncio.sleep(ms / 1000)
+
+
+def install():
+    if getattr(time, "ticks_ms", None) is ticks_ms:
+        return
+    time.ticks_ms = ticks_ms
+    time.ticks_us = ticks_us
+    time.ticks_diff = ticks_diff
+    time.ticks_add = ticks_add
+    time.sleep_ms = sleep_ms
+    time.sleep_us = sleep_us
+    asyncio.sleep_ms = async_sleep_ms
+
+
+install()
@@ -0,0 +1,117 @@
+# Stand-in for MicroPython's machine module. PWM records every duty written
+# so servo motion can be inspected after a run.
+
+import time
+
+try:
+    import threading
+    import hostenv
+except ImportError:
+    # MicroPython's unix port (see bench.py): no threads, no virtual clock.
+    threading = hostenv = None
+
+
+class Pin:
+    IN = 0
+    OUT = 1
+
+    def __init__(self, pin, mode=-1, pull=None, value=None):
+        self.pin = pin
+        self._value = value or 0
+
+    def value(self, v=None):
+        if v is None:
+            return self._value
+        self._value = v
+
+    def on(self):
+        self._value = 1
+
+    def off(self):
+        self._value = 0
+
+
+class PWM:
+    def __init__(self, pin, freq=None, duty_u16=None):
+        self.pin = pin
+        self._freq = freq or 0
+        self._duty = duty_u16 or 0
+        self.history = []  # (ticks_ms, duty_u16) for every write
+
+    def freq(self, f=None):
+        if f is None:
+            return self._freq
+        self._freq = f
+
+    def duty_u16(self, d=None):
+        if d is None:
+            return self._duty
+        self._duty = d
+        self.history.append((time.ticks_ms(), d))
+
+    def deinit(self):
+        self._duty = 0
+
+
+class Timer:
+    """
+    A periodic timer run on a thread; callbacks get the timer, as on the
+    Pico. Under a virtual clock (simclock.py) it fires as that clock advances.
+    """
+
+    ONE_SHOT = 0
+    PERIODIC = 1
+
+    def __init__(self, id=-1, **kwargs):
+        self._stop = None
+        self._alarm = None
+        if kwargs:
+            self.init(**kwargs)
+
+    def init(self, mode=PERIODIC, period=-1, freq=-1, callback=None):
+        self.deinit()
+        if freq > 0:
+            period = 1000 / freq
+        if threading is None:
+            return
+        schedule = getattr(hostenv.clock, "schedule", None)
+        if schedule is not None:
+            self._alarm = schedule(period / 1000, lambda: callback(self), mode == Timer.PERIODIC)
+            return
+        stop = self._stop = threading.Event()
+
+        def loop():
+            while not stop.wait(period / 1000):
+                callback(self)
+                if mode == Timer.ONE_SHOT:
+                    break
+
+        threading.Thread(target=loop, daemon=True).start()
+
+    def deinit(self):
+        if self._stop is not None:
+            self._stop.set()
+        if self._alarm is not None:
+            self._alarm.cancel()
+            self._alarm = None
+
+
+def freq(hz=None):
+    return 125000000
+
+
+def reset():
+    raise SystemExit("machine.reset()")
+
+
+def lightsleep(ms=None):
+    # The whole board stops until the time is up; here, so does the process.
+    if hostenv is not None:
+        hostenv.sleep_ms(ms or 0)
+    else:
+        time.sleep((ms or 0) / 1000)
+
+
+def deepsleep(ms=None):
+    lightsleep(ms)
+    reset()
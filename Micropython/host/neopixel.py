@@ -0,0 +1,32 @@
+# Stand-in for the pi_pico_neopixel Neopixel driver: an in-memory frame
+# buffer. ``pixels`` is what set_pixel/fill wrote; ``shown`` is the frame
+# as of the last show(), and ``shows`` counts frames.
+
+
+class Neopixel:
+    def __init__(self, num_leds, state_machine, pin, mode="RGB", delay=0.0001):
+        self.num_leds = num_leds
+        self.mode = mode
+        self.pixels = [(0, 0, 0)] * num_leds
+        self.shown = list(self.pixels)
+        self.shows = 0
+        self._brightness = 255
+
+    def brightness(self, brightness=None):
+        if brightness is None:
+            return self._brightness
+        self._brightness = max(1, min(255, brightness))
+
+    def set_pixel(self, pixel_num, rgb_w, how_bright=None):
+        self.pixels[pixel_num] = rgb_w
+
+    def fill(self, rgb_w, how_bright=None):
+        for i in range(self.num_leds):
+            self.pixels[i] = rgb_w
+
+    def clear(self):
+        self.fill((0, 0, 0))
+
+    def show(self):
+        self.shown = list(self.pixels)
+        self.shows += 1
@@ -0,0 +1,86 @@
+# Stand-in for MicroPython's network module. The host's own network does
+# the real work; WLAN only keeps up the connection state. Set
+# ``WLAN.fail_connect`` to make connect() fail, or ``connect_delay_ms``
+# to make it take a while. ``scan_delay_ms`` is added unless connect() is
+# given the access point's bssid, and ``dhcp_delay_ms`` unless a static
+# ifconfig() is set by the time the link comes up, as on the Pico W.
+# ``AP`` is the one access point scan() finds (run.load() names it after
+# the script's ssid).
+
+import time
+
+STA_IF = 0
+AP_IF = 1
+
+STAT_IDLE = 0
+STAT_CONNECTING = 1
+STAT_WRONG_PASSWORD = -3
+STAT_NO_AP_FOUND = -2
+STAT_CONNECT_FAIL = -1
+STAT_GOT_IP = 3
+
+
+class WLAN:
+    fail_connect = False
+    connect_delay_ms = 0
+    scan_delay_ms = 0
+    dhcp_delay_ms = 0
+    AP = (b"weather-house", b"\x00\x11\x22\x33\x44\x55", 6, -55, 3, False)
+
+    def __init__(self, interface=STA_IF):
+        self.interface = interface
+        self._active = False
+        self._status = STAT_IDLE
+        self._since = 0
+        self._delay = 0
+        self._dhcp = True
+        self._config = {"ssid": "", "channel": 1, "mac": b"\x28\xcd\xc1\x00\x00\x01"}
+        self._ifconfig = ("192.168.1.50", "255.255.255.0", "192.168.1.1", "192.168.1.1")
+
+    def active(self, is_active=None):
+        if is_active is None:
+            return self._active
+        self._active = bool(is_active)
+        if not self._active:
+            self._status = STAT_IDLE
+
+    def connect(self, ssid=None, key=None, bssid=None):
+        self._config["ssid"] = ssid
+        self._config["channel"] = self.AP[2]
+        self._status = STAT_CONNECT_FAIL if self.fail_connect else STAT_CONNECTING
+        if bssid is not None and bytes(bssid) != self.AP[1]:
+            self._status = STAT_NO_AP_FOUND
+        self._since = time.ticks_ms()
+        self._delay = self.connect_delay_ms
+        if bssid is None:
+            self._delay += self.scan_delay_ms
+
+    def disconnect(self):
+        self._status = STAT_IDLE
+
+    def status(self, param=None):
+        if param == "rssi":
+            return -55
+        delay = self._delay + (self.dhcp_delay_ms if self._dhcp else 0)
+        if self._status == STAT_CONNECTING and time.ticks_diff(time.ticks_ms(), self._since) >= delay:
+            self._status = STAT_GOT_IP
+        return self._status
+
+    def isconnected(self):
+        return self._active and self.status() == STAT_GOT_IP
+
+    def ifconfig(self, config=None):
+        if config is None:
+            return self._ifconfig
+        self._dhcp = config == "dhcp"
+        if not self._dhcp:
+            self._ifconfig = tuple(config)
+
+    def config(self, *args, **kwargs):
+        if args:
+            return self._config.get(args[0])
+        self._config.update(kwargs)
+
+    def scan(self):
+        time.sleep_ms(self.scan_delay_ms)
+        return [self.AP]
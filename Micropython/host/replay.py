@@ -0,0 +1,226 @@
+# Recorded weather API responses, played back on a schedule.
+# A replay is a list of entries, each saying what a route answers from a
+# given time onwards (seconds into the simulation):
+#
+#     {"at": 0,    "path": "/v1/forecast", "status": 200, "body": {...}}
+#     {"at": 3600, "path": "/v1/forecast", "error": "ETIMEDOUT"}
+#     {"at": 7200, "path": "/v1/forecast", "match": "hourly", ...}
+#
+# ReplayClient and AsyncReplayClient take the place of httpclient's
+# clients: get() answers from the latest entry for the URL's path (and
+# ``match`` substring, if any), raises OSError for an "error" entry, and
+# returns a response read with readinto/areadinto like the real one,
+# including ETag/If-None-Match 304s. Nothing touches the network, so
+# replays run under simclock's virtual loop at full speed.
+#
+# Replays are saved as JSON ({"start": unix time, "entries": [...]}).
+# ``python3 replay.py record URL FILE --at N --path P`` appends a live
+# response to one; synthetic() builds day-long or week-long sequences.
+
+import argparse
+import json
+import random
+import time
+import zlib
+from urllib.parse import urlsplit
+
+import hostenv
+
+HOUR = 3600
+
+# Codes a synthetic day is drawn from, per provider.
+OPEN_METEO_CODES = (0, 1, 2, 3, 45, 51, 61, 63, 65, 80, 95, 71)
+OWM_CODES = (800, 801, 802, 804, 741, 721, 300, 500, 501, 502, 521, 211, 600)
+
+
+class ReplayResponse:
+    def __init__(self, status, headers, body):
+        self.status = status
+        self.headers = headers
+        self._body = memoryview(body)
+        self._pos = 0
+
+    def readinto(self, b):
+        n = min(len(b), len(self._body) - self._pos)
+        b[:n] = self._body[self._pos:self._pos + n]
+        self._pos += n
+        return n
+
+    async def areadinto(self, b):
+        return self.readinto(b)
+
+    def close(self):
+        self._pos = len(self._body)
+
+    async def aclose(self):
+        self.close()
+
+
+class ReplayClient:
+    """
+    Answers get() from ``entries`` according to ``clock()`` (seconds into
+    the simulation; hostenv's clock by default). ``requests`` counts calls
+    per path and ``failures`` counts the errors served.
+    """
+
+    def __init__(self, entries, clock=None):
+        self.entries = sorted(entries, key=lambda e: e["at"])
+        self.clock = clock or (lambda: hostenv.clock.monotonic())
+        self.requests = {}
+        self.failures = 0
+        # Encoded up front so the replay's own allocations stay out of a
+        # heap trace of the script; the ETag follows the body, as a server's would.
+        self._bodies = {}
+        for entry in self.entries:
+            body = entry.get("body", "")
+            if not isinstance(body, str):
+                body = json.dumps(body)
+            body = body.encode()
+            self._bodies[id(entry)] = (body, '"%08x"' % zlib.crc32(body))
+
+    def _entry(self, url):
+        parts = urlsplit(url)
+        now = self.clock()
+        found = None
+        for entry in self.entries:
+            if entry["at"] > now:
+                break
+            if parts.path.startswith(entry["path"]) and entry.get("match", "") in parts.query:
+                found = entry
+        return found
+
+    def get(self, url, headers=None):
+        path = urlsplit(url).path
+        self.requests[path] = self.requests.get(path, 0) + 1
+        entry = self._entry(url)
+        if entry is None:
+            return ReplayResponse(404, {}, b'{"error": "nothing recorded"}')
+        if "error" in entry:
+            self.failures += 1
+            raise OSError(entry["error"])
+        body, etag = self._bodies[id(entry)]
+        status = entry.get("status", 200)
+        if status == 200 and headers and headers.get("If-None-Match") == etag:
+            return ReplayResponse(304, {"etag": etag}, b"")
+        return ReplayResponse(status, {"etag": etag, "content-length": str(len(body))}, body)
+
+    def close(self):
+        pass
+
+
+class AsyncReplayClient(ReplayClient):
+    """ReplayClient with AsyncHttpClient's coroutine get()."""
+
+    async def get(self, url, headers=None):
+        return ReplayClient.get(self, url, headers)
+
+    async def aclose(self):
+        pass
+
+
+def load(path):
+    """(start, entries) from a replay file."""
+    with open(path) as f:
+        doc = json.load(f)
+    return doc.get("start"), doc["entries"]
+
+
+def save(path, start, entries):
+    with open(path, "w") as f:
+        json.dump({"start": start, "entries": entries}, f, indent=1)
+
+
+def is_day(unix_time):
+    return 7 <= time.gmtime(unix_time)[3] < 19
+
+
+def _open_meteo_entries(t, at, code):
+    day = is_day(t)
+    start = t // HOUR * HOUR
+    return [
+        {"at": at, "path": "/v1/forecast", "match": "current_weather",
+         "body": {"current_weather": {"weathercode": code, "is_day": int(day), "time": t}}},
+        {"at": at, "path": "/v1/forecast", "match": "hourly",
+         "body": {"hourly": {"time": [start + h * HOUR for h in range(48)],
+                             "weathercode": [code] * 48,
+                             "is_day": [int(is_day(start + h * HOUR)) for h in range(48)]}}},
+    ]
+
+
+def _owm_entries(t, at, code):
+    midnight = t // 86400 * 86400
+    sunrise, sunset = midnight + 7 * HOUR, midnight + 19 * HOUR
+    start = t // HOUR * HOUR
+    hourly = [{"dt": start + h * HOUR,
+               "weather": [{"id": code, "icon": "01d" if is_day(start + h * HOUR) else "01n"}]}
+              for h in range(48)]
+    current = {"dt": t, "sunrise": sunrise, "sunset": sunset,
+               "weather": [{"id": code, "icon": "01d" if is_day(t) else "01n"}]}
+    return [{"at": at, "path": path, "body": {"current": current, "hourly": hourly}}
+            for path in ("/data/2.5/onecall", "/data/3.0/onecall")]
+
+
+def synthetic(provider, start, hours=24, change_hours=3, fail_every=7, seed=0):
+    """
+    A replay of ``hours`` hourly updates from ``start`` (Unix time): the
+    condition changes every ``change_hours`` (drawn with ``seed``), day and
+    night follow the hour (07:00-19:00 UTC is day), and every
+    ``fail_every``-th hour the API fails. ``provider`` is "open-meteo" or "owm".
+    """
+    rng = random.Random(seed)
+    codes = OPEN_METEO_CODES if provider == "open-meteo" else OWM_CODES
+    make = _open_meteo_entries if provider == "open-meteo" else _owm_entries
+    entries = []
+    code = codes[0]
+    for h in range(hours):
+        if h % change_hours == 0:
+            code = rng.choice(codes)
+        at = h * HOUR
+        if fail_every and h % fail_every == fail_every - 1:
+            entries.append({"at": at, "path": "/", "error": "ETIMEDOUT"})
+        else:
+            entries.extend(make(start + at, at, code))
+    return entries
+
+
+def record(url, path, at, route=None, match=None):
+    """Fetch ``url`` now and append its response to the replay at ``path``."""
+    from urllib.request import urlopen
+
+    try:
+        start, entries = load(path)
+    except OSError:
+        start, entries = int(time.time()), []
+    with urlopen(url) as r:
+        entry = {"at": at, "path": route or urlsplit(url).path, "status": r.status,
+                 "body": r.read().decode()}
+    if match:
+        entry["match"] = match
+    entries.append(entry)
+    save(path, start, entries)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Record or generate weather API replays.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    rec = sub.add_parser("record", help="append a live response to a replay file")
+    rec.add_argument("url")
+    rec.add_argument("file")
+    rec.add_argument("--at", type=float, default=0, help="seconds into the simulation")
+    rec.add_argument("--path", help="route to file it under (default: the URL's path)")
+    rec.add_argument("--match", help="query substring the entry is limited to")
+    gen = sub.add_parser("synthetic", help="write a generated replay file")
+    gen.add_argument("provider", choices=("open-meteo", "owm"))
+    gen.add_argument("file")
+    gen.add_argument("--hours", type=int, default=24)
+    gen.add_argument("--start", type=int, default=1758844800)
+    gen.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    if args.command == "record":
+        record(args.url, args.file, args.at, args.path, args.match)
+    else:
+        save(args.file, args.start, synthetic(args.provider, args.start, args.hours, seed=args.seed))
+
+
+if __name__ == "__main__":
+    main()
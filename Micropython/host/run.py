@@ -0,0 +1,108 @@
+"""
+Run one of the weather house scripts on a PC, against the stand-ins in
+this folder and a local fixture server in place of the weather API:
+
+    python3 Micropython/host/run.py OpenMetroVr --seconds 30
+    python3 -m cProfile -s cumtime Micropython/host/run.py UpdatedOWMWeatherHouse
+
+Scripts only set themselves up when imported, so tests and profilers can
+also import them (with this folder and Micropython/ on sys.path) and call
+their functions directly. State files are written to a temporary folder
+unless --state is given.
+"""
+
+import argparse
+import asyncio
+import importlib
+import os
+import sys
+import tempfile
+import threading
+from urllib.parse import urlsplit
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [HERE, os.path.dirname(HERE)]
+
+import hostenv  # noqa: E402,F401
+import network  # noqa: E402
+from fixtures import FixtureServer  # noqa: E402
+
+
+def load(name, api_base=None):
+    """Import script ``name``; point its api_url (and providers) at ``api_base`` if given."""
+    module = importlib.import_module(name)
+    # The stand-in access point is the one the script is set up to join.
+    network.WLAN.AP = (getattr(module, "ssid", "").encode(),) + network.WLAN.AP[1:]
+    if api_base is not None:
+        module.api_url = api_base + urlsplit(module.api_url).path
+        for provider in getattr(getattr(module, "providers", None), "providers", ()):
+            provider.url = api_base + urlsplit(provider.url).path
+    return module
+
+
+def drive(module, seconds):
+    """Run the script's main loop for ``seconds``."""
+    if asyncio.iscoroutinefunction(getattr(module, "main", None)):
+        if hasattr(module, "restore"):
+            module.restore()
+        try:
+            asyncio.run(asyncio.wait_for(module.main(), seconds))
+        except asyncio.TimeoutError:
+            pass
+        render = getattr(module, "render", None)
+        if render is not None:
+            render.stop()  # The dual-core render thread outlives the event loop
+    else:
+        # Blocking scripts loop forever; let them run on a daemon thread.
+        t = threading.Thread(target=module.main, daemon=True)
+        t.start()
+        t.join(seconds)
+
+
+def summary(module, server):
+    lines = []
+    pixels = getattr(module, "pixels", None)
+    if pixels is not None:
+        lines.append(f"frames shown: {pixels.shows}, last frame: {pixels.shown}")
+    servo = getattr(module, "servoPin", None)
+    if servo is not None:
+        lines.append(f"servo duty writes: {len(servo.history)}, last duty: {servo.duty_u16()}")
+    if server is not None:
+        lines.append(f"API requests: {server.requests}, connections: {server.connections}")
+    return "\n".join(lines)
+
+
+def report(module, server):
+    print(summary(module, server))
+    telemetry = getattr(module, "telemetry", None)
+    if telemetry is not None:
+        telemetry.dump()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("script", help="module name, e.g. OpenMetroVr")
+    parser.add_argument("--seconds", type=float, default=30)
+    parser.add_argument("--state", help="folder for cache/forecast/profile files")
+    parser.add_argument("--live", action="store_true", help="use the real weather API")
+    parser.add_argument("--chunked", action="store_true", help="fixture sends chunked bodies")
+    parser.add_argument("--dual-core", action="store_true", help="render on a second thread, as on core 1")
+    args = parser.parse_args(argv)
+
+    os.chdir(args.state or tempfile.mkdtemp(prefix="weatherhouse-"))
+    server = None
+    if not args.live:
+        server = FixtureServer(chunked=args.chunked).start()
+    try:
+        module = load(args.script, None if server is None else server.url)
+        if args.dual_core:
+            module.dual_core = True
+        drive(module, args.seconds)
+        report(module, server)
+    finally:
+        if server is not None:
+            server.stop()
+
+
+if __name__ == "__main__":
+    main()
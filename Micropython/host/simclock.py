@@ -0,0 +1,145 @@
+# Virtual clock for running the scripts faster than real time.
+# Once installed, ticks_ms/ticks_us, every sleep (time.sleep, sleep_ms,
+# asyncio.sleep), time.time/gmtime/localtime and the machine.Timer
+# stand-in all follow simulated time. Nothing ever waits: a sleep moves the
+# clock forward, and the asyncio loop jumps straight to its next timer
+# whenever it has nothing ready to run. Timers due during a jump fire in
+# order, at their own time.
+#
+#     clock = VirtualClock(start=1758844800).install()
+#     module = run.load("OpenMetroVr")
+#     clock.run(module.main(), 24 * 3600)
+#
+# Only in-process I/O works under the virtual loop (replay.py stands in for
+# the network); a real socket would see its timeouts expire instantly.
+
+import asyncio
+import heapq
+import selectors
+import time
+
+import hostenv
+
+_real = {name: getattr(time, name) for name in ("time", "gmtime", "localtime", "sleep")}
+
+
+class Alarm:
+    """A callback due at ``due`` seconds, every ``period`` if periodic."""
+
+    def __init__(self, due, period, callback, periodic):
+        self.due = due
+        self.period = period
+        self.callback = callback
+        self.periodic = periodic
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class VirtualClock:
+    """
+    Simulated time in seconds since the clock was made. ``start`` is the
+    Unix time the simulation begins at (now, by default); ``time()`` and
+    ``gmtime()`` count on from there.
+    """
+
+    def __init__(self, start=None):
+        self.now = 0.0
+        self.start = _real["time"]() if start is None else start
+        self._alarms = []
+        self._seq = 0
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.start + self.now
+
+    def gmtime(self, secs=None):
+        return _real["gmtime"](self.time() if secs is None else secs)
+
+    def sleep(self, seconds):
+        self.advance(seconds)
+
+    def schedule(self, delay, callback, periodic=False):
+        """Call ``callback()`` after ``delay`` seconds (and every ``delay`` if periodic)."""
+        alarm = Alarm(self.now + delay, max(delay, 1e-6), callback, periodic)
+        self._push(alarm)
+        return alarm
+
+    def _push(self, alarm):
+        self._seq += 1
+        heapq.heappush(self._alarms, (alarm.due, self._seq, alarm))
+
+    def advance(self, seconds):
+        """Move time forward, firing the alarms that fall due on the way."""
+        end = self.now + max(0.0, seconds)
+        while self._alarms and self._alarms[0][0] <= end:
+            due, _, alarm = heapq.heappop(self._alarms)
+            if alarm.cancelled:
+                continue
+            self.now = max(self.now, due)
+            alarm.callback()
+            if alarm.periodic and not alarm.cancelled:
+                alarm.due = due + alarm.period
+                self._push(alarm)
+        self.now = end
+
+    def install(self):
+        """Make ticks, sleeps and the wall clock follow this clock."""
+        hostenv.set_clock(self)
+        time.time = self.time
+        time.gmtime = self.gmtime
+        time.localtime = self.gmtime
+        time.sleep = self.sleep
+        return self
+
+    def uninstall(self):
+        hostenv.set_clock(None)
+        for name, fn in _real.items():
+            setattr(time, name, fn)
+
+    def new_event_loop(self):
+        return _VirtualLoop(self)
+
+    def run(self, coro, seconds):
+        """Run ``coro`` on a virtual event loop for ``seconds`` of simulated time."""
+        loop = self.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            loop.run_until_complete(asyncio.wait_for(coro, seconds))
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            # Background tasks (fetch loop, frame engine) never end by themselves.
+            pending = asyncio.all_tasks(loop)
+            for task in pending:
+                task.cancel()
+            loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+            asyncio.set_event_loop(None)
+            loop.close()
+
+
+class _VirtualSelector(selectors.DefaultSelector):
+    # Polls without blocking; with nothing ready, the wait becomes a jump.
+    def __init__(self, clock):
+        super().__init__()
+        self.clock = clock
+
+    def select(self, timeout=None):
+        ready = super().select(0)
+        if not ready:
+            if timeout is None:
+                raise RuntimeError("simulation stalled: no task is waiting on a timer")
+            self.clock.advance(timeout)
+        return ready
+
+
+class _VirtualLoop(asyncio.SelectorEventLoop):
+    def __init__(self, clock):
+        super().__init__(_VirtualSelector(clock))
+        self.clock = clock
+
+    def time(self):
+        return self.clock.now
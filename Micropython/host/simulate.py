@@ -0,0 +1,199 @@
+"""
+Run a weather house script through hours or days of replayed weather in
+seconds, on a virtual clock:
+
+    python3 Micropython/host/simulate.py OpenMetroVr --days 7
+    python3 Micropython/host/simulate.py WeatherHouseOWM --replay day.json
+
+Without --replay a synthetic sequence is generated (see replay.synthetic):
+conditions change every few hours, day and night follow the clock, and the
+API fails now and then. The report lists the frames shown, servo moves,
+API calls and failures, and Python heap use (tracemalloc) hour by hour.
+
+Frames still cost real CPU time, so the LEDs run at --fps (1 by default;
+effects scale their rates to the frame period). Stage times in the
+telemetry dump are virtual and so read as zero, apart from servo moves.
+"""
+
+import argparse
+import asyncio
+import gc
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [HERE, os.path.dirname(HERE)]
+
+import replay  # noqa: E402
+import run  # noqa: E402
+from simclock import VirtualClock  # noqa: E402
+
+HOUR = 3600
+DEFAULT_START = 1758844800  # 2025-09-26 00:00 UTC
+
+
+class _Finished(BaseException):
+    pass
+
+
+class Recorder:
+    """Hourly samples and servo moves collected while a script runs."""
+
+    def __init__(self, module, clock, client):
+        self.module = module
+        self.clock = clock
+        self.client = client
+        self.moves = []    # (seconds, conditions, night, target)
+        self.samples = []  # (hour, frames, servo writes, heap bytes)
+        self.error = None  # What stopped the script early, if anything
+        motion = module.motion
+        move_to = motion.move_to
+
+        def recorded_move(target):
+            self.moves.append((clock.now, getattr(module, "conditions", None),
+                               bool(getattr(module, "night", False)), target))
+            move_to(target)
+
+        motion.move_to = recorded_move
+        clock.schedule(HOUR, self.sample, periodic=True)
+
+    def frames(self):
+        pixels = getattr(self.module, "pixels", None)
+        return pixels.shows if pixels is not None else 0
+
+    def sample(self):
+        servo = getattr(self.module, "servoPin", None)
+        writes = len(servo.history) if servo is not None else 0
+        heap = 0
+        if tracemalloc.is_tracing():
+            gc.collect()  # Count live objects, not cycles waiting to be collected
+            heap = tracemalloc.get_traced_memory()[0]
+        self.samples.append((int(self.clock.now // HOUR), self.frames(), writes, heap))
+
+    def result(self, elapsed):
+        servo = getattr(self.module, "servoPin", None)
+        heap, peak = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (0, 0)
+        power = getattr(self.module, "power", None)
+        return {
+            "simulated_s": self.clock.now,
+            "elapsed_s": elapsed,
+            "frames": self.frames(),
+            "servo_moves": len(self.moves),
+            "servo_writes": len(servo.history) if servo is not None else 0,
+            "requests": sum(self.client.requests.values()),
+            "failures": self.client.failures,
+            "heap": heap,
+            "heap_peak": peak,
+            "sleeps": power.sleeps if power is not None else 0,
+            "asleep_s": power.slept_ms / 1000 if power is not None else 0,
+            "error": self.error,
+            "moves": self.moves,
+            "hourly": self.samples,
+        }
+
+
+def simulate(name, seconds, entries=None, start=DEFAULT_START, fps=None, seed=0, heap=True, power=None):
+    """
+    Run script ``name`` for ``seconds`` of simulated time against replay
+    ``entries`` (synthetic if None) and return the recorded figures. Call
+    from a fresh process: the script is imported under the virtual clock.
+    """
+    random.seed(seed)
+    clock = VirtualClock(start).install()
+    if heap:
+        tracemalloc.start()
+    module = run.load(name)
+    is_async = asyncio.iscoroutinefunction(module.main)
+    if entries is None:
+        provider = "open-meteo" if "open-meteo" in module.api_url else "owm"
+        entries = replay.synthetic(provider, start, int(seconds // HOUR) + 1, seed=seed)
+    client = module.http = (replay.AsyncReplayClient if is_async else replay.ReplayClient)(entries)
+    for provider in getattr(getattr(module, "providers", None), "providers", ()):
+        provider.http = client
+    if fps and hasattr(module, "engine"):
+        module.engine.period = 1000 // fps
+    if power and hasattr(module, "power"):
+        module.power_mode = module.power.mode = power
+    recorder = Recorder(module, clock, client)
+    began = time.perf_counter()
+    try:
+        if is_async:
+            module.restore()
+            clock.run(module.main(), seconds)
+        else:
+            # Blocking scripts sleep on the clock, so ending is an alarm that unwinds them.
+            clock.schedule(seconds, _finish)
+            try:
+                module.main()
+            except _Finished:
+                pass
+    except Exception as e:
+        recorder.error = f"{type(e).__name__}: {e} at {clock.now / HOUR:.2f} h"
+    finally:
+        elapsed = time.perf_counter() - began
+        clock.uninstall()
+    return recorder.result(elapsed)
+
+
+def _finish():
+    raise _Finished
+
+
+def report(result, timeline=20):
+    print(f"simulated {result['simulated_s'] / HOUR:.1f} h in {result['elapsed_s']:.1f} s "
+          f"({result['simulated_s'] / max(result['elapsed_s'], 1e-9):.0f}x)")
+    print(f"frames shown: {result['frames']}, servo moves: {result['servo_moves']}, "
+          f"duty writes: {result['servo_writes']}")
+    print(f"API requests: {result['requests']}, failures: {result['failures']}")
+    if result["error"]:
+        print(f"script stopped: {result['error']}")
+    if result["sleeps"]:
+        print(f"asleep with Wi-Fi off: {result['asleep_s'] / HOUR:.1f} h in {result['sleeps']} sleeps "
+              f"({100 * result['asleep_s'] / max(result['simulated_s'], 1e-9):.0f}%)")
+    if result["heap_peak"]:
+        print(f"heap: {result['heap']} bytes now, {result['heap_peak']} peak")
+    print("\n   time  code  night  target")
+    for t, code, night, target in result["moves"][:timeline]:
+        print(f"{int(t // HOUR):3d}:{int(t % HOUR // 60):02d}  {code!s:>4}  {night!s:>5}  {target}")
+    if len(result["moves"]) > timeline:
+        print(f"  ... {len(result['moves']) - timeline} more")
+    print("\n hour    frames  duty writes   heap")
+    for hour, frames, writes, heap in result["hourly"]:
+        print(f"{hour:5d} {frames:9d} {writes:12d} {heap:7d}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("script", help="module name, e.g. OpenMetroVr")
+    length = parser.add_mutually_exclusive_group()
+    length.add_argument("--hours", type=float, default=24)
+    length.add_argument("--days", type=float)
+    parser.add_argument("--replay", help="replay file (see replay.py); default: synthetic")
+    parser.add_argument("--fps", type=int, default=1, help="LED frame rate (0: the script's own)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-heap", action="store_true", help="skip tracemalloc (faster)")
+    parser.add_argument("--state", help="folder for cache/forecast/profile files")
+    # A deep sleep restarts the board, which would end the run.
+    parser.add_argument("--power", choices=("light",), help="run with the script's power_mode set")
+    args = parser.parse_args(argv)
+
+    seconds = (args.days * 24 if args.days else args.hours) * HOUR
+    start, entries = DEFAULT_START, None
+    if args.replay:
+        start, entries = replay.load(args.replay)
+        start = start or DEFAULT_START
+    os.chdir(args.state or tempfile.mkdtemp(prefix="weatherhouse-sim-"))
+    result = simulate(args.script, seconds, entries, start, args.fps, args.seed, not args.no_heap, args.power)
+    report(result)
+    module = sys.modules[args.script]
+    if getattr(module, "telemetry", None) is not None:
+        print()
+        module.telemetry.dump()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,2 @@
+# Picked up automatically when this directory is on PYTHONPATH.
+import hostenv  # noqa: F401
@@ -0,0 +1,20 @@
+# Tests for the shared modules, run on the PC against the stand-ins in
+# host/ (see README):
+#     python3 -m pytest Micropython/host/tests
+import os
+import sys
+
+HOST = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [HOST, os.path.dirname(HOST), os.path.join(os.path.dirname(HOST), "proxy")]
+
+import hostenv  # noqa: E402,F401
+import pytest  # noqa: E402
+from simclock import VirtualClock  # noqa: E402
+
+
+@pytest.fixture
+def clock():
+    """Ticks, sleeps and the wall clock on a VirtualClock, from 26 Sep 2025."""
+    clock = VirtualClock(start=1758844800).install()
+    yield clock
+    clock.uninstall()
@@ -0,0 +1,41 @@
+import pytest
+
+from conditions import Action, ConditionTable
+
+CLEAR = Action("clear", 0, "sun")
+CLEAR_NIGHT = Action("clear night", 0, "moon")
+RAIN = Action("rain", 90, "rain")
+FOG = Action("fog", 45, "fog")
+DEFAULT = Action("unknown", 180, "none")
+
+
+def test_overlapping_rules_are_refused():
+    with pytest.raises(ValueError):
+        ConditionTable([((0, 1), CLEAR), ((1, 2), FOG)])
+
+
+def test_a_code_repeated_within_a_rule_is_refused():
+    with pytest.raises(ValueError):
+        ConditionTable([((61, 61), RAIN)])
+
+
+def test_night_action_applies_only_at_night():
+    table = ConditionTable([((0, 1), CLEAR, CLEAR_NIGHT), ((61,), RAIN)], DEFAULT)
+    assert table.lookup(1, False) is CLEAR
+    assert table.lookup(1, True) is CLEAR_NIGHT
+    # A two-element rule uses its action by night as well.
+    assert table.lookup(61, True) is RAIN
+
+
+def test_none_and_unlisted_codes_fall_through_to_the_default():
+    table = ConditionTable([((45,), None, FOG), ((0,), CLEAR)], DEFAULT)
+    assert table.lookup(45, False) is DEFAULT
+    assert table.lookup(45, True) is FOG
+    for code in (2, 44, 46, 999, -1):
+        assert table.lookup(code, False) is DEFAULT
+    assert ConditionTable([((0,), CLEAR)]).lookup(7, False) is None
+
+
+def test_shared_actions_take_one_slot():
+    table = ConditionTable([((0,), CLEAR), ((1,), CLEAR, CLEAR), ((61,), RAIN)], DEFAULT)
+    assert table.actions == [DEFAULT, CLEAR, RAIN]
@@ -0,0 +1,49 @@
+import asyncio
+import threading
+
+from dualcore import Mailbox
+
+
+def test_take_returns_the_latest_post_once():
+    box = Mailbox()
+    assert box.take() is None
+    for value in ("rain", "fog", "sun"):
+        box.post(value)
+    assert box.take() == "sun"
+    assert box.take() is None
+    assert (box.posted, box.replaced) == (3, 2)
+
+
+def test_values_are_never_reordered_across_threads():
+    box = Mailbox()
+    last = 5000
+    seen = []
+
+    def consume():
+        while not seen or seen[-1] != last:
+            value = box.take()
+            if value is not None:
+                seen.append(value)
+
+    consumer = threading.Thread(target=consume)
+    consumer.start()
+    for i in range(1, last + 1):
+        box.post(i)
+    consumer.join(10)
+    assert not consumer.is_alive()
+    assert seen == sorted(set(seen))
+    assert box.posted == last
+    assert box.replaced == last - len(seen)
+
+
+def test_get_waits_for_a_post():
+    box = Mailbox()
+
+    async def main():
+        waiter = asyncio.create_task(box.get(poll_ms=1))
+        await asyncio.sleep(0.01)
+        assert not waiter.done()
+        box.post((90, "rain"))
+        return await asyncio.wait_for(waiter, 1)
+
+    assert asyncio.run(main()) == (90, "rain")
@@ -0,0 +1,6 @@
+import forecast
+
+
+def test_owm_hours_without_an_icon_count_as_day():
+    values = (1758844800, [800, 500, 801], ["01n", None, "02d"])
+    assert forecast.from_owm(values) == (1758844800, [800, 500, 801], [0, 1, 1])
@@ -0,0 +1,76 @@
+import json
+
+import jsonstream
+
+
+def project(doc, paths, chunk):
+    p = jsonstream.Projection(paths)
+    data = doc.encode() if isinstance(doc, str) else doc
+    for i in range(0, len(data), chunk):
+        if p.feed(data[i:i + chunk]):
+            break
+    return p.out
+
+
+def test_surrogate_pair_escape():
+    doc = '{"name": "rain \\ud83c\\udf27 later"}'
+    for chunk in (1, 2, 5, 64):
+        assert project(doc, [("name",)], chunk) == [json.loads(doc)["name"]]
+
+
+def test_unpaired_surrogate_escape():
+    doc = '{"a": "\\ud83c!", "b": "\\udf27", "c": "\\ud83c\\ud83c\\udf27"}'
+    assert project(doc, [("a",), ("b",), ("c",)], 3) == ["�!", "�", "�\U0001f327"]
+
+
+ONECALL = {
+    "lat": 52.6, "lon": 0.5, "timezone": "Europe/London",
+    "current": {
+        "dt": 1758844800, "sunrise": 1758866000, "sunset": 1758909000, "temp": 11.25,
+        "weather": [{"id": 500, "main": "Rain", "description": "light \"drizzly\" rain\\n", "icon": "10n"}],
+        "rain": {"1h": 0.31},
+    },
+    "minutely": [{"dt": 1758844800 + 60 * i, "precipitation": 0} for i in range(61)],
+    "hourly": [{"dt": 1758844800 + 3600 * i, "temp": -1.5e0 + i, "pop": 0,
+                "weather": [{"id": 800 + i % 5, "icon": "01d"}]} for i in range(48)],
+    "daily": [], "empty": {}, "flags": [True, False, None],
+}
+
+PATHS = [
+    ("current", "weather", 0, "id"),
+    ("current", "weather", 0, "description"),
+    ("current", "rain"),
+    ("hourly", "*", "weather", 0, "id"),
+    ("hourly", "*", "temp"),
+    ("flags",),
+    ("empty",),
+    ("daily", 0, "dt"),
+    ("current", "snow", "1h"),
+]
+
+
+def reference(doc, path):
+    """What ``path`` picks out of the decoded document; None if absent."""
+    if not path:
+        return doc
+    key, rest = path[0], path[1:]
+    if key == jsonstream.WILDCARD:
+        return [reference(item, rest) for item in doc]
+    try:
+        return reference(doc[key], rest)
+    except (KeyError, IndexError, TypeError):
+        return None
+
+
+def test_matches_json_at_every_chunk_size():
+    text = json.dumps(ONECALL, indent=1)
+    expected = [reference(json.loads(text), p) for p in PATHS]
+    for chunk in list(range(1, 17)) + [64, 255, len(text)]:
+        assert project(text, PATHS, chunk) == expected, chunk
+
+
+def test_stops_once_everything_is_found():
+    text = json.dumps(ONECALL)
+    p = jsonstream.Projection([("lat",), ("current", "dt")])
+    assert p.feed(text.encode()[:text.index('"weather"')])
+    assert p.out == [52.6, 1758844800]
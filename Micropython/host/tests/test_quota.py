@@ -0,0 +1,65 @@
+from quota import DAY_MS, Quota
+
+
+def make(path, budget=48, burst=2):
+    return Quota(str(path), budget, 600000, 300000, 3600000, burst)
+
+
+def test_burst_then_refused(tmp_path, clock):
+    quota = make(tmp_path / "quota.bin")
+    assert quota.take() and quota.take()
+    assert not quota.take()
+    assert (quota.calls, quota.refused) == (2, 1)
+
+
+def test_refills_at_the_daily_rate(tmp_path, clock):
+    quota = make(tmp_path / "quota.bin")
+    quota.take(), quota.take()
+    per_token = DAY_MS / (48 - 2)
+    assert abs(quota.wait_ms() - per_token) <= 1
+    clock.advance(per_token / 2000)
+    assert not quota.take()
+    clock.advance(per_token / 2000 + 0.01)
+    assert quota.take()
+    # Never more than the burst, however long it has been.
+    clock.advance(86400)
+    assert quota.take() and quota.take() and not quota.take()
+
+
+def test_a_reboot_keeps_the_spent_tokens(tmp_path, clock):
+    path = tmp_path / "quota.bin"
+    quota = make(path)
+    quota.take(), quota.take()
+    assert not make(path).take()
+
+
+def test_time_switched_off_is_credited(tmp_path, clock):
+    path = tmp_path / "quota.bin"
+    quota = make(path)
+    quota.take(), quota.take()
+    clock.advance(DAY_MS / (48 - 2) / 1000 + 1)
+    rebooted = make(path)
+    assert rebooted.take()
+    assert not rebooted.take()
+
+
+def test_unreadable_file_gives_a_full_bucket(tmp_path, clock):
+    path = tmp_path / "quota.bin"
+    path.write_bytes(b"junk")
+    assert make(path).tokens == 2
+
+
+def test_interval_adapts_within_the_budget(tmp_path, clock):
+    quota = make(tmp_path / "quota.bin", budget=1000, burst=10)
+    assert quota.next_interval(False) == 900000
+    assert quota.next_interval(False) == 1350000
+    assert quota.next_interval(True) == 300000
+    for _ in range(10):
+        interval = quota.next_interval(False)
+    assert interval == 3600000
+
+
+def test_interval_never_runs_ahead_of_the_budget(tmp_path, clock):
+    quota = make(tmp_path / "quota.bin")
+    quota.take(), quota.take()
+    assert quota.next_interval(True) == quota.wait_ms() > 300000
@@ -0,0 +1,101 @@
+import asyncio
+
+import network
+import pytest
+from supervisor import CLOSED, FORGET_AFTER, HALF_OPEN, OPEN, CircuitBreaker, JoinCache, Link
+
+
+@pytest.fixture
+def wlan(monkeypatch):
+    monkeypatch.setattr(network.WLAN, "fail_connect", False)
+    return network.WLAN()
+
+
+def test_opens_after_threshold_failures(clock):
+    breaker = CircuitBreaker(threshold=3, open_ms=60000)
+    breaker.failure()
+    breaker.failure()
+    assert breaker.state == CLOSED and breaker.allow()
+    breaker.failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow() and not breaker.allow()
+    assert breaker.skipped == 2
+    clock.advance(20)
+    assert breaker.retry_in() == 40000
+
+
+def test_half_open_after_the_pause(clock):
+    breaker = CircuitBreaker(threshold=1, open_ms=60000)
+    breaker.failure()
+    clock.advance(60)
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    assert breaker.retry_in() == 0
+
+
+def test_a_failed_trial_doubles_the_pause(clock):
+    breaker = CircuitBreaker(threshold=1, open_ms=60000, max_open_ms=150000)
+    breaker.failure()
+    for period in (120000, 150000, 150000):
+        clock.advance(1000)
+        assert breaker.allow()
+        breaker.failure()
+        assert breaker.state == OPEN
+        assert breaker.retry_in() == period
+    assert breaker.trips == 4
+
+
+def test_a_successful_trial_closes_and_resets(clock):
+    breaker = CircuitBreaker(threshold=2, open_ms=60000)
+    breaker.failure()
+    breaker.failure()
+    clock.advance(60)
+    assert breaker.allow()
+    breaker.failure()
+    clock.advance(120)
+    assert breaker.allow()
+    breaker.success()
+    assert breaker.state == CLOSED and breaker.failures == 0
+    # Back to the full threshold, and the first pause, next time.
+    breaker.failure()
+    assert breaker.allow()
+    breaker.failure()
+    assert breaker.retry_in() == 60000
+
+
+def join(link):
+    return asyncio.run(link._join())
+
+
+def test_a_failed_direct_join_keeps_the_access_point(tmp_path, wlan):
+    cache = JoinCache(str(tmp_path / "wifi.bin"))
+    link = Link(wlan, "weather-house", "secret", join_cache=cache)
+    link.survey()
+    assert join(link)
+    assert cache.bssid == network.WLAN.AP[1] and cache.lease is not None
+
+    # The router restarts: both joins fail once.
+    wlan.disconnect()
+    network.WLAN.fail_connect = True
+    assert not join(link)
+    network.WLAN.fail_connect = False
+    assert cache.bssid == network.WLAN.AP[1] and cache.lease is None
+    assert JoinCache(cache.path).bssid == network.WLAN.AP[1]
+
+    # Once it is back, joins go straight to it again.
+    assert join(link)
+    assert cache.direct == 1 and cache.misses == 0
+
+
+def test_the_access_point_is_forgotten_once_it_keeps_failing(tmp_path, wlan):
+    cache = JoinCache(str(tmp_path / "wifi.bin"))
+    link = Link(wlan, "weather-house", "secret", join_cache=cache)
+    link.survey()
+    assert join(link)
+    wlan.disconnect()
+    network.WLAN.fail_connect = True
+    for _ in range(FORGET_AFTER):
+        assert cache.bssid is not None
+        assert not join(link)
+    assert cache.bssid is None
+    assert JoinCache(cache.path).bssid is None
@@ -0,0 +1,130 @@
+import threading
+
+import pytest
+
+import weatherproxy
+import wxrecord
+
+CURRENT = {"current_weather": {"weathercode": 61, "is_day": 1, "time": 1758844800, "temperature": 12.5}}
+QUERY = {"latitude": "52.6", "longitude": "0.5", "current_weather": "true"}
+
+
+class Upstream:
+    """fetch() stand-in that holds every caller until release()."""
+
+    def __init__(self, doc=CURRENT):
+        self.doc = doc
+        self.urls = []
+        self.gate = threading.Event()
+        self.error = None
+
+    def __call__(self, url):
+        self.urls.append(url)
+        assert self.gate.wait(5)
+        if self.error:
+            raise self.error
+        return self.doc
+
+    def release(self):
+        self.gate.set()
+
+
+def ask(proxy, queries):
+    """get() each query from its own thread, all at once; the results in order."""
+    results = [None] * len(queries)
+
+    def one(i):
+        try:
+            results[i] = proxy.get(*proxy.resolve("/v1/forecast", queries[i]))
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=one, args=(i,)) for i in range(len(queries))]
+    for t in threads:
+        t.start()
+    return threads, results
+
+
+def wait_for(proxy, coalesced):
+    for _ in range(500):
+        with proxy._lock:
+            if proxy.stats["coalesced"] == coalesced:
+                return
+        threading.Event().wait(0.01)
+    raise AssertionError("requests never coalesced")
+
+
+def finish(upstream, threads):
+    upstream.release()
+    for t in threads:
+        t.join(5)
+
+
+def test_concurrent_requests_share_one_fetch():
+    upstream = Upstream()
+    proxy = weatherproxy.WeatherProxy(fetch=upstream)
+    # Nearby houses round to the same grid cell.
+    queries = [dict(QUERY, latitude="52.60%d" % i) for i in range(8)]
+    threads, results = ask(proxy, queries)
+    wait_for(proxy, 7)
+    finish(upstream, threads)
+    assert len(upstream.urls) == 1
+    assert all(r is results[0] for r in results)
+    assert proxy.stats["upstream"] == 1
+
+
+def test_json_and_record_houses_share_one_fetch():
+    upstream = Upstream()
+    proxy = weatherproxy.WeatherProxy(fetch=upstream)
+    threads, results = ask(proxy, [QUERY, dict(QUERY, format="record")])
+    wait_for(proxy, 1)
+    finish(upstream, threads)
+    assert len(upstream.urls) == 1
+    as_json, as_record = results
+    assert as_json.content_type == weatherproxy.JSON
+    assert as_record.content_type == weatherproxy.RECORD
+    assert wxrecord.unpack(as_record.body)[:2] == (1758844800, 61)
+    # And both formats are then served from the cache.
+    again = proxy.get(*proxy.resolve("/v1/forecast", dict(QUERY, format="record")))
+    assert again is as_record
+    assert len(upstream.urls) == 1
+
+
+def test_waiters_see_the_leaders_error():
+    upstream = Upstream()
+    upstream.error = OSError("upstream down")
+    proxy = weatherproxy.WeatherProxy(fetch=upstream)
+    threads, results = ask(proxy, [QUERY] * 3)
+    wait_for(proxy, 2)
+    finish(upstream, threads)
+    assert len(upstream.urls) == 1
+    assert all(isinstance(r, OSError) for r in results)
+    # Nothing was cached, so the next request tries again.
+    upstream.error = None
+    assert proxy.get(*proxy.resolve("/v1/forecast", QUERY)).body
+    assert len(upstream.urls) == 2
+
+
+def test_stale_answer_served_while_upstream_fails():
+    upstream = Upstream()
+    upstream.release()
+    # Nothing is ever fresh, so every request goes upstream.
+    proxy = weatherproxy.WeatherProxy(fetch=upstream, ttl_current=0)
+    first = proxy.get(*proxy.resolve("/v1/forecast", QUERY))
+    upstream.error = OSError("upstream down")
+    assert proxy.get(*proxy.resolve("/v1/forecast", QUERY)) is first
+    assert proxy.stats["stale"] == 1
+
+
+@pytest.mark.parametrize("owm_key, fetches", [(None, 2), ("PROXYKEY", 1)])
+def test_owm_cache_is_per_house_key_only_when_passing_it_through(owm_key, fetches):
+    doc = {"current": {"dt": 1758844800, "sunrise": 1758866000, "sunset": 1758909000,
+                       "weather": [{"id": 800, "icon": "01n"}]}}
+    upstream = Upstream(doc)
+    upstream.release()
+    proxy = weatherproxy.WeatherProxy(owm_key=owm_key, fetch=upstream)
+    for appid in ("HOUSE1", "HOUSE2", "HOUSE1"):
+        query = {"lat": "52.6", "lon": "0.5", "exclude": "minutely,hourly,daily", "appid": appid}
+        proxy.get(*proxy.resolve("/data/3.0/onecall", query))
+    assert len(upstream.urls) == fetches
+    assert ("appid=%s" % (owm_key or "HOUSE2")) in upstream.urls[-1]
@@ -0,0 +1,533 @@
+# Small persistent HTTP/1.1 client for the weather fetches.
+# Keeps the resolved address, the socket and (where the TLS stack allows
+# it) the TLS session between calls, and reads everything through one
+# preallocated receive buffer so a fetch makes no large allocations.
+#
+# HttpClient blocks; AsyncHttpClient does the same over asyncio streams
+# so a fetch can run alongside the LED animation.
+
+import socket
+
+try:
+    import ssl
+except ImportError:
+    import ussl as ssl
+
+try:
+    import asyncio
+except ImportError:
+    import uasyncio as asyncio
+
+# Response headers worth keeping; everything else is dropped while parsing.
+KEEP_HEADERS = ("content-length", "transfer-encoding", "connection", "etag", "last-modified")
+
+# Unread body up to this size is drained so the connection can be reused.
+# Reading the rest of a weather response costs far less than a new TLS
+# handshake; only runaway bodies are dropped.
+DRAIN_LIMIT = 65536
+
+
+def split_url(url):
+    """Return ``(host, port, path, tls)`` for an http(s) URL."""
+    scheme, _, rest = url.partition("://")
+    tls = scheme == "https"
+    host, _, path = rest.partition("/")
+    port = 443 if tls else 80
+    if ":" in host:
+        host, port = host.split(":", 1)
+        port = int(port)
+    return host, port, "/" + path, tls
+
+
+def _parse_header(line, headers):
+    i = line.find(b":")
+    name = str(line[:i], "utf-8").lower()
+    if name in KEEP_HEADERS:
+        headers[name] = str(line[i + 1:], "utf-8").strip()
+
+
+class Response:
+    """
+    Body stream of one response. Read it with ``readinto`` (HttpClient)
+    or ``areadinto`` (AsyncHttpClient), then ``close``/``aclose`` it.
+    """
+
+    def __init__(self, client, status, headers):
+        self.client = client
+        self.status = status
+        self.headers = headers
+        self.keep_alive = headers.get("connection", "").lower() != "close"
+        self.chunked = headers.get("transfer-encoding", "").lower() == "chunked"
+        self._chunk_left = 0
+        self._eof = False
+        length = headers.get("content-length")
+        if status == 204 or status == 304:
+            # No body, whatever the headers say.
+            self.chunked = False
+            length = "0"
+        if self.chunked:
+            self._left = -1
+        elif length is not None:
+            self._left = int(length)
+        else:
+            # Body runs until the server closes the connection.
+            self._left = -1
+            self.keep_alive = False
+        if self._left == 0:
+            self._eof = True
+
+    def _chunk_header(self, line):
+        # Blank lines are the CRLF that ends the previous chunk's data.
+        if not line:
+            return
+        size = int(line.split(b";")[0], 16)
+        if size == 0:
+            self._eof = True
+        self._chunk_left = size
+
+    def _ran_dry(self):
+        self._eof = True
+        if self._left > 0 or self.chunked:
+            self.keep_alive = False
+        return 0
+
+    def _take(self, b):
+        # Copy buffered body bytes into ``b``, within the current chunk/length.
+        c = self.client
+        n = min(len(b), c._end - c._pos)
+        if self.chunked:
+            n = min(n, self._chunk_left)
+            self._chunk_left -= n
+        elif self._left > 0:
+            n = min(n, self._left)
+            self._left -= n
+            if self._left == 0:
+                self._eof = True
+        b[:n] = c._mv[c._pos:c._pos + n]
+        c._pos += n
+        return n
+
+    def readinto(self, b):
+        c = self.client
+        if self._eof:
+            return 0
+        while self.chunked and self._chunk_left == 0:
+            self._chunk_header(c._readline())
+            if self._eof:
+                # Trailers end with an empty line.
+                while c._readline():
+                    pass
+                return 0
+        if c._pos >= c._end and not c._fill():
+            return self._ran_dry()
+        return self._take(b)
+
+    async def areadinto(self, b):
+        c = self.client
+        if self._eof:
+            return 0
+        while self.chunked and self._chunk_left == 0:
+            self._chunk_header(await c._readline())
+            if self._eof:
+                while await c._readline():
+                    pass
+                return 0
+        if c._pos >= c._end and not await c._fill():
+            return self._ran_dry()
+        return self._take(b)
+
+    def _release(self):
+        c = self.client
+        self.client = None
+        c._active = None
+        if not self._eof:
+            self.keep_alive = False
+        return c
+
+    def close(self):
+        """Finish the response, leaving the connection ready for reuse if possible."""
+        c = self.client
+        if c is None:
+            return
+        drained = 0
+        try:
+            while self.keep_alive and drained <= DRAIN_LIMIT:
+                n = self.readinto(c._scratch)
+                if not n:
+                    break
+                drained += n
+        except OSError:
+            self.keep_alive = False
+        self._release()
+        if not self.keep_alive:
+            c.close()
+
+    async def aclose(self):
+        c = self.client
+        if c is None:
+            return
+        drained = 0
+        try:
+            while self.keep_alive and drained <= DRAIN_LIMIT:
+                n = await self.areadinto(c._scratch)
+                if not n:
+                    break
+                drained += n
+        except OSError:
+            self.keep_alive = False
+        self._release()
+        if not self.keep_alive:
+            await c.aclose()
+
+
+class _Http:
+    """Buffer and header handling shared by the blocking and async clients."""
+
+    def __init__(self, bufsize, timeout):
+        self.buf = bytearray(bufsize)
+        self._mv = memoryview(self.buf)
+        self._scratch = self._mv[:bufsize // 2]
+        self._pos = 0
+        self._end = 0
+        self.timeout = timeout
+        self._addr = {}
+        self._host = None
+        self._ctx = None
+        self._active = None
+        self._session = None
+        self._session_host = None
+
+    def _resolve(self, host, port):
+        key = (host, port)
+        addr = self._addr.get(key)
+        if addr is None:
+            addr = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)[0][-1]
+            self._addr[key] = addr
+        return addr
+
+    def _context(self):
+        if self._ctx is None:
+            if hasattr(ssl, "create_default_context"):
+                self._ctx = ssl.create_default_context()
+            elif hasattr(ssl, "SSLContext"):
+                self._ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+                # Same as urequests: the device does not verify certificates.
+                self._ctx.verify_mode = ssl.CERT_NONE
+        return self._ctx
+
+    def _saved_session(self, host):
+        return self._session if self._session_host == host else None
+
+    def _keep_session(self, tls):
+        # TLS 1.3 tickets arrive after the handshake, so the session is
+        # picked up as the connection closes rather than once it opens.
+        session = getattr(tls, "session", None)
+        if session is not None:
+            self._session = session
+            self._session_host = self._host[0]
+
+    def _scan_line(self, line):
+        # Append buffered bytes up to the next LF; returns (line, complete).
+        # Header lines are short, so the copy is small.
+        i = self._pos
+        end = self._end
+        buf = self.buf
+        while i < end and buf[i] != 0x0A:
+            i += 1
+        line += bytes(self._mv[self._pos:i])
+        if i < end:
+            self._pos = i + 1
+            return line.rstrip(b"\r"), True
+        self._pos = end
+        return line, False
+
+    def _request_bytes(self, host, path, headers):
+        req = "GET %s HTTP/1.1\r\nHost: %s\r\nConnection: keep-alive\r\n" % (path, host)
+        if headers:
+            for k in headers:
+                req += "%s: %s\r\n" % (k, headers[k])
+        return (req + "\r\n").encode()
+
+    def _reset(self):
+        self._host = None
+        self._active = None
+        self._pos = 0
+        self._end = 0
+
+    def _reusable(self, host, port, tls):
+        # A different host, or a response abandoned mid-body, needs a new connection.
+        return self._host == (host, port, tls) and self._active is None
+
+
+class HttpClient(_Http):
+    """Blocking HTTP client that reuses one connection and one receive buffer."""
+
+    def __init__(self, bufsize=1024, timeout=10):
+        super().__init__(bufsize, timeout)
+        self._sock = None
+        self._io = None
+
+    # --- Connection handling ---
+    def _wrap(self, sock, host):
+        session = self._saved_session(host)
+        ctx = self._context()
+        if ctx is None:
+            return ssl.wrap_socket(sock, server_hostname=host)
+        if session is not None:
+            try:
+                return ctx.wrap_socket(sock, server_hostname=host, session=session)
+            except TypeError:
+                # TLS stack without session resumption.
+                self._session = None
+        return ctx.wrap_socket(sock, server_hostname=host)
+
+    def _connect(self, host, port, tls):
+        addr = self._resolve(host, port)
+        sock = socket.socket()
+        try:
+            sock.settimeout(self.timeout)
+            sock.connect(addr)
+            if tls:
+                sock = self._wrap(sock, host)
+        except OSError:
+            sock.close()
+            # The cached address may be stale.
+            self._addr.pop((host, port), None)
+            raise
+        self._sock = sock
+        self._io = sock if hasattr(sock, "readinto") else sock.makefile("rwb", 0)
+        self._reset()
+        self._host = (host, port, tls)
+
+    def close(self):
+        """Drop the connection; the address cache and TLS session are kept."""
+        if self._sock is not None:
+            self._keep_session(self._sock)
+            if self._io is not self._sock:
+                self._io.close()
+            self._sock.close()
+        self._sock = None
+        self._io = None
+        self._reset()
+
+    # --- Buffered I/O ---
+    def _fill(self):
+        n = self._io.readinto(self.buf)
+        self._pos = 0
+        self._end = n or 0
+        return self._end
+
+    def _readline(self):
+        line = b""
+        while True:
+            if self._pos >= self._end and not self._fill():
+                if line:
+                    return line
+                raise OSError("connection closed")
+            line, done = self._scan_line(line)
+            if done:
+                return line
+
+    def _write(self, data):
+        mv = memoryview(data)
+        while mv:
+            n = self._io.write(mv)
+            if n is None:
+                n = len(mv)
+            mv = mv[n:]
+
+    # --- Requests ---
+    def _request(self, host, path, headers):
+        self._write(self._request_bytes(host, path, headers))
+        status = int(self._readline().split(None, 2)[1])
+        resp_headers = {}
+        while True:
+            line = self._readline()
+            if not line:
+                break
+            _parse_header(line, resp_headers)
+        self._active = Response(self, status, resp_headers)
+        return self._active
+
+    def get(self, url, headers=None):
+        """
+        Send a GET for ``url`` and return its Response once the headers
+        are in. The connection is reused when the previous response left
+        it open, and reopened once if the server has since dropped it.
+        """
+        host, port, path, tls = split_url(url)
+        if not self._reusable(host, port, tls):
+            self.close()
+        if self._sock is not None:
+            try:
+                return self._request(host, path, headers)
+            except OSError:
+                # Idle connection closed by the server; start a fresh one.
+                self.close()
+        self._connect(host, port, tls)
+        try:
+            return self._request(host, path, headers)
+        except Exception:
+            self.close()
+            raise
+
+
+class _Resume:
+    """
+    Stands in for the SSL context in asyncio.open_connection, which has no
+    way to pass a session, and hands the saved one to the handshake.
+    """
+
+    def __init__(self, ctx, session):
+        self._ctx = ctx
+        self._session = session
+
+    def wrap_bio(self, incoming, outgoing, *args, **kwargs):
+        # CPython's asyncio does its TLS through a memory BIO.
+        return self._ctx.wrap_bio(incoming, outgoing, *args, session=self._session, **kwargs)
+
+    def wrap_socket(self, sock, *args, **kwargs):
+        try:
+            return self._ctx.wrap_socket(sock, *args, session=self._session, **kwargs)
+        except TypeError:
+            # TLS stack without session resumption.
+            return self._ctx.wrap_socket(sock, *args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._ctx, name)
+
+
+class AsyncHttpClient(_Http):
+    """
+    asyncio version of HttpClient: the same connection reuse and receive
+    buffer, but every wait on the network yields to the other tasks.
+    """
+
+    def __init__(self, bufsize=1024, timeout=10):
+        super().__init__(bufsize, timeout)
+        self._reader = None
+        self._writer = None
+
+    # --- Connection handling ---
+    async def _connect(self, host, port, tls):
+        # Connect to the cached address; the host name is still sent for SNI.
+        ip = self._resolve(host, port)[0]
+        try:
+            if tls:
+                ctx = self._context()
+                session = self._saved_session(host)
+                if session is not None:
+                    ctx = _Resume(ctx, session)
+                conn = asyncio.open_connection(ip, port, ssl=ctx, server_hostname=host)
+            else:
+                conn = asyncio.open_connection(ip, port)
+            self._reader, self._writer = await asyncio.wait_for(conn, self.timeout)
+        except (OSError, asyncio.TimeoutError):
+            self._addr.pop((host, port), None)
+            raise
+        self._reset()
+        self._host = (host, port, tls)
+
+    def close(self):
+        """Drop the connection; the address cache and TLS session are kept."""
+        if self._writer is not None:
+            if self._host is not None and self._host[2]:
+                try:
+                    self._keep_session(self._writer.get_extra_info("ssl_object"))
+                except (AttributeError, KeyError):
+                    pass  # MicroPython's streams don't expose the TLS object
+            self._writer.close()
+        self._reader = None
+        self._writer = None
+        self._reset()
+
+    async def aclose(self):
+        writer = self._writer
+        self.close()
+        if writer is not None:
+            try:
+                await writer.wait_closed()
+            except Exception:
+                pass
+
+    # --- Buffered I/O ---
+    async def _fill(self):
+        # Every read has the timeout, the body's as well as the headers': a
+        # server that stalls mid-response must not hold the fetch forever.
+        r = self._reader
+        try:
+            if hasattr(r, "readinto"):
+                n = await asyncio.wait_for(r.readinto(self.buf), self.timeout)
+            else:
+                data = await asyncio.wait_for(r.read(len(self.buf)), self.timeout)
+                n = len(data)
+                self.buf[:n] = data
+        except asyncio.TimeoutError:
+            self.close()
+            raise OSError("read timed out")
+        self._pos = 0
+        self._end = n or 0
+        return self._end
+
+    async def _readline(self):
+        line = b""
+        while True:
+            if self._pos >= self._end and not await self._fill():
+                if line:
+                    return line
+                raise OSError("connection closed")
+            line, done = self._scan_line(line)
+            if done:
+                return line
+
+    # --- Requests ---
+    async def _request(self, host, path, headers):
+        self._writer.write(self._request_bytes(host, path, headers))
+        await self._writer.drain()
+        status = int((await self._readline()).split(None, 2)[1])
+        resp_headers = {}
+        while True:
+            line = await self._readline()
+            if not line:
+                break
+            _parse_header(line, resp_headers)
+        self._active = Response(self, status, resp_headers)
+        return self._active
+
+    async def get(self, url, headers=None):
+        """Like HttpClient.get(); read the body with ``areadinto`` and finish with ``aclose``."""
+        host, port, path, tls = split_url(url)
+        if not self._reusable(host, port, tls):
+            await self.aclose()
+        if self._writer is not None:
+            try:
+                return await asyncio.wait_for(self._request(host, path, headers), self.timeout)
+            except (OSError, asyncio.TimeoutError):
+                # Idle connection closed by the server; start a fresh one.
+                await self.aclose()
+        await self._connect(host, port, tls)
+        try:
+            return await asyncio.wait_for(self._request(host, path, headers), self.timeout)
+        except BaseException:
+            await self.aclose()
+            raise
+
+
+async def aproject(response, projection, buf):
+    """Feed an AsyncHttpClient response body to a jsonstream.Projection; returns its values."""
+    while True:
+        n = await response.areadinto(buf)
+        if not n or projection.feed(buf, n):
+            return projection.out
+
+
+async def afill(response, buf):
+    """Read a response body into ``buf`` until it is full or the body ends; returns the bytes read."""
+    mv = memoryview(buf)
+    got = 0
+    while got < len(buf):
+        n = await response.areadinto(mv[got:])
+        if not n:
+            break
+        got += n
+    return got
@@ -0,0 +1,431 @@
+# Streaming field projection for JSON weather responses.
+# The body is fed in small chunks (from one reusable buffer) and only the
+# values at the requested key paths are kept, so the provider's full
+# document (minutely/hourly/daily arrays and all) never lands on the heap.
+#
+# Paths are tuples of object keys and array indices, e.g.
+#     ("current", "weather", 0, "id")
+# Use "*" in place of an index to collect that field from every element
+# of an array; the result for such a path is a list.
+#
+# Projection is push based, so it works the same whether the chunks come
+# from a blocking socket (see project()) or an asyncio stream.
+
+WILDCARD = "*"
+
+_DEFAULT_BUF = 256
+
+_WS = (0x20, 0x09, 0x0A, 0x0D)
+_END_OF_SCALAR = (0x2C, 0x7D, 0x5D, 0x20, 0x09, 0x0A, 0x0D)
+_ESCAPES = {0x62: 0x08, 0x66: 0x0C, 0x6E: 0x0A, 0x72: 0x0D, 0x74: 0x09}
+# UTF-8 for U+FFFD, put in place of a surrogate escape without its pair.
+_REPLACEMENT = b"\xef\xbf\xbd"
+
+
+def _scalar_value(text):
+    if text == b"true":
+        return True
+    if text == b"false":
+        return False
+    if text == b"null":
+        return None
+    if b"." in text or b"e" in text or b"E" in text:
+        return float(text)
+    return int(text)
+
+
+class Projection:
+    """
+    Incremental projector: ``feed()`` it the document chunk by chunk and
+    read ``out`` (values in the order of ``paths``) once it reports done.
+    """
+
+    def __init__(self, paths):
+        self.paths = paths
+        self.out = [None] * len(paths)
+        self.need = len(paths)
+        self.found = 0
+        for j, p in enumerate(paths):
+            if WILDCARD in p:
+                self.out[j] = []
+                self.need = -1
+        self.done = False
+        self._buf = b""
+        self._n = 0
+        self._i = 0
+        self._tmp = bytearray(32)
+        self._tlen = 0
+        self._esc = 0
+        self._cp = 0
+        self._high = 0
+        self._high_at = 0
+        self._depth = 0
+        self._in_str = False
+        self._gen = self._run()
+        next(self._gen)
+
+    def feed(self, buf, n=None):
+        """Parse the first ``n`` bytes of ``buf``; True once nothing more is needed."""
+        if self.done:
+            return True
+        self._buf = buf
+        self._n = len(buf) if n is None else n
+        self._i = 0
+        try:
+            next(self._gen)
+        except StopIteration:
+            self.done = True
+        # Never hold on to the caller's buffer.
+        self._buf = b""
+        return self.done
+
+    # --- Byte level helpers; each returns -1/False when the chunk runs out ---
+    def _sig(self):
+        buf, i, n = self._buf, self._i, self._n
+        while i < n:
+            c = buf[i]
+            i += 1
+            if c not in _WS:
+                self._i = i
+                return c
+        self._i = i
+        return -1
+
+    def _peek(self):
+        buf, i, n = self._buf, self._i, self._n
+        while i < n:
+            c = buf[i]
+            if c not in _WS:
+                self._i = i
+                return c
+            i += 1
+        self._i = i
+        return -1
+
+    def _put(self, c):
+        if self._tlen == len(self._tmp):
+            self._tmp.extend(self._tmp)
+        self._tmp[self._tlen] = c
+        self._tlen += 1
+
+    def _string(self):
+        # Collect a string body into _tmp, up to the closing quote.
+        buf, i, n = self._buf, self._i, self._n
+        while i < n:
+            c = buf[i]
+            i += 1
+            esc = self._esc
+            if esc == 0:
+                if c == 0x22:
+                    self._i = i
+                    return True
+                if c == 0x5C:
+                    self._esc = 1
+                else:
+                    self._put(c)
+            elif esc == 1:
+                if c == 0x75:
+                    self._esc = 2
+                    self._cp = 0
+                else:
+                    self._put(_ESCAPES.get(c, c))
+                    self._esc = 0
+            else:
+                self._cp = self._cp * 16 + int(chr(c), 16)
+                if esc == 5:
+                    self._codepoint(self._cp)
+                    self._esc = 0
+                else:
+                    self._esc = esc + 1
+        self._i = i
+        return False
+
+    def _codepoint(self, cp):
+        # Characters outside the BMP come as a \uD8xx\uDCxx pair. The first
+        # half goes in as U+FFFD and the second replaces it if it follows
+        # straight on, so a half on its own still decodes.
+        if 0xDC00 <= cp < 0xE000 and self._high and self._high_at == self._tlen:
+            self._tlen -= len(_REPLACEMENT)
+            cp = 0x10000 + ((self._high - 0xD800) << 10) + (cp - 0xDC00)
+            self._high = 0
+        elif 0xD800 <= cp < 0xE000:
+            for e in _REPLACEMENT:
+                self._put(e)
+            self._high = cp if cp < 0xDC00 else 0
+            self._high_at = self._tlen
+            return
+        for e in chr(cp).encode():
+            self._put(e)
+
+    def _scalar(self):
+        # Collect a number or literal into _tmp, up to (not past) its delimiter.
+        buf, i, n = self._buf, self._i, self._n
+        while i < n:
+            c = buf[i]
+            if c in _END_OF_SCALAR:
+                self._i = i
+                return True
+            self._put(c)
+            i += 1
+        self._i = i
+        return False
+
+    def _skip_string(self):
+        buf, i, n = self._buf, self._i, self._n
+        esc = self._esc
+        while i < n:
+            c = buf[i]
+            i += 1
+            if esc:
+                esc = 0
+            elif c == 0x5C:
+                esc = 1
+            elif c == 0x22:
+                self._i = i
+                self._esc = 0
+                return True
+        self._i = i
+        self._esc = esc
+        return False
+
+    def _skip_container(self):
+        buf, i, n = self._buf, self._i, self._n
+        depth, in_str, esc = self._depth, self._in_str, self._esc
+        while i < n:
+            c = buf[i]
+            i += 1
+            if in_str:
+                if esc:
+                    esc = 0
+                elif c == 0x5C:
+                    esc = 1
+                elif c == 0x22:
+                    in_str = False
+            elif c == 0x22:
+                in_str = True
+            elif c == 0x7B or c == 0x5B:
+                depth += 1
+            elif c == 0x7D or c == 0x5D:
+                depth -= 1
+                if not depth:
+                    self._i = i
+                    return True
+        self._i = i
+        self._depth, self._in_str, self._esc = depth, in_str, esc
+        return False
+
+    def _skip_scalar(self):
+        buf, i, n = self._buf, self._i, self._n
+        while i < n:
+            if buf[i] in _END_OF_SCALAR:
+                self._i = i
+                return True
+            i += 1
+        self._i = i
+        return False
+
+    # --- Resumable steps (generators that yield when they need more input) ---
+    def _next(self):
+        c = self._sig()
+        while c < 0:
+            yield
+            c = self._sig()
+        return c
+
+    def _key(self, c):
+        if c != 0x22:
+            raise ValueError("expected key")
+        self._tlen = 0
+        self._esc = 0
+        self._high = 0
+        while not self._string():
+            yield
+        key = str(self._tmp[:self._tlen], "utf-8")
+        c = self._sig()
+        if c < 0:
+            c = yield from self._next()
+        if c != 0x3A:
+            raise ValueError("expected ':'")
+        return key
+
+    def _atom(self, c):
+        if c == 0x22:
+            self._tlen = 0
+            self._esc = 0
+            self._high = 0
+            while not self._string():
+                yield
+            return str(self._tmp[:self._tlen], "utf-8")
+        self._tmp[0] = c
+        self._tlen = 1
+        while not self._scalar():
+            yield
+        return _scalar_value(bytes(self._tmp[:self._tlen]))
+
+    def _skip(self, c):
+        if c == 0x22:
+            self._esc = 0
+            while not self._skip_string():
+                yield
+        elif c == 0x7B or c == 0x5B:
+            self._depth = 1
+            self._in_str = False
+            self._esc = 0
+            while not self._skip_container():
+                yield
+        else:
+            while not self._skip_scalar():
+                yield
+
+    def _materialize(self, c):
+        # Build the whole value starting with ``c``; used only at wanted paths.
+        build = []
+        while True:
+            if c == 0x7B or c == 0x5B:
+                cont = {} if c == 0x7B else []
+                c = self._sig()
+                if c < 0:
+                    c = yield from self._next()
+                if c == 0x7D or c == 0x5D:
+                    v = cont
+                else:
+                    build.append([cont, None])
+                    if type(cont) is dict:
+                        build[-1][1] = yield from self._key(c)
+                        c = self._sig()
+                        if c < 0:
+                            c = yield from self._next()
+                    continue
+            else:
+                v = yield from self._atom(c)
+            while build:
+                cont, key = build[-1]
+                if type(cont) is list:
+                    cont.append(v)
+                else:
+                    cont[key] = v
+                c = self._sig()
+                if c < 0:
+                    c = yield from self._next()
+                if c == 0x2C:
+                    c = self._sig()
+                    if c < 0:
+                        c = yield from self._next()
+                    if type(cont) is dict:
+                        build[-1][1] = yield from self._key(c)
+                        c = self._sig()
+                        if c < 0:
+                            c = yield from self._next()
+                    break
+                if c != 0x7D and c != 0x5D:
+                    raise ValueError("expected ',' or close")
+                build.pop()
+                v = cont
+            else:
+                return v
+
+    def _match(self, live, depth, key):
+        # Split the live paths into those that end at ``key`` and those
+        # that continue below it.
+        term = None
+        deeper = None
+        is_index = isinstance(key, int)
+        for j in live:
+            p = self.paths[j]
+            k = p[depth]
+            if k == key or (is_index and k == WILDCARD):
+                if len(p) == depth + 1:
+                    if term is None:
+                        term = []
+                    term.append(j)
+                else:
+                    if deeper is None:
+                        deeper = []
+                    deeper.append(j)
+        return term, deeper
+
+    def _member(self, frame):
+        is_array, live, depth, index = frame
+        if is_array:
+            key = index
+        else:
+            c = self._sig()
+            if c < 0:
+                c = yield from self._next()
+            key = yield from self._key(c)
+        return self._match(live, depth, key)
+
+    def _store(self, term, v):
+        for j in term:
+            if WILDCARD in self.paths[j]:
+                self.out[j].append(v)
+            else:
+                self.out[j] = v
+                self.found += 1
+
+    def _run(self):
+        # Open containers on a wanted path: [is_array, live, depth, index]
+        stack = []
+        term = None
+        deeper = [j for j in range(len(self.paths)) if self.paths[j]]
+        depth = 0
+        while True:
+            c = self._sig()
+            if c < 0:
+                c = yield from self._next()
+            if term is not None:
+                self._store(term, (yield from self._materialize(c)))
+                if self.found == self.need:
+                    return
+            elif deeper is not None and (c == 0x7B or c == 0x5B):
+                frame = [c == 0x5B, deeper, depth, 0]
+                c = self._peek()
+                while c < 0:
+                    yield
+                    c = self._peek()
+                if c != 0x7D and c != 0x5D:
+                    stack.append(frame)
+                    term, deeper = yield from self._member(frame)
+                    depth = frame[2] + 1
+                    continue
+                self._i += 1
+            else:
+                yield from self._skip(c)
+            # After a value: next member, or close containers.
+            while stack:
+                c = self._sig()
+                if c < 0:
+                    c = yield from self._next()
+                frame = stack[-1]
+                if c == 0x2C:
+                    frame[3] += 1
+                    term, deeper = yield from self._member(frame)
+                    depth = frame[2] + 1
+                    break
+                if c != 0x7D and c != 0x5D:
+                    raise ValueError("expected ',' or close")
+                stack.pop()
+            else:
+                return
+
+
+def project(stream, paths, buf=None):
+    """
+    Read a JSON document from ``stream`` and return the values found at
+    ``paths``, in the same order. Missing paths give None, wildcard paths
+    give a list. Reading stops as soon as every plain path has been found.
+    ``buf`` is an optional preallocated bytearray used for reading.
+    """
+    if buf is None:
+        buf = bytearray(_DEFAULT_BUF)
+    p = Projection(paths)
+    readinto = getattr(stream, "readinto", None)
+    while True:
+        if readinto is not None:
+            n = readinto(buf)
+        else:
+            data = stream.read(len(buf))
+            n = len(data) if data else 0
+            buf[:n] = data
+        if not n or p.feed(buf, n):
+            return p.out
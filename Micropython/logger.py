@@ -0,0 +1,107 @@
+# Leveled, buffered logging for the scripts and shared modules.
+# Messages are registered once, at import, as %-templates and logged by
+# number with up to three arguments. Logging a message only stores the
+# number, level, ticks_ms() and the argument references in a preallocated
+# ring buffer: no string is built and nothing is written to the (slow) USB
+# serial port until flush() is called, which the scripts do when they are
+# idle (after a fetch, before a long sleep). When the ring is full the
+# oldest entries are overwritten and counted as dropped.
+#
+# Debug messages in hot loops are written ``if __debug__: log.debug(...)``
+# so that compiling with mpy-cross -O1 (or running micropython -O) removes
+# them from the bytecode entirely.
+
+from array import array
+from time import ticks_ms
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+_LETTERS = {DEBUG: "D", INFO: "I", WARNING: "W", ERROR: "E"}
+
+_NONE = object()  # "No argument", so that None can still be logged
+
+
+class Logger:
+    """Ring buffer of ``capacity`` log entries; entries below ``level`` are not kept."""
+
+    def __init__(self, capacity=32, level=INFO):
+        self.level = level
+        self.templates = []
+        self.capacity = capacity
+        self._ids = bytearray(capacity)
+        self._levels = bytearray(capacity)
+        self._times = array("i", bytes(4 * capacity))
+        self._args = [_NONE] * (3 * capacity)
+        self._next = 0
+        self._count = 0
+        self.dropped = 0
+
+    def message(self, template):
+        """Register a %-template; returns the id to log it by."""
+        if len(self.templates) > 255:
+            raise ValueError("too many log messages")
+        self.templates.append(template)
+        return len(self.templates) - 1
+
+    def log(self, level, msg, a=_NONE, b=_NONE, c=_NONE):
+        if level < self.level:
+            return
+        i = self._next
+        self._ids[i] = msg
+        self._levels[i] = level
+        self._times[i] = ticks_ms()
+        args = self._args
+        args[3 * i] = a
+        args[3 * i + 1] = b
+        args[3 * i + 2] = c
+        self._next = i + 1 if i + 1 < self.capacity else 0
+        if self._count < self.capacity:
+            self._count += 1
+        else:
+            self.dropped += 1
+
+    def debug(self, msg, a=_NONE, b=_NONE, c=_NONE):
+        self.log(DEBUG, msg, a, b, c)
+
+    def info(self, msg, a=_NONE, b=_NONE, c=_NONE):
+        self.log(INFO, msg, a, b, c)
+
+    def warning(self, msg, a=_NONE, b=_NONE, c=_NONE):
+        self.log(WARNING, msg, a, b, c)
+
+    def error(self, msg, a=_NONE, b=_NONE, c=_NONE):
+        self.log(ERROR, msg, a, b, c)
+
+    def pending(self):
+        return self._count
+
+    def format(self, i):
+        """Entry ``i`` of the ring as a line of text."""
+        template = self.templates[self._ids[i]]
+        args = [v for v in self._args[3 * i:3 * i + 3] if v is not _NONE]
+        text = template % tuple(args) if args else template
+        return "%9d %s %s" % (self._times[i], _LETTERS.get(self._levels[i], "?"), text)
+
+    def flush(self, limit=None):
+        """Print up to ``limit`` of the oldest entries (all by default)."""
+        if self.dropped:
+            print("%d log messages dropped" % self.dropped)
+            self.dropped = 0
+        n = self._count if limit is None else min(limit, self._count)
+        first = self._next - self._count
+        if first < 0:
+            first += self.capacity
+        for k in range(n):
+            i = first + k
+            if i >= self.capacity:
+                i -= self.capacity
+            print(self.format(i))
+            # Let go of the arguments so the ring doesn't keep them alive.
+            self._args[3 * i] = self._args[3 * i + 1] = self._args[3 * i + 2] = _NONE
+        self._count -= n
+
+
+# Shared by the scripts and the modules they use.
+log = Logger()
@@ -0,0 +1,34 @@
+# Freezes the shared modules into a MicroPython firmware build. Frozen
+# modules are compiled once, on the PC, and run from flash: nothing is
+# parsed or compiled at boot and their bytecode takes no RAM.
+#
+#   make -C ports/rp2 BOARD=RPI_PICO_W FROZEN_MANIFEST=/path/to/Micropython/manifest.py
+#
+# Then copy only the script (and neopixel.py) to the board. host/build_mpy.py
+# compiles the same list to .mpy files instead, for a stock firmware.
+
+MODULES = (
+    "calibration.py",
+    "conditions.py",
+    "dualcore.py",
+    "forecast.py",
+    "frames.py",
+    "httpclient.py",
+    "jsonstream.py",
+    "logger.py",
+    "motion.py",
+    "obscache.py",
+    "particles.py",
+    "power.py",
+    "providers.py",
+    "quota.py",
+    "supervisor.py",
+    "telemetry.py",
+    "wxrecord.py",
+)
+
+include("$(BOARD_DIR)/manifest.py")
+
+for name in MODULES:
+    # -O1: log.debug() calls under "if __debug__" are compiled out.
+    module(name, opt=1)
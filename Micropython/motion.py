@@ -0,0 +1,117 @@
+# Servo motion planner.
+# A move is planned up front as an eased (S-curve) trajectory, one angle per
+# tick, and then played back either by an asyncio task (run()) or by a
+# machine.Timer callback (attach()). Nothing blocks while the servo moves.
+# Once the servo has reached the target and had settle_ms to get there,
+# the PWM is released so it stops hunting and drawing current.
+
+from array import array
+from time import ticks_ms, ticks_us, ticks_diff, ticks_add
+from telemetry import SERVO
+
+try:
+    import asyncio
+except ImportError:
+    import uasyncio as asyncio
+
+_Q = 12  # Fixed-point bits for the easing curve
+_ONE = 1 << _Q
+
+
+def _ease(u):
+    # Smoothstep 3u^2 - 2u^3, u and result in fixed point.
+    return (u * u * (3 * _ONE - 2 * u)) >> (2 * _Q)
+
+
+class ServoMotion:
+    """
+    ``write(angle)`` drives the servo to a whole-degree angle and
+    ``release()`` stops the pulses. ``ms_per_degree`` sets the average
+    speed; the easing makes moves start and finish gently. With
+    ``telemetry``, each move's time until release goes to its SERVO stage.
+    """
+
+    def __init__(self, write, release, position=90, ms_per_degree=20, tick_ms=20, settle_ms=500,
+                 telemetry=None):
+        self.write = write
+        self.release = release
+        self.position = position
+        self.target = position
+        self.ms_per_degree = ms_per_degree
+        self.tick_ms = tick_ms
+        self.settle_ticks = max(1, settle_ms // tick_ms)
+        self._path = array("B")
+        self._step = 0
+        self._settle = 0
+        self._timer = None
+        self._wake = asyncio.Event()
+        self.telemetry = telemetry
+        self._started = 0
+
+    @property
+    def busy(self):
+        """True while the servo is moving or settling."""
+        return self._step < len(self._path) or self._settle > 0
+
+    def move_to(self, target):
+        """Plan a move to ``target``, replacing any move under way."""
+        target = max(0, min(180, int(target)))
+        start = self.position
+        distance = target - start
+        ticks = max(1, abs(distance) * self.ms_per_degree // self.tick_ms)
+        path = array("B", bytes(ticks))
+        for k in range(ticks):
+            e = _ease(((k + 1) << _Q) // ticks)
+            path[k] = start + ((distance * e + (_ONE >> 1)) >> _Q)
+        self.target = target
+        self._path = path
+        self._step = 0
+        self._settle = self.settle_ticks
+        self._started = ticks_us()
+        if self._timer is not None:
+            self._timer.init(mode=self._timer.PERIODIC, period=self.tick_ms, callback=self._on_timer)
+        self._wake.set()
+
+    def step(self):
+        """Advance one tick; False once the servo has settled and been released."""
+        if self._step < len(self._path):
+            angle = self._path[self._step]
+            self._step += 1
+            if angle != self.position or self._step == 1:
+                self.write(angle)
+                self.position = angle
+            return True
+        if self._settle > 0:
+            self._settle -= 1
+            if not self._settle:
+                self.release()
+                if self.telemetry is not None:
+                    self.telemetry.stop(SERVO, self._started)
+                return False
+            return True
+        return False
+
+    def _on_timer(self, timer):
+        if not self.step():
+            timer.deinit()
+
+    def attach(self, timer):
+        """Drive moves from ``timer`` (a machine.Timer) instead of run()."""
+        self._timer = timer
+
+    async def run(self):
+        """Drive moves from asyncio; sleeps while the servo is idle."""
+        while True:
+            if not self.busy:
+                self._wake.clear()
+                await self._wake.wait()
+            deadline = ticks_ms()
+            while self.step():
+                deadline = ticks_add(deadline, self.tick_ms)
+                wait = ticks_diff(deadline, ticks_ms())
+                await asyncio.sleep_ms(wait if wait > 0 else 0)
+
+    async def wait(self):
+        """Wait until the current move has settled."""
+        while self.busy:
+            await asyncio.sleep_ms(self.tick_ms)
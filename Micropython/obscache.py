@@ -0,0 +1,120 @@
+# On-flash cache of the last weather observation.
+# The cached value is shown straight away at boot and whenever a fetch
+# fails; it is refreshed once its TTL has run out, and the stored
+# ETag/Last-Modified let an unchanged response come back as a 304. They
+# are kept with the name of the provider they came from (providers.py),
+# since another provider's server can't make sense of them.
+#
+# On flash: a magic, the observation as a packed wxrecord, the time it
+# was saved, then the two validators and the provider's name as
+# length-prefixed strings.
+
+import os
+import struct
+from time import ticks_ms, ticks_diff
+from logger import log
+from wxrecord import SIZE, unix_now, pack_into, code_of, is_day
+
+_WRITE_FAILED = log.message("Failed to write weather cache: %s")
+
+_MAGIC = b"WXO2"
+_HEADER = "<4sIBBB"  # magic, saved (unix time), len(etag), len(last_modified), len(source)
+_HEADER_SIZE = struct.calcsize(_HEADER)
+
+
+class ObservationCache:
+    """
+    Last parsed observation, persisted to flash with its validators.
+    ``obs`` is a dict with the condition ``code`` and ``night``;
+    ``source`` names the provider the validators are for.
+    """
+
+    def __init__(self, path, ttl_ms):
+        self.path = path
+        self.ttl_ms = ttl_ms
+        self.obs = None
+        self.etag = None
+        self.last_modified = None
+        self.source = None
+        self.saved = 0         # unix time of the last write to flash
+        self.record = bytearray(SIZE)
+        self.checked = None    # ticks_ms() of the last fetch or 304 this session
+
+    def load(self):
+        """Read the cached observation from flash; returns it, or None."""
+        try:
+            with open(self.path, "rb") as f:
+                header = f.read(_HEADER_SIZE)
+                if len(header) != _HEADER_SIZE:
+                    return None
+                magic, saved, etag_len, modified_len, source_len = struct.unpack(_HEADER, header)
+                if magic != _MAGIC or f.readinto(self.record) != SIZE:
+                    return None
+                validators = f.read(etag_len + modified_len + source_len)
+        except (OSError, ValueError):
+            return None
+        if len(validators) != etag_len + modified_len + source_len:
+            return None
+        self.obs = {"code": code_of(self.record), "night": not is_day(self.record)}
+        self.etag = validators[:etag_len].decode() or None
+        self.last_modified = validators[etag_len:etag_len + modified_len].decode() or None
+        self.source = validators[etag_len + modified_len:].decode() or None
+        self.saved = saved
+        # Ticks restart at boot, so a loaded value always counts as stale.
+        self.checked = None
+        return self.obs
+
+    def fresh(self):
+        return self.checked is not None and ticks_diff(ticks_ms(), self.checked) < self.ttl_ms
+
+    def expires_in(self):
+        """Milliseconds until the cached value goes stale (0 if it already is)."""
+        if self.checked is None:
+            return 0
+        return max(0, self.ttl_ms - ticks_diff(ticks_ms(), self.checked))
+
+    def validators(self):
+        """Conditional request headers for the cached response, or None."""
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers or None
+
+    def revalidated(self):
+        """The provider answered 304: the cached value is current again."""
+        self.checked = ticks_ms()
+
+    def update(self, obs, etag=None, last_modified=None, source=None):
+        """
+        Store a freshly fetched observation, with the validators from
+        provider ``source``; flash is only written when something changed.
+        """
+        self.checked = ticks_ms()
+        if (obs == self.obs and etag == self.etag and last_modified == self.last_modified
+                and source == self.source):
+            return
+        self.obs = obs
+        self.etag = etag
+        self.last_modified = last_modified
+        self.source = source
+        self.saved = unix_now()
+        pack_into(self.record, 0, self.saved, obs["code"], not obs["night"])
+        etag = (etag or "").encode()
+        modified = (last_modified or "").encode()
+        name = (source or "").encode()
+        if len(etag) > 255 or len(modified) > 255 or len(name) > 255:
+            # Too long to store: the next fetch is just unconditional.
+            etag = modified = name = b""
+        tmp = self.path + ".tmp"
+        try:
+            with open(tmp, "wb") as f:
+                f.write(struct.pack(_HEADER, _MAGIC, self.saved, len(etag), len(modified), len(name)))
+                f.write(self.record)
+                f.write(etag)
+                f.write(modified)
+                f.write(name)
+            os.rename(tmp, self.path)
+        except OSError as e:
+            log.warning(_WRITE_FAILED, e)
@@ -0,0 +1,52 @@
+# Fixed-capacity particle pool for the precipitation effects.
+# Particles live in preallocated arrays and dead slots are recycled through
+# a free list, so once an effect is running, spawning and retiring
+# particles allocates nothing and the GC has nothing to collect mid-frame.
+#
+# Positions, velocities and brightness are plain ints in whatever fixed
+# point the effect uses. Loop over live particles with
+#     for i in range(pool.capacity):
+#         if pool.alive[i]:
+#             ...
+
+from array import array
+
+
+class ParticlePool:
+    """``capacity`` particles, each with a position, velocity and brightness."""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.pos = array("i", bytes(4 * capacity))
+        self.vel = array("i", bytes(4 * capacity))
+        self.level = array("i", bytes(4 * capacity))
+        self.alive = bytearray(capacity)
+        self.count = 0
+        # Stack of free slots; _top is how many are free.
+        self._free = array("H", range(capacity - 1, -1, -1))
+        self._top = capacity
+
+    def spawn(self, pos, vel=0, level=0):
+        """Start a particle; returns its slot, or -1 if the pool is full."""
+        if not self._top:
+            return -1
+        self._top -= 1
+        i = self._free[self._top]
+        self.pos[i] = pos
+        self.vel[i] = vel
+        self.level[i] = level
+        self.alive[i] = 1
+        self.count += 1
+        return i
+
+    def kill(self, i):
+        """Retire the particle in slot ``i``."""
+        if self.alive[i]:
+            self.alive[i] = 0
+            self._free[self._top] = i
+            self._top += 1
+            self.count -= 1
+
+    def clear(self):
+        for i in range(self.capacity):
+            self.kill(i)
@@ -0,0 +1,172 @@
+# Low-power waits between weather fetches.
+# While the display is static (a steady colour, the servo settled and
+# released) nothing needs the CPU until the next fetch, so the board can
+# sleep instead of idling with Wi-Fi associated: the radio is switched off
+# and the wait is spent in machine.lightsleep(), which keeps RAM, or
+# machine.deepsleep(), which restarts the board when it wakes. Before a
+# deep sleep the display state (servo angle, LED colour, condition) is
+# saved, to RTC memory where the port has it and to flash otherwise, and
+# load_wake() hands it back at boot so the script can put the display
+# straight back instead of sweeping the servo. The NeoPixels hold their
+# colour on their own for as long as they have power.
+#
+# The same state also goes to flash (save_display()) each time the servo
+# settles somewhere new, so that after a power cut or a reset the last
+# condition is back on the dial and the LEDs from the first frame, before
+# the network is up.
+
+import os
+import struct
+import machine
+from time import ticks_ms, ticks_diff, ticks_add
+from logger import log
+
+try:
+    import asyncio
+except ImportError:
+    import uasyncio as asyncio
+
+LIGHT = "light"
+DEEP = "deep"
+
+WAKE_FILE = "wake.bin"
+DISPLAY_FILE = "display.bin"
+_MAGIC = b"WAKE"
+_FORMAT = "<4sBBBBHB"  # magic, servo angle, r, g, b, condition code, night
+_POLL_MS = 250
+# Longest wait for a fade or servo move to finish. The display only changes
+# after a fetch, so an effect still moving by then is animated (rain, snow)
+# and the board stays awake until the next fetch.
+SETTLE_MS = 30000
+
+_SLEEPING = log.message("Display static: sleeping %d ms with Wi-Fi off.")
+_DISPLAY_WRITE_FAILED = log.message("Failed to save display state: %s")
+
+_saved_display = None  # Last record written by save_display()
+
+
+def _pack(angle, color, code, night):
+    return struct.pack(_FORMAT, _MAGIC, angle, color[0], color[1], color[2], code, 1 if night else 0)
+
+
+def _unpack(data):
+    if len(data) != struct.calcsize(_FORMAT):
+        return None
+    magic, angle, r, g, b, code, night = struct.unpack(_FORMAT, data)
+    if magic != _MAGIC:
+        return None
+    return angle, (r, g, b), code, bool(night)
+
+
+def save_display(angle, color, code, night, path=DISPLAY_FILE):
+    """Keep the display state in flash for the next boot; unchanged state isn't rewritten."""
+    global _saved_display
+    data = _pack(angle, color, code, night)
+    if data == _saved_display:
+        return
+    try:
+        with open(path, "wb") as f:
+            f.write(data)
+        _saved_display = data
+    except OSError as e:
+        log.warning(_DISPLAY_WRITE_FAILED, e)
+
+
+def load_display(path=DISPLAY_FILE):
+    """The ``(angle, color, code, night)`` last saved by save_display(), or None."""
+    global _saved_display
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError:
+        return None
+    state = _unpack(data)
+    if state is not None:
+        _saved_display = data
+    return state
+
+
+def save_wake(angle, color, code, night, path=WAKE_FILE):
+    """Keep the display state over a deep sleep."""
+    data = _pack(angle, color, code, night)
+    try:
+        machine.RTC().memory(data)
+        return
+    except (AttributeError, OSError, ValueError):
+        pass  # No RTC memory on this port (the RP2040 has none)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def load_wake(path=WAKE_FILE):
+    """
+    The ``(angle, color, code, night)`` saved by save_wake(), or None after
+    an ordinary boot. It is cleared once read.
+    """
+    data = None
+    try:
+        rtc = machine.RTC()
+        data = rtc.memory()
+        if data:
+            rtc.memory(b"")
+    except (AttributeError, OSError, ValueError):
+        pass
+    if not data:
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.remove(path)
+        except OSError:
+            return None
+    return _unpack(data)
+
+
+class PowerSaver:
+    """
+    Waits between fetches. ``mode`` is None (stay awake), LIGHT or DEEP;
+    ``idle()`` says whether the display is static, and ``state()`` gives
+    the ``(angle, color, code, night)`` to save before a deep sleep.
+    """
+
+    def __init__(self, wlan, mode=None, idle=None, state=None):
+        self.wlan = wlan
+        self.mode = mode
+        self.idle = idle
+        self.state = state
+        self.sleeps = 0
+        self.slept_ms = 0
+
+    async def wait(self, ms):
+        """Wait ``ms``; once the display is static the rest of the wait is slept."""
+        if not self.mode:
+            await asyncio.sleep_ms(ms)
+            return
+        end = ticks_add(ticks_ms(), ms)
+        settle = ticks_add(ticks_ms(), min(ms, SETTLE_MS))
+        # Let the display pick up what the fetch changed, then let its fade
+        # and servo move finish first.
+        await asyncio.sleep_ms(_POLL_MS)
+        while self.idle is not None and not self.idle():
+            if ticks_diff(settle, ticks_ms()) <= 0:
+                left = ticks_diff(end, ticks_ms())
+                if left > 0:
+                    await asyncio.sleep_ms(left)
+                return
+            await asyncio.sleep_ms(_POLL_MS)
+        left = ticks_diff(end, ticks_ms())
+        if left > 0:
+            self.sleep(left)
+
+    def sleep(self, ms):
+        """Switch Wi-Fi off and sleep the board for ``ms``; Wi-Fi is back on (not connected) after."""
+        log.info(_SLEEPING, ms)
+        log.flush()  # USB serial may drop while asleep
+        self.wlan.disconnect()
+        self.wlan.active(False)
+        if self.mode == DEEP and self.state is not None:
+            save_wake(*self.state())
+            machine.deepsleep(ms)  # Restarts the board; does not return
+        machine.lightsleep(ms)
+        self.sleeps += 1
+        self.slept_ms += ms
+        self.wlan.active(True)
@@ -0,0 +1,266 @@
+# Weather providers and the choice between them.
+# Each Provider knows one API: the URL for the current weather, how to
+# read the condition and day/night out of the response, and the code space
+# its conditions are in. ProviderPool keeps a rolling average of each
+# provider's latency and error rate and sends each check to the fastest
+# healthy one. If that hasn't answered within ``hedge_ms`` the same check
+# goes to the next one as well, and whichever answers first is used (the
+# other is cancelled); if it fails, the next one is asked straight away.
+# So one slow or failing upstream no longer holds up the display.
+# Conditions come back in the pool's code space (conditions.convert), and
+# providers take turns without any change to a script's condition table.
+#
+# Every provider has its own HTTP client and buffers, since a hedged check
+# has two requests in flight.
+
+from time import ticks_ms, ticks_diff
+from jsonstream import Projection
+from httpclient import AsyncHttpClient, aproject, afill
+from conditions import WMO, OWM, convert
+from logger import log
+import wxrecord
+
+try:
+    import asyncio
+except ImportError:
+    import uasyncio as asyncio
+
+# Weight of each new sample in the rolling averages, as a shift: 1/4.
+_LATENCY_SHIFT = 2
+_ERROR_WEIGHT = 0.25
+# A provider's error rate halves every this long after it was last asked,
+# so one that failed gets tried first again once it has had time to recover.
+_ERROR_HALF_LIFE_MS = 5 * 60 * 1000
+# Above this error rate a provider is only asked when the healthy ones fail.
+_UNHEALTHY = 0.3  # Two failures in a row
+# Latency assumed for a provider not yet measured when there is no hedging.
+_UNMEASURED_MS = 10000
+
+_HEDGING = log.message("%s slow; asking %s too.")
+_FAILING_OVER = log.message("%s failed (%s); asking %s.")
+
+
+class Provider:
+    """
+    One weather API. A subclass sets ``name``, ``codes`` (its code space),
+    ``FIELDS`` (the paths to project from the response) and ``query``
+    (appended to ``url``), and defines ``read(values)``, which turns the
+    projected FIELDS into ``(code, night)``. With ``records``, the API is
+    weatherproxy.py and answers with packed wxrecord records.
+    """
+
+    name = None
+    codes = None
+    FIELDS = ()
+    query = ""
+
+    def __init__(self, url, http=None, records=False):
+        self.url = url
+        self.http = http if http is not None else AsyncHttpClient()
+        self.records = records
+        self.buf = bytearray(256)
+        self.record = bytearray(wxrecord.SIZE)
+        self.latency = 0  # Rolling average, ms; 0 until measured
+        self.errors = 0.0  # Rolling failure rate, 0-1
+        self.calls = 0
+        self.failures = 0
+        self._sampled_at = ticks_ms()
+
+    def current_url(self):
+        return self.url + self.query
+
+    def health(self):
+        """The error rate, decayed since the provider was last asked."""
+        if not self.errors:
+            return 0.0
+        return self.errors * 0.5 ** (ticks_diff(ticks_ms(), self._sampled_at) / _ERROR_HALF_LIFE_MS)
+
+    def sample(self, ms, ok=None):
+        """Add a latency sample, and with ``ok`` True or False an outcome."""
+        if self.latency:
+            self.latency += (ms - self.latency) >> _LATENCY_SHIFT
+        else:
+            self.latency = ms
+        if ok is None:
+            return
+        self.calls += 1
+        if ok:
+            self.errors = self.health() * (1 - _ERROR_WEIGHT)
+        else:
+            self.errors = self.health() * (1 - _ERROR_WEIGHT) + _ERROR_WEIGHT
+            self.failures += 1
+        self._sampled_at = ticks_ms()
+
+    async def fetch(self, validators=None):
+        """
+        ``(code, night, etag, last_modified)`` for the current weather, or
+        None if the server answered 304 to ``validators``.
+        """
+        url = self.current_url()
+        if self.records:
+            url += "&format=record"
+        response = await self.http.get(url, validators)
+        if response.status == 304:
+            await response.aclose()
+            return None
+        if response.status != 200:
+            await response.aclose()
+            raise OSError(f"HTTP {response.status}")
+        if self.records:
+            if await afill(response, self.record) != wxrecord.SIZE:
+                raise ValueError("short record")
+            code, night = wxrecord.code_of(self.record), not wxrecord.is_day(self.record)
+        else:
+            code, night = self.read(await aproject(response, Projection(self.FIELDS), self.buf))
+        etag = response.headers.get("etag")
+        last_modified = response.headers.get("last-modified")
+        await response.aclose()
+        return code, night, etag, last_modified
+
+
+class OpenMeteo(Provider):
+    """Open-Meteo's forecast API; no key needed."""
+
+    name = "Open-Meteo"
+    codes = WMO
+    FIELDS = (("current_weather", "weathercode"), ("current_weather", "is_day"))
+
+    def __init__(self, lat, lon, url="https://api.open-meteo.com/v1/forecast", **kwargs):
+        super().__init__(url, **kwargs)
+        self.query = f"?latitude={lat}&longitude={lon}&current_weather=true"
+
+    def read(self, values):
+        code, is_day = values
+        return int(code), is_day == 0
+
+
+class OpenWeatherMap(Provider):
+    """OpenWeatherMap's One Call API, with the key ``key``."""
+
+    name = "OpenWeatherMap"
+    codes = OWM
+    FIELDS = (("current", "weather", 0, "id"), ("current", "dt"), ("current", "sunrise"), ("current", "sunset"))
+
+    def __init__(self, lat, lon, key, url="https://api.openweathermap.org/data/3.0/onecall", **kwargs):
+        super().__init__(url, **kwargs)
+        self.query = f"?lat={lat}&lon={lon}&appid={key}&units=metric&exclude=minutely,hourly,daily,alerts"
+
+    def read(self, values):
+        code, now, sunrise, sunset = values
+        return int(code), now >= sunset or now <= sunrise
+
+
+class _Attempt:
+    def __init__(self, provider):
+        self.provider = provider
+        self.started = ticks_ms()
+        self.task = None
+        self.done = False
+        self.value = None
+        self.error = None
+
+
+class ProviderPool:
+    """
+    Checks the current weather with ``providers``, in order of preference
+    until they have been measured, and returns conditions in code space
+    ``codes``. ``hedge_ms`` None turns hedging off (failover only).
+    """
+
+    def __init__(self, providers, codes, hedge_ms=2500):
+        self.providers = providers
+        self.codes = codes
+        self.hedge_ms = hedge_ms
+        self.hedged = 0
+        self.failovers = 0
+        self.last = None  # Whose answer came back last
+        self._finished = asyncio.Event()
+
+    def ranked(self):
+        """The providers, best first: healthy before unhealthy, then fastest."""
+        # Not measured yet: as slow as we are prepared to wait before hedging.
+        unknown = self.hedge_ms if self.hedge_ms is not None else _UNMEASURED_MS
+        order = list(range(len(self.providers)))
+        order.sort(key=lambda i: (self.providers[i].health() > _UNHEALTHY,
+                                  self.providers[i].latency or unknown, i))
+        return [self.providers[i] for i in order]
+
+    def named(self, name):
+        """The provider called ``name``, or None."""
+        for provider in self.providers:
+            if provider.name == name:
+                return provider
+        return None
+
+    async def current(self, validators=None, source=None):
+        """
+        ``(code, night, etag, last_modified)`` from the first provider to
+        answer (then ``last``), or None if the provider named ``source``,
+        whose response ``validators`` came from, answered 304. The
+        validators only go to that provider. Raises the last error if
+        every provider failed.
+        """
+        validated = self.named(source) if validators else None
+        waiting = self.ranked()
+        running = []
+        error = None
+        self._finished.clear()
+        self._start(waiting.pop(0), running, validators, validated)
+        try:
+            while True:
+                hedge = self.hedge_ms if waiting and self.hedge_ms is not None else None
+                try:
+                    if hedge is None:
+                        await self._finished.wait()
+                    else:
+                        await asyncio.wait_for(self._finished.wait(), hedge / 1000)
+                except asyncio.TimeoutError:
+                    self.hedged += 1
+                    log.info(_HEDGING, running[-1].provider.name, waiting[0].name)
+                    self._start(waiting.pop(0), running, validators, validated)
+                    continue
+                self._finished.clear()
+                for attempt in running:
+                    if attempt.done and attempt.error is None:
+                        return self._result(attempt)
+                for attempt in [a for a in running if a.done]:
+                    running.remove(attempt)
+                    error = attempt.error
+                    if waiting and not running:
+                        self.failovers += 1
+                        log.warning(_FAILING_OVER, attempt.provider.name, error, waiting[0].name)
+                        self._start(waiting.pop(0), running, validators, validated)
+                if not running:
+                    raise error
+        finally:
+            for attempt in running:
+                if not attempt.done:
+                    attempt.task.cancel()
+
+    def _start(self, provider, running, validators, validated):
+        attempt = _Attempt(provider)
+        attempt.task = asyncio.create_task(self._run(attempt, validators if provider is validated else None))
+        running.append(attempt)
+
+    async def _run(self, attempt, validators):
+        provider = attempt.provider
+        try:
+            attempt.value = await provider.fetch(validators)
+        except asyncio.CancelledError:
+            # Lost the race: at least this slow. Its connection is mid-response.
+            provider.sample(ticks_diff(ticks_ms(), attempt.started))
+            provider.http.close()
+            raise
+        except Exception as e:
+            attempt.error = e
+        provider.sample(ticks_diff(ticks_ms(), attempt.started), attempt.error is None)
+        attempt.done = True
+        self._finished.set()
+
+    def _result(self, attempt):
+        value = attempt.value
+        self.last = attempt.provider
+        if value is None:
+            return None  # 304: only ever from the validated provider
+        code, night, etag, last_modified = value
+        return convert(code, attempt.provider.codes, self.codes), night, etag, last_modified
@@ -0,0 +1,372 @@
+"""
+LAN caching proxy for the weather APIs, for buildings with many houses:
+
+    python3 Micropython/proxy/weatherproxy.py --port 8080 --owm-key YOURAPIKEY
+
+Point a house's api_url at it over plain HTTP, keeping the API's path:
+http://<proxy>:8080/v1/forecast (Open-Meteo) or
+http://<proxy>:8080/data/3.0/onecall (OpenWeatherMap). Queries are the
+ones the scripts already send.
+
+Coordinates are rounded to a grid (--grid degrees, 0.05 by default, about
+5 km), and each grid cell, provider and request kind (current conditions
+or hourly forecast) is fetched upstream at most once per TTL, whichever
+format the houses ask for (and, without --owm-key, separately for each
+house's own OpenWeatherMap key). Houses asking
+for the same cell while a fetch is under way wait for that fetch instead
+of starting their own. Responses are cut down to the fields the scripts
+read, keeping the upstream layout so the scripts' projections work
+unchanged, and carry an ETag so an unchanged answer is a 304. With
+``format=record`` added to the query the answer is packed wxrecord records
+instead (one for current conditions, one per hour for a forecast), which
+the house reads without parsing. If upstream fails, the last answer is
+served even after its TTL. GET /stats shows the counters.
+
+Needs only the Python 3 standard library and ../wxrecord.py.
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlencode, urlsplit
+from urllib.request import urlopen
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import wxrecord  # noqa: E402
+
+OPEN_METEO = "https://api.open-meteo.com"
+OWM = "https://api.openweathermap.org"
+
+CURRENT = "current"
+HOURLY = "hourly"
+
+JSON = "application/json"
+RECORD = "application/octet-stream"
+
+
+def fetch_json(url, timeout=15):
+    with urlopen(url, timeout=timeout) as r:
+        return json.load(r)
+
+
+# --- Projections: the fields each script reads, in the upstream layout ---
+
+def open_meteo_current(doc):
+    cw = doc["current_weather"]
+    return {"current_weather": {"weathercode": cw["weathercode"], "is_day": cw["is_day"],
+                                "time": cw.get("time")}}
+
+
+def open_meteo_hourly(doc):
+    hourly = doc["hourly"]
+    return {"hourly": {k: hourly[k] for k in ("time", "weathercode", "is_day")}}
+
+
+def _owm_weather(item):
+    w = item["weather"][0]
+    return [{"id": w["id"], "icon": w.get("icon", "")}]
+
+
+def owm_current(doc):
+    c = doc["current"]
+    return {"current": {"dt": c["dt"], "sunrise": c.get("sunrise"), "sunset": c.get("sunset"),
+                        "weather": _owm_weather(c)}}
+
+
+def owm_hourly(doc):
+    return {"hourly": [{"dt": h["dt"], "weather": _owm_weather(h)} for h in doc["hourly"]]}
+
+
+# --- The same answers as packed records ---
+
+def _records(rows):
+    buf = bytearray(len(rows) * wxrecord.SIZE)
+    for i, row in enumerate(rows):
+        wxrecord.pack_into(buf, i, *row)
+    return bytes(buf)
+
+
+def _owm_precip(item):
+    # "rain"/"snow" are {"1h": mm} when there is any.
+    total = None
+    for kind in ("rain", "snow"):
+        mm = item.get(kind, {}).get("1h")
+        if mm is not None:
+            total = (total or 0) + mm
+    return total
+
+
+def open_meteo_current_records(doc):
+    cw = doc["current_weather"]
+    when = cw.get("time")
+    if not isinstance(when, int):
+        when = int(time.time())
+    return _records([(when, cw["weathercode"], cw["is_day"], 0, 0, cw.get("temperature"))])
+
+
+def open_meteo_hourly_records(doc):
+    hourly = doc["hourly"]
+    n = len(hourly["time"])
+    temps = hourly.get("temperature_2m") or [None] * n
+    precip = hourly.get("precipitation") or [None] * n
+    return _records([(hourly["time"][i], hourly["weathercode"][i], hourly["is_day"][i], 0, 0, temps[i], precip[i])
+                     for i in range(n)])
+
+
+def owm_current_records(doc):
+    c = doc["current"]
+    sunrise, sunset = c.get("sunrise") or 0, c.get("sunset") or 0
+    day = sunrise < c["dt"] < sunset if sunrise and sunset else not _owm_weather(c)[0]["icon"].endswith("n")
+    return _records([(c["dt"], c["weather"][0]["id"], day, sunrise, sunset, c.get("temp"), _owm_precip(c))])
+
+
+def owm_hourly_records(doc):
+    return _records([(h["dt"], h["weather"][0]["id"], not _owm_weather(h)[0]["icon"].endswith("n"), 0, 0,
+                      h.get("temp"), _owm_precip(h)) for h in doc["hourly"]])
+
+
+PROJECTIONS = {
+    ("open-meteo", CURRENT, JSON): lambda doc: _json(open_meteo_current(doc)),
+    ("open-meteo", HOURLY, JSON): lambda doc: _json(open_meteo_hourly(doc)),
+    ("owm", CURRENT, JSON): lambda doc: _json(owm_current(doc)),
+    ("owm", HOURLY, JSON): lambda doc: _json(owm_hourly(doc)),
+    ("open-meteo", CURRENT, RECORD): open_meteo_current_records,
+    ("open-meteo", HOURLY, RECORD): open_meteo_hourly_records,
+    ("owm", CURRENT, RECORD): owm_current_records,
+    ("owm", HOURLY, RECORD): owm_hourly_records,
+}
+
+
+def _json(payload):
+    return json.dumps(payload, separators=(",", ":")).encode()
+
+
+class Entry:
+    """One projected answer, ready to send."""
+
+    def __init__(self, body, content_type, ttl, fetched=None):
+        self.body = body
+        self.content_type = content_type
+        self.etag = '"%08x"' % zlib.crc32(self.body)
+        self.fetched = time.monotonic() if fetched is None else fetched
+        self.ttl = ttl
+
+    def age(self):
+        return time.monotonic() - self.fetched
+
+    def fresh(self):
+        return self.age() < self.ttl
+
+
+class _Upstream:
+    # One upstream answer, and the Entry built from it for each format asked for.
+    def __init__(self, doc, ttl):
+        self.doc = doc
+        self.fetched = time.monotonic()
+        self.ttl = ttl
+        self.entries = {}
+
+    def fresh(self):
+        return time.monotonic() - self.fetched < self.ttl
+
+    def entry(self, fmt, project):
+        entry = self.entries.get(fmt)
+        if entry is None:
+            entry = self.entries[fmt] = Entry(project(self.doc), fmt, self.ttl, self.fetched)
+        return entry
+
+
+class _Flight:
+    # An upstream fetch under way, which later requests for the same key wait on.
+    def __init__(self):
+        self.done = threading.Event()
+        self.upstream = None
+        self.error = None
+
+
+class WeatherProxy:
+    """
+    The cache and upstream logic, separate from the HTTP server so it can be
+    driven directly. ``fetch(url)`` returns the decoded upstream JSON.
+    """
+
+    def __init__(self, open_meteo=OPEN_METEO, owm=OWM, owm_key=None, grid=0.05,
+                 ttl_current=300, ttl_hourly=3600, fetch=fetch_json):
+        self.open_meteo = open_meteo.rstrip("/")
+        self.owm = owm.rstrip("/")
+        self.owm_key = owm_key
+        self.grid = grid
+        self.ttl = {CURRENT: ttl_current, HOURLY: ttl_hourly}
+        self.fetch = fetch
+        self.cache = {}
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "hits": 0, "coalesced": 0, "upstream": 0,
+                      "upstream_errors": 0, "stale": 0}
+
+    def _cell(self, lat, lon):
+        i, j = round(float(lat) / self.grid), round(float(lon) / self.grid)
+        return i, j, "%.4f" % (i * self.grid), "%.4f" % (j * self.grid)
+
+    def resolve(self, path, query):
+        """(cache key, upstream URL, projection, TTL, format) for a house's request, or None."""
+        fmt = RECORD if query.get("format") == "record" else JSON
+        appid = None
+        if path.startswith("/v1/forecast"):
+            provider = "open-meteo"
+            i, j, lat, lon = self._cell(query["latitude"], query["longitude"])
+            if "hourly" in query:
+                kind = HOURLY
+                params = {"hourly": "weathercode,is_day,temperature_2m,precipitation", "forecast_days": 2}
+            else:
+                kind = CURRENT
+                params = {"current_weather": "true"}
+            params["timeformat"] = "unixtime"
+            url = "%s/v1/forecast?%s" % (self.open_meteo, urlencode(dict(latitude=lat, longitude=lon, **params)))
+        elif path.startswith("/data/") and path.endswith("/onecall"):
+            provider = "owm"
+            i, j, lat, lon = self._cell(query["lat"], query["lon"])
+            if "hourly" in query.get("exclude", "").split(","):
+                kind, exclude = CURRENT, "minutely,hourly,daily,alerts"
+            else:
+                kind, exclude = HOURLY, "current,minutely,daily,alerts"
+            # A house's own key is part of the cache key: one house's answer
+            # mustn't be served to another whose key is wrong or revoked.
+            appid = None if self.owm_key else query.get("appid", "")
+            url = "%s%s?%s" % (self.owm, path, urlencode(
+                {"lat": lat, "lon": lon, "appid": self.owm_key or appid, "units": "metric", "exclude": exclude}))
+        else:
+            return None
+        return (path, kind, i, j, appid), url, PROJECTIONS[provider, kind, fmt], self.ttl[kind], fmt
+
+    def get(self, key, url, project, ttl, fmt=JSON):
+        """
+        The Entry in ``fmt`` for ``key``, fetching (once, however many ask and
+        in whichever formats) if the cached upstream answer is stale.
+        """
+        with self._lock:
+            self.stats["requests"] += 1
+            upstream = self.cache.get(key)
+            if upstream is not None and upstream.fresh():
+                self.stats["hits"] += 1
+                return upstream.entry(fmt, project)
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.stats["upstream"] += 1
+            else:
+                self.stats["coalesced"] += 1
+        if not leader:
+            flight.done.wait()
+            if flight.upstream is not None:
+                with self._lock:
+                    return flight.upstream.entry(fmt, project)
+            raise flight.error
+        try:
+            upstream = _Upstream(self.fetch(url), ttl)
+            entry = upstream.entry(fmt, project)  # A malformed answer fails here, before it is cached
+            flight.upstream = upstream
+            with self._lock:
+                self.cache[key] = upstream
+            return entry
+        except Exception as e:
+            with self._lock:
+                self.stats["upstream_errors"] += 1
+                stale = self.cache.get(key)
+                if stale is not None:
+                    self.stats["stale"] += 1
+            flight.upstream, flight.error = stale, e
+            if stale is None:
+                raise
+            with self._lock:
+                return stale.entry(fmt, project)
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+
+def make_server(proxy, host="0.0.0.0", port=8080):
+    """A ThreadingHTTPServer answering houses from ``proxy``."""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, fmt, *args):
+            pass
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            if url.path == "/stats":
+                with proxy._lock:
+                    stats = dict(proxy.stats, cached=len(proxy.cache))
+                self._send(200, _json(stats))
+                return
+            try:
+                route = proxy.resolve(url.path, dict(parse_qsl(url.query)))
+            except (KeyError, ValueError):
+                self._send(400, b'{"error": "latitude and longitude needed"}')
+                return
+            if route is None:
+                self._send(404, b'{"error": "unknown path"}')
+                return
+            try:
+                entry = proxy.get(*route)
+            except Exception as e:
+                self._send(502, _json({"error": "upstream: %s" % e}))
+                return
+            max_age = max(0, int(entry.ttl - entry.age()))
+            if self.headers.get("If-None-Match") == entry.etag:
+                self._send(304, b"", entry.etag, max_age, entry.content_type)
+            else:
+                self._send(200, entry.body, entry.etag, max_age, entry.content_type)
+
+        def _send(self, status, body, etag=None, max_age=None, content_type=JSON):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            if etag:
+                self.send_header("ETag", etag)
+            if max_age is not None:
+                self.send_header("Cache-Control", "max-age=%d" % max_age)
+            if status != 304:
+                self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            if status != 304:
+                self.wfile.write(body)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--grid", type=float, default=0.05, help="cell size in degrees")
+    parser.add_argument("--ttl-current", type=int, default=300, help="seconds")
+    parser.add_argument("--ttl-hourly", type=int, default=3600, help="seconds")
+    parser.add_argument("--owm-key", help="API key for OpenWeatherMap (default: each house's own)")
+    parser.add_argument("--open-meteo", default=OPEN_METEO, help="upstream base URL")
+    parser.add_argument("--owm", default=OWM, help="upstream base URL")
+    args = parser.parse_args(argv)
+
+    proxy = WeatherProxy(args.open_meteo, args.owm, args.owm_key, args.grid, args.ttl_current, args.ttl_hourly)
+    server = make_server(proxy, args.host, args.port)
+    print("Weather proxy on http://%s:%d" % server.server_address[:2])
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+# API call quota and the interval between weather checks.
+# Every request, retries included, takes a token from a bucket that refills
+# at a steady rate. The bucket holds at most ``burst`` tokens and refills
+# at (budget - burst) a day, so no 24 hours can see more than ``budget``
+# calls however they bunch up. The count goes to flash after every call,
+# so a reboot (or a crash loop) doesn't hand out a fresh bucket; time spent
+# switched off is only credited when both ends of it were on a set clock.
+#
+# The interval adapts to the weather: it drops to ``min_ms`` while the
+# conditions are changing or it is raining or snowing, and grows by half
+# after each check that found nothing new, up to ``max_ms``, through long
+# settled spells. It never runs ahead of what the budget allows.
+
+import os
+import struct
+from time import ticks_ms, ticks_diff
+from logger import log
+from wxrecord import unix_now
+
+DAY_MS = 86400000
+
+_MAGIC = b"QUO1"
+_FORMAT = "<4sfI"  # magic, tokens, unix time saved
+_SIZE = struct.calcsize(_FORMAT)
+# Any earlier time means the RTC hadn't been set (the Pico starts in 2021).
+_CLOCK_SET = 1672531200
+
+_WRITE_FAILED = log.message("Failed to write quota: %s")
+
+
+class Quota:
+    """
+    Token bucket for ``budget`` API calls a day, persisted at ``path``, and
+    the adaptive check interval, starting at ``interval_ms``.
+    """
+
+    def __init__(self, path, budget, interval_ms, min_ms, max_ms, burst=None):
+        self.path = path
+        self.budget = budget
+        # An hour's worth by default.
+        self.burst = burst if burst is not None else max(1, budget // 24)
+        self.rate = max(0, budget - self.burst) / DAY_MS  # Tokens per ms
+        self.min_ms = min_ms
+        self.max_ms = max_ms
+        self.interval = interval_ms
+        self.tokens = float(self.burst)
+        self.calls = 0
+        self.refused = 0
+        self._ticks = ticks_ms()
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return
+        if len(data) != _SIZE:
+            return
+        magic, tokens, saved = struct.unpack(_FORMAT, data)
+        if magic != _MAGIC:
+            return
+        now = unix_now()
+        if saved >= _CLOCK_SET and now > saved:
+            tokens += (now - saved) * 1000 * self.rate
+        self.tokens = min(self.burst, tokens)
+
+    def _save(self):
+        tmp = self.path + ".tmp"
+        try:
+            with open(tmp, "wb") as f:
+                f.write(struct.pack(_FORMAT, _MAGIC, self.tokens, unix_now()))
+            os.rename(tmp, self.path)
+        except OSError as e:
+            log.warning(_WRITE_FAILED, e)
+
+    def _refill(self):
+        now = ticks_ms()
+        self.tokens = min(self.burst, self.tokens + ticks_diff(now, self._ticks) * self.rate)
+        self._ticks = now
+
+    def take(self):
+        """Spend a token on one API call; False, and nothing spent, if the budget is used up."""
+        self._refill()
+        if self.tokens < 1:
+            self.refused += 1
+            return False
+        self.tokens -= 1
+        self.calls += 1
+        self._save()
+        return True
+
+    def wait_ms(self):
+        """Milliseconds until a token is free (0 if one is now)."""
+        self._refill()
+        if self.tokens >= 1:
+            return 0
+        if not self.rate:
+            return DAY_MS
+        return int((1 - self.tokens) / self.rate) + 1
+
+    def next_interval(self, active):
+        """
+        Milliseconds until the next check. ``active`` is True while the
+        weather is changing or precipitation is likely.
+        """
+        if active:
+            self.interval = self.min_ms
+        else:
+            self.interval = min(self.max_ms, self.interval * 3 // 2)
+        return max(self.interval, self.wait_ms())
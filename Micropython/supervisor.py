@@ -0,0 +1,419 @@
+# Wi-Fi and API supervision.
+# Link keeps Wi-Fi joined from a task of its own. When the connection
+# drops it rejoins in the background, a short poll of wlan.status() at a
+# time, so the display never waits on it, and after a failed attempt it
+# waits a jittered, exponentially growing delay (Backoff) before the next:
+# a house that lost its access point doesn't hammer it, and houses that
+# lost it together don't all come back at the same moment.
+#
+# A full join scans every channel for the access point and then waits on
+# DHCP, several seconds on the Pico W. JoinCache keeps the access point
+# (bssid, channel) and the DHCP lease of the last good join in flash, and
+# each join first goes straight to that access point with that address,
+# falling back to a full join (connect()'s own scan, then DHCP) if it
+# doesn't come up within FAST_TIMEOUT_MS. A failed direct join drops the
+# lease at once but keeps the access point until FORGET_AFTER of them in a
+# row: one is usually the router restarting or a glitch, and a full join
+# without a scan can't learn the access point back. A lease is only reused for
+# ``lease_s`` after DHCP handed it out, and only on a set clock; with a
+# static address configured, DHCP is never used.
+#
+# wlan.scan() blocks for the whole scan, so Link never calls it while the
+# display is animating: the access point is found with Link.survey() at
+# start-up, before the display tasks run, or read back from the driver
+# after a join where the port can say (wlan.config("bssid")).
+#
+# CircuitBreaker guards the weather API. After ``threshold`` failed calls
+# in a row it opens and calls are skipped, with no DNS lookup, connection
+# or TLS handshake spent on a service that is down, until ``open_ms`` has
+# passed. Then one trial call goes through: success closes the breaker,
+# failure opens it again for twice as long, up to ``max_open_ms``.
+
+import os
+import random
+import struct
+from time import ticks_ms, ticks_diff, ticks_add
+from logger import log
+from wxrecord import unix_now
+
+try:
+    import asyncio
+except ImportError:
+    import uasyncio as asyncio
+
+_STAT_GOT_IP = 3
+_POLL_MS = 100
+# How often a connected link is checked when nothing reports it lost.
+_CHECK_S = 5
+_MAX_DOUBLINGS = 16
+
+JOIN_FILE = "wifi.bin"
+FAST_TIMEOUT_MS = 3000
+FORGET_AFTER = 3
+# Well inside the day or more that home routers usually lease for.
+LEASE_S = 3600
+_JOIN_MAGIC = b"JOIN"
+_JOIN_FORMAT = "<4sI6sB4s4s4s4s"  # magic, unix time leased, bssid, channel, ip, netmask, gateway, dns; then the ssid
+_JOIN_SIZE = struct.calcsize(_JOIN_FORMAT)
+# Any earlier time means the RTC hadn't been set (the Pico starts in 2021).
+_CLOCK_SET = 1672531200
+
+CLOSED = 0
+OPEN = 1
+HALF_OPEN = 2
+
+_JOINING = log.message("Joining Wi-Fi...")
+_JOINED = log.message("Joined Wi-Fi in %d ms (%s); ip = %s")
+_DIRECT_FAILED = log.message("Remembered access point not there; joining afresh.")
+_JOIN_WRITE_FAILED = log.message("Failed to write Wi-Fi details: %s")
+_JOIN_FAILED = log.message("Failed to join Wi-Fi (status %s); retrying in %d ms.")
+_API_DOWN = log.message("Weather API failing; no calls for %d s.")
+_API_BACK = log.message("Weather API back.")
+
+
+class Backoff:
+    """
+    Retry delays from ``base_ms``, doubling up to ``max_ms``. Each delay is
+    between half and all of its step, chosen at random.
+    """
+
+    def __init__(self, base_ms=2000, max_ms=300000):
+        self.base_ms = base_ms
+        self.max_ms = max_ms
+        self.attempts = 0
+
+    def next(self):
+        """The delay before the next attempt."""
+        step = min(self.max_ms, self.base_ms << min(self.attempts, _MAX_DOUBLINGS))
+        self.attempts += 1
+        half = step // 2
+        return half + random.randint(0, half)
+
+    def reset(self):
+        self.attempts = 0
+
+
+class CircuitBreaker:
+    """Opens after ``threshold`` failures in a row; see the module comment."""
+
+    def __init__(self, threshold=3, open_ms=60000, max_open_ms=3600000):
+        self.threshold = threshold
+        self.open_ms = open_ms
+        self.max_open_ms = max_open_ms
+        self.state = CLOSED
+        self.failures = 0
+        self.trips = 0
+        self.skipped = 0
+        self._period = open_ms
+        self._opened = 0
+
+    def allow(self):
+        """True if a call may be made now; a call it refuses counts as skipped."""
+        if self.state == OPEN:
+            if ticks_diff(ticks_ms(), self._opened) < self._period:
+                self.skipped += 1
+                return False
+            self.state = HALF_OPEN
+        return True
+
+    def success(self):
+        if self.state != CLOSED:
+            log.info(_API_BACK)
+        self.state = CLOSED
+        self.failures = 0
+        self._period = self.open_ms
+
+    def failure(self):
+        self.failures += 1
+        if self.state == HALF_OPEN:
+            self._period = min(self.max_open_ms, self._period * 2)
+            self._open()
+        elif self.state == CLOSED and self.failures >= self.threshold:
+            self._open()
+
+    def _open(self):
+        self.state = OPEN
+        self.trips += 1
+        self._opened = ticks_ms()
+        log.warning(_API_DOWN, self._period // 1000)
+
+    def retry_in(self):
+        """Milliseconds until a call is allowed again (0 if one is now)."""
+        if self.state != OPEN:
+            return 0
+        return max(0, self._period - ticks_diff(ticks_ms(), self._opened))
+
+
+def _connected_bssid(wlan):
+    # Not every port can say which access point it joined.
+    try:
+        bssid = wlan.config("bssid")
+    except (ValueError, OSError, TypeError):
+        return None
+    return bytes(bssid) if bssid else None
+
+
+def _packed(addr):
+    return bytes(int(part) for part in addr.split("."))
+
+
+def _dotted(data):
+    return "%d.%d.%d.%d" % (data[0], data[1], data[2], data[3])
+
+
+class JoinCache:
+    """
+    The access point and DHCP lease of the last good join, kept at
+    ``path``. ``static`` is an ``(ip, netmask, gateway, dns)`` tuple to
+    use instead of DHCP.
+    """
+
+    def __init__(self, path=JOIN_FILE, static=None, lease_s=LEASE_S):
+        self.path = path
+        self.static = static
+        self.lease_s = lease_s
+        self.ssid = None
+        self.bssid = None
+        self.channel = 0
+        self.lease = None
+        self.leased = 0
+        self.direct = 0  # Joins that skipped the scan
+        self.misses = 0  # Direct joins failed in a row
+        self._dhcp = True
+        self._joining = None
+        self._found = None  # From survey(), for the next full join
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return
+        if len(data) < _JOIN_SIZE:
+            return
+        magic, leased, bssid, channel, ip, mask, gateway, dns = struct.unpack(_JOIN_FORMAT, data[:_JOIN_SIZE])
+        if magic != _JOIN_MAGIC:
+            return
+        self.ssid = data[_JOIN_SIZE:].decode()
+        self.bssid = bssid
+        self.channel = channel
+        self.leased = leased
+        self.lease = (_dotted(ip), _dotted(mask), _dotted(gateway), _dotted(dns)) if leased else None
+
+    def _save(self):
+        lease = self.lease or ("0.0.0.0",) * 4
+        tmp = self.path + ".tmp"
+        try:
+            with open(tmp, "wb") as f:
+                f.write(struct.pack(_JOIN_FORMAT, _JOIN_MAGIC, self.leased if self.lease else 0,
+                                    self.bssid, self.channel, *(_packed(a) for a in lease)))
+                f.write(self.ssid.encode())
+            os.rename(tmp, self.path)
+        except OSError as e:
+            log.warning(_JOIN_WRITE_FAILED, e)
+
+    def missed(self):
+        """A direct join failed: drop the lease, and the access point too if it keeps failing."""
+        self.misses += 1
+        if self.misses >= FORGET_AFTER:
+            self.forget()
+        elif self.lease is not None:
+            self.lease = None
+            self._save()
+
+    def forget(self):
+        """Drop what is remembered."""
+        self.bssid = None
+        self.lease = None
+        self.misses = 0
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+    def _lease_valid(self):
+        if self.lease is None or self.leased < _CLOCK_SET:
+            return False
+        return 0 <= unix_now() - self.leased < self.lease_s
+
+    def survey(self, wlan, ssid):
+        """Find the access point with a (blocking) scan if none is remembered."""
+        if self.bssid is None or self.ssid != ssid:
+            self._found = self._scan(wlan, ssid)
+
+    def begin(self, wlan, ssid, password, direct, scan=True):
+        """
+        Start joining ``ssid``: with ``direct``, straight to the remembered
+        access point (False, with nothing started, if there isn't one),
+        otherwise after a full scan. Without ``scan`` a full join is left to
+        connect(), which doesn't block, going to the access point survey()
+        found if there is one.
+        """
+        if direct:
+            if self.bssid is None or self.ssid != ssid:
+                return False
+            bssid = self.bssid
+            try:
+                wlan.config(channel=self.channel)  # Ports that can't take it scan as usual
+            except (ValueError, OSError, TypeError):
+                pass
+        elif scan:
+            # Scanning here rather than inside connect() finds out which
+            # access point it is (the Pico can't say once joined).
+            bssid = self._scan(wlan, ssid)
+        else:
+            bssid = self._found
+            self._found = None
+        address = self.static
+        if address is None and direct and self._lease_valid():
+            address = self.lease
+        if address is None and not self._dhcp:
+            wlan.ifconfig("dhcp")
+            self._dhcp = True
+        if bssid is not None:
+            wlan.connect(ssid, password, bssid=bssid)
+        else:
+            wlan.connect(ssid, password)  # Hidden network
+        self._joining = bssid
+        if address is not None:
+            # After connect(), which would otherwise start DHCP when the link comes up.
+            wlan.ifconfig(address)
+            self._dhcp = False
+        return True
+
+    def joined(self, wlan, ssid, direct):
+        """Remember a join that worked; flash is only written if something changed."""
+        changed = False
+        if direct:
+            self.direct += 1
+            self.misses = 0
+        else:
+            bssid = self._joining if self._joining is not None else _connected_bssid(wlan)
+            if bssid is None and ssid == self.ssid:
+                bssid = self.bssid  # Joined without finding out where: keep the one remembered
+            changed = bssid != self.bssid or ssid != self.ssid
+            if changed:
+                self.misses = 0
+            self.ssid = ssid
+            self.bssid = bssid
+            try:
+                self.channel = wlan.config("channel") or 0
+            except (ValueError, OSError, TypeError):
+                pass
+        if self.static is None and self._dhcp:
+            # A fresh lease from DHCP.
+            self.lease = wlan.ifconfig()
+            self.leased = unix_now()
+            changed = True
+        if changed and self.bssid is not None:
+            self._save()
+
+    def _scan(self, wlan, ssid):
+        """The bssid of the strongest access point for ``ssid``, or None."""
+        name = ssid.encode()
+        best = None
+        for net in wlan.scan():
+            if net[0] == name and (best is None or net[3] > best[3]):
+                best = net
+        return bytes(best[1]) if best is not None else None
+
+
+class Link:
+    """
+    Keeps ``wlan`` joined to ``ssid``, through ``join_cache`` (a
+    JoinCache) if given. Run ``run()`` as a task; ``up`` is set while
+    connected, and ``wait()`` returns once the link is up.
+    """
+
+    def __init__(self, wlan, ssid, password, timeout_ms=15000, backoff=None, join_cache=None):
+        self.wlan = wlan
+        self.ssid = ssid
+        self.password = password
+        self.timeout_ms = timeout_ms
+        self.backoff = backoff if backoff is not None else Backoff()
+        self.join_cache = join_cache
+        self.up = asyncio.Event()
+        self.joins = 0
+        self.failures = 0
+        self.status = 0  # wlan.status() when the last attempt ended
+        self._lost = asyncio.Event()
+
+    async def wait(self):
+        """Wait until connected; the rejoin, if one is needed, runs in the background."""
+        if not self.wlan.isconnected():
+            self.lost()
+        await self.up.wait()
+
+    def survey(self):
+        """
+        Blocking: scan for the access point if none is remembered, so the
+        first full join needn't. Call before the display tasks start.
+        """
+        if self.join_cache is not None and not self.wlan.isconnected():
+            self.wlan.active(True)
+            self.join_cache.survey(self.wlan, self.ssid)
+
+    def lost(self):
+        """Report the connection gone (e.g. after a sleep with the radio off)."""
+        self.up.clear()
+        self._lost.set()
+
+    async def run(self):
+        while True:
+            if self.wlan.isconnected():
+                self.up.set()
+                self._lost.clear()
+                try:
+                    await asyncio.wait_for(self._lost.wait(), _CHECK_S)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            self.up.clear()
+            if await self._join():
+                self.backoff.reset()
+                continue
+            self.failures += 1
+            delay = self.backoff.next()
+            log.warning(_JOIN_FAILED, self.status, delay)
+            await asyncio.sleep_ms(delay)
+
+    async def _join(self):
+        """One attempt to join, direct first if possible; True once connected."""
+        log.info(_JOINING)
+        started = ticks_ms()
+        wlan = self.wlan
+        cache = self.join_cache
+        wlan.active(True)
+        for direct in (True, False):
+            if cache is not None:
+                if not cache.begin(wlan, self.ssid, self.password, direct, scan=False):
+                    continue
+            elif direct:
+                continue
+            else:
+                wlan.connect(self.ssid, self.password)
+            if await self._joined(FAST_TIMEOUT_MS if direct else self.timeout_ms):
+                self.joins += 1
+                if cache is not None:
+                    cache.joined(wlan, self.ssid, direct)
+                log.info(_JOINED, ticks_diff(ticks_ms(), started), "direct" if direct else "full", wlan.ifconfig()[0])
+                return True
+            wlan.disconnect()
+            if direct:
+                log.info(_DIRECT_FAILED)
+                cache.missed()
+        return False
+
+    async def _joined(self, timeout_ms):
+        """Poll, without blocking, until connected or ``timeout_ms`` is up."""
+        self.status = 0
+        deadline = ticks_add(ticks_ms(), timeout_ms)
+        while ticks_diff(deadline, ticks_ms()) > 0:
+            await asyncio.sleep_ms(_POLL_MS)
+            status = self.status = self.wlan.status()
+            if status == _STAT_GOT_IP and self.wlan.isconnected():
+                return True
+            if status < 0:
+                break  # Wrong password, no access point, or refused
+        return False
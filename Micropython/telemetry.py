@@ -0,0 +1,108 @@
+# Per-stage timing telemetry.
+# Durations are measured with ticks_us() and kept in one preallocated ring
+# buffer per stage, alongside lifetime min/max, overrun counts and the
+# lowest gc.mem_free() seen. Recording only writes into arrays, so it is
+# safe in the frame loop; summary() and dump() allocate and are meant to be
+# called on demand (e.g. from the REPL after Ctrl-C: telemetry.dump()).
+
+import gc
+from array import array
+from time import ticks_us, ticks_diff
+
+# Stages, as indexes into the buffers.
+CONNECT = 0
+FETCH = 1
+SERVO = 2
+FADE = 3
+FRAME = 4
+STAGE_NAMES = ("connect", "fetch", "servo", "fade", "frame")
+
+_COUNT_LIMIT = 0x3FFFFFFF  # Stay within MicroPython's small ints
+_mem_free = getattr(gc, "mem_free", None)
+
+
+class Telemetry:
+    """Fixed-size timing history for each stage in ``STAGE_NAMES``."""
+
+    def __init__(self, capacity=64, enabled=True):
+        stages = len(STAGE_NAMES)
+        self.capacity = capacity
+        self.enabled = enabled
+        self.samples = array("i", bytes(4 * capacity * stages))
+        self.counts = array("i", bytes(4 * stages))
+        self.mins = array("i", [_COUNT_LIMIT] * stages)
+        self.maxs = array("i", bytes(4 * stages))
+        self.overruns = array("i", bytes(4 * stages))
+        self.heap_low = -1
+
+    def start(self):
+        """A start mark to pass to stop()."""
+        return ticks_us()
+
+    def stop(self, stage, mark):
+        """Record the time since ``mark`` against ``stage``."""
+        if self.enabled:
+            self.record(stage, ticks_diff(ticks_us(), mark))
+
+    def record(self, stage, us):
+        if not self.enabled:
+            return
+        n = self.counts[stage]
+        self.samples[stage * self.capacity + n % self.capacity] = us
+        if n < _COUNT_LIMIT:
+            self.counts[stage] = n + 1
+        if us < self.mins[stage]:
+            self.mins[stage] = us
+        if us > self.maxs[stage]:
+            self.maxs[stage] = us
+
+    def overrun(self, stage, missed=1):
+        """Count ``missed`` deadlines against ``stage``."""
+        if self.enabled:
+            self.overruns[stage] += missed
+
+    def sample_heap(self):
+        """Note the free heap; keeps the lowest value seen."""
+        if self.enabled and _mem_free is not None:
+            free = _mem_free()
+            if self.heap_low < 0 or free < self.heap_low:
+                self.heap_low = free
+
+    def summary(self):
+        """{stage name: {count, min, max, mean, p50, p90, p99, overruns}} for stages with data."""
+        out = {}
+        for stage, name in enumerate(STAGE_NAMES):
+            n = self.counts[stage]
+            if not n:
+                continue
+            base = stage * self.capacity
+            window = sorted(self.samples[base:base + min(n, self.capacity)])
+            k = len(window)
+            out[name] = {
+                "count": n,
+                "min": self.mins[stage],
+                "max": self.maxs[stage],
+                "mean": sum(window) // k,
+                "p50": window[k * 50 // 100],
+                "p90": window[min(k - 1, k * 90 // 100)],
+                "p99": window[min(k - 1, k * 99 // 100)],
+                "overruns": self.overruns[stage],
+            }
+        return out
+
+    def dump(self):
+        """Print the summary; times are in microseconds (mean and percentiles over the last ``capacity`` samples)."""
+        print("stage       count      min     mean      p50      p90      p99      max  overruns")
+        for name, s in self.summary().items():
+            print("%-8s %8d %8d %8d %8d %8d %8d %8d %9d" % (
+                name, s["count"], s["min"], s["mean"], s["p50"], s["p90"], s["p99"], s["max"], s["overruns"]))
+        if self.heap_low >= 0:
+            print(f"lowest free heap: {self.heap_low} bytes")
+
+    def reset(self):
+        for stage in range(len(STAGE_NAMES)):
+            self.counts[stage] = 0
+            self.mins[stage] = _COUNT_LIMIT
+            self.maxs[stage] = 0
+            self.overruns[stage] = 0
+        self.heap_low = -1
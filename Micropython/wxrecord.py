@@ -0,0 +1,87 @@
+# Packed binary weather record.
+# One fixed-layout record per observation or forecast hour, used as the
+# on-flash observation cache, the forecast file and the LAN proxy's
+# ``format=record`` responses. Reading a field is a few byte loads at a
+# known offset into the buffer: nothing is parsed and nothing is copied.
+#
+# Layout, 20 bytes, little-endian:
+#    0  I  time     unix seconds the record applies to
+#    4  H  code     condition code as the provider gives it. WMO codes
+#                   (Open-Meteo, 0-99) and OWM ids (200-804) don't overlap,
+#                   so the one field holds either and the ConditionTables
+#                   in conditions.py take it unchanged.
+#    6  B  flags    DAY | HAS_TEMP | HAS_PRECIP
+#    7  B  reserved, 0
+#    8  I  sunrise  unix seconds, 0 if not known
+#   12  I  sunset   unix seconds, 0 if not known
+#   16  h  temp     tenths of a degree C, if HAS_TEMP
+#   18  H  precip   tenths of a mm in the hour, if HAS_PRECIP
+
+import struct
+import time
+
+FORMAT = "<IHBBIIhH"
+SIZE = struct.calcsize(FORMAT)
+
+DAY = 1
+HAS_TEMP = 2
+HAS_PRECIP = 4
+
+# Seconds between the Unix epoch and this port's time.time() epoch.
+EPOCH_OFFSET = 0 if time.gmtime(0)[0] == 1970 else 946684800
+
+
+def unix_now():
+    return int(time.time()) + EPOCH_OFFSET
+
+
+def pack_into(buf, i, when, code, day, sunrise=0, sunset=0, temp=None, precip=None):
+    """Write record ``i`` of ``buf``. ``temp`` (C) and ``precip`` (mm) may be None."""
+    flags = DAY if day else 0
+    if temp is None:
+        temp = 0
+    else:
+        flags |= HAS_TEMP
+        temp = int(round(temp * 10))
+    if precip is None:
+        precip = 0
+    else:
+        flags |= HAS_PRECIP
+        precip = int(round(precip * 10))
+    struct.pack_into(FORMAT, buf, i * SIZE, int(when), int(code), flags, 0,
+                     int(sunrise or 0), int(sunset or 0), temp, precip)
+
+
+def pack(when, code, day, sunrise=0, sunset=0, temp=None, precip=None):
+    """One record as a new bytearray."""
+    buf = bytearray(SIZE)
+    pack_into(buf, 0, when, code, day, sunrise, sunset, temp, precip)
+    return buf
+
+
+def unpack(buf, i=0):
+    """Record ``i`` as ``(time, code, day, sunrise, sunset, temp, precip)``; absent values are None."""
+    when, code, flags, _, sunrise, sunset, temp, precip = struct.unpack_from(FORMAT, buf, i * SIZE)
+    return (when, code, bool(flags & DAY), sunrise or None, sunset or None,
+            temp / 10 if flags & HAS_TEMP else None,
+            precip / 10 if flags & HAS_PRECIP else None)
+
+
+# --- Single fields, read in place ---
+
+def time_of(buf, i=0):
+    return struct.unpack_from("<I", buf, i * SIZE)[0]
+
+
+def code_of(buf, i=0):
+    o = i * SIZE
+    return buf[o + 4] | buf[o + 5] << 8
+
+
+def is_day(buf, i=0):
+    return buf[i * SIZE + 6] & DAY != 0
+
+
+def count(nbytes):
+    """Whole records in ``nbytes`` bytes."""
+    return nbytes // SIZE